@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'azasimul.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Server-sent events of the simulation jobs, see simulator/events.py
+from simulator.events import router  # noqa: E402
+
+application = router(django_application)
@@ -22,12 +22,13 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # See https://docs.djangoproject.com/en/4.0/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-7_n1$@y!6*t9kxq6yt4buuubik0zhcjp49wlf93t2a*mc5gdfm'
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', 'django-insecure-7_n1$@y!6*t9kxq6yt4buuubik0zhcjp49wlf93t2a*mc5gdfm')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# DJANGO_DEBUG=0 is the production profile, see docker-compose.prod.yml
+DEBUG = os.environ.get('DJANGO_DEBUG', '1') == '1'
 
-ALLOWED_HOSTS = ["*"] # Not safe for production !!!
+ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', '*').split(',') # '*' is not safe for production !!!
 
 
 # Application definition
@@ -49,18 +50,22 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'simulator.metrics.MetricsMiddleware',
 ]
 
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny'
-    ]
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'simulator.pagination.KeysetPagination',
+    'PAGE_SIZE': 100
 }
 
 ROOT_URLCONF = 'azasimul.urls'
@@ -104,6 +109,8 @@ DATABASES = {
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
         'HOST': 'db',
         'PORT': 5432,
+        # Seconds a connection is kept open between requests, every request opening one when 0
+        'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', 60)),
     }
 }
 
@@ -141,8 +148,76 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/4.0/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+# JSX compiled ahead of time and production builds of React written by `npm run build` (see package.json),
+# taking the place of the files of the same name in simulator/static
+STATICFILES_DIRS = [BASE_DIR / 'assets'] if (BASE_DIR / 'assets').exists() else []
+if not DEBUG:
+    # Hashed names, gzip and brotli copies written by collectstatic, served by WhiteNoise with far future expiry
+    STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Simulator
+
+# Maximum number of compiled PossibleSpecification kept in memory by each process
+SIMULATOR_SPECIFICATION_CACHE_SIZE = 1024
+
+# Number of processes of the simulation_worker command, defaults to the number of CPUs
+SIMULATOR_WORKER_PROCESSES = int(os.environ.get('SIMULATOR_WORKER_PROCESSES', 0)) or None
+# Number of processes sharing the computation of a single simulation
+SIMULATOR_SHARD_PROCESSES = int(os.environ.get('SIMULATOR_SHARD_PROCESSES', 1))
+# Seconds between two polls of an empty job queue
+SIMULATOR_WORKER_POLL = 2.0
+# Seconds without heartbeat after which a running job is considered lost with its worker and queued again
+SIMULATOR_JOB_TIMEOUT = int(os.environ.get('SIMULATOR_JOB_TIMEOUT', 300))
+
+# Seconds between two reads of the watched jobs by the event streams when the database has no LISTEN/NOTIFY
+SIMULATOR_EVENTS_POLL = 1.0
+
+# Directory of the columnar simulation outputs
+SIMULATOR_RESULTS_ROOT = os.environ.get('SIMULATOR_RESULTS_ROOT', BASE_DIR / 'results')
+# Seconds a replaced version of the outputs is kept for the readers which opened it
+SIMULATOR_RESULTS_RETENTION = 600
+
+# Number of values (series * periods) kept in memory by each process for simulation queries
+SIMULATOR_QUERY_CACHE_SIZE = 2 ** 24
+# Compositions one simulation query may compute synchronously, larger sets go through a run job
+SIMULATOR_QUERY_MAX_COMPOSITIONS = 100
+
+# Directory and size in bytes of the memoized simulation runs
+SIMULATOR_RUN_CACHE_ROOT = os.environ.get('SIMULATOR_RUN_CACHE_ROOT', BASE_DIR / 'run_cache')
+SIMULATOR_RUN_CACHE_SIZE = int(os.environ.get('SIMULATOR_RUN_CACHE_SIZE', 2 * 1024 ** 3))
+
+# Cache of the REST API responses (see simulator/apicache.py): 'locmem', private to each process, or 'file',
+# shared by the processes of a host. Entries expire after SIMULATOR_API_CACHE_TIMEOUT seconds and the oldest
+# are evicted past SIMULATOR_API_CACHE_ENTRIES
+SIMULATOR_API_CACHE = os.environ.get('SIMULATOR_API_CACHE', 'locmem')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'api': {
+        'BACKEND': {
+            'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+            'file': 'django.core.cache.backends.filebased.FileBasedCache',
+        }[SIMULATOR_API_CACHE],
+        'LOCATION': os.environ.get('SIMULATOR_API_CACHE_LOCATION', str(BASE_DIR / 'api_cache') if SIMULATOR_API_CACHE == 'file' else 'simulator-api'),
+        'TIMEOUT': int(os.environ.get('SIMULATOR_API_CACHE_TIMEOUT', 300)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('SIMULATOR_API_CACHE_ENTRIES', 5000)),
+            'CULL_FREQUENCY': 4,
+        },
+    },
+}
+
+# Directory where every process writes its metrics so /metrics serves them all, only the serving process when unset
+SIMULATOR_METRICS_DIR = os.environ.get('SIMULATOR_METRICS_DIR') or None
+# Requests slower than this many seconds are logged with their SQL on the 'simulator.slow_requests' logger, off when unset
+SIMULATOR_SLOW_REQUEST_SECONDS = float(os.environ['SIMULATOR_SLOW_REQUEST_SECONDS']) if os.environ.get('SIMULATOR_SLOW_REQUEST_SECONDS') else None
+
+# form/elements loads the compiled JSX when `npm run build` was run, otherwise it is transpiled in the browser
+SIMULATOR_COMPILED_ASSETS = (BASE_DIR / 'assets' / 'simulator' / 'scripts' / 'form-elements.js').exists()
@@ -0,0 +1,24 @@
+"""
+    Gunicorn settings of the production profile (docker-compose.prod.yml).
+
+    The WSGI application is served by several processes, each with a few
+    threads, every thread keeping its database connection open between
+    requests (CONN_MAX_AGE). Processes are recycled after max_requests so
+    that memory held by large responses or numpy arrays is given back.
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 0)) or multiprocessing.cpu_count() * 2 + 1
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+# Simulation exports and queries may stream for a while
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+max_requests = 2000
+max_requests_jitter = 200
+accesslog = '-'
+errorlog = '-'
@@ -0,0 +1,97 @@
+"""
+    Read-through cache of the list and detail responses of the REST viewsets.
+
+    Every cached model has a version, a random token kept in the 'api' cache
+    (settings.CACHES). The key of a response is made of the versions of the
+    models it is built from, the absolute URL of the request and the rendered
+    format, so a change never has to find the responses it invalidates:
+    bump() gives the model a new version, the old entries are never read
+    again and the backend evicts them once MAX_ENTRIES is reached. A version
+    evicted the same way is replaced by a new token, which only costs misses.
+
+    Versions are bumped by the post_save, post_delete and m2m_changed signals
+    (see signals.py), by graph.mark_dirty for Composition.revision and by the
+    bulk writes, which send no signal. The bump waits for the transaction to
+    commit, so no request can cache the old rows under the new version.
+
+    Responses carry the ETag of their key: a request whose If-None-Match
+    matches it gets a 304 from the versions alone, without reading the entry
+    nor the database.
+
+    The local memory backend is private to each process, a change made by
+    another process is only seen once the entries expire (TIMEOUT): use the
+    file backend when several processes serve or write the data.
+"""
+
+import hashlib
+import uuid
+
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+
+ALIAS = 'api'
+PREFIX = 'simulator.api'
+# The browsable API renders forms and a CSRF token for each user
+FORMATS = ('json',)
+
+
+def _cache():
+    return caches[ALIAS]
+
+
+def _version_key(model):
+    return '%s.version.%s' % (PREFIX, model._meta.label_lower)
+
+
+def versions(models):
+    """ Current version of every model, a new one being created when missing """
+    cache = _cache()
+    keys = [_version_key(model) for model in models]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            token = uuid.uuid4().hex
+            cache.add(key, token, timeout=None)
+            found[key] = cache.get(key) or token
+    return [found[key] for key in keys]
+
+
+def bump(*models):
+    """ Invalidate the cached responses built from models, once the current transaction commits """
+    def renew():
+        _cache().set_many({_version_key(model): uuid.uuid4().hex for model in models}, timeout=None)
+    transaction.on_commit(renew)
+
+
+class CachedResponseMixin:
+    """ Cache the list and retrieve responses of a viewset, keyed by the versions of cache_models """
+
+    # Models the responses are built from, the model of the queryset by default
+    cache_models = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
+
+    def cached_response(self, request, view, *args, **kwargs):
+        if request.accepted_renderer.format not in FORMATS:
+            return view(request, *args, **kwargs)
+        tokens = versions(self.cache_models or [self.get_queryset().model])
+        digest = hashlib.sha256(repr((tokens, request.build_absolute_uri(), request.accepted_renderer.format)).encode()).hexdigest()
+        headers = {'ETag': '"%s"' % digest, 'Cache-Control': 'no-cache', 'Vary': 'Accept'}
+        if headers['ETag'] in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=304, headers=headers)
+
+        key = '%s.response.%s.%s' % (PREFIX, self.basename, digest)
+        data = _cache().get(key)
+        if data is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            data = response.data
+            _cache().set(key, data)
+        return Response(data, headers=headers)
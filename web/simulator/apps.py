@@ -1 +1,9 @@
-from django.apps import AppConfig
\ No newline at end of file
+from django.apps import AppConfig
+
+
+class SimulatorConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'simulator'
+
+    def ready(self):
+        from . import metrics, signals
@@ -0,0 +1,174 @@
+"""
+    Benchmark suite of the API and of the engine, run by the benchmark command.
+
+    Every benchmark is timed repeat times (the best and the median time are
+    kept), then run once more under CaptureQueriesContext and tracemalloc to
+    count its database queries and its peak memory. The API benchmarks
+    measure cold responses: the response cache (apicache.py) is emptied
+    before every call, outside of the measures. run() returns a JSON
+    serializable document; compare() lists the metrics of such a document
+    which regressed past a baseline document:
+
+        seconds, peak_bytes     more than (1 + tolerance) times the baseline,
+                                plus NOISE_SECONDS for timings
+        queries                 any query more than the baseline, query counts
+                                being deterministic
+
+    Metrics are only comparable on the same portfolio, which is recorded in
+    the document with the environment.
+"""
+
+import datetime
+import platform
+import statistics
+import time
+import tracemalloc
+
+import django
+import numpy as np
+from django.core.cache import caches
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from . import apicache, lazy
+from .engine import TimeGrid, run_simulation
+from .models import BaseElement, Specification
+
+TOLERANCE = 0.25
+NOISE_SECONDS = 0.002
+LAZY_COMPOSITIONS = 10
+# (metric, regressed(current, baseline, tolerance))
+CHECKS = [
+    ('seconds', lambda current, baseline, tolerance: current > baseline * (1 + tolerance) + NOISE_SECONDS),
+    ('peak_bytes', lambda current, baseline, tolerance: current > baseline * (1 + tolerance)),
+    ('queries', lambda current, baseline, tolerance: current > baseline),
+]
+
+
+def measure(function, repeat=3, setup=None):
+    """ Timings, query count and peak memory of function, and its last result, setup being called untimed before each call """
+    timings = []
+    for index in range(max(repeat, 1)):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    if setup is not None:
+        setup()
+    with CaptureQueriesContext(connection) as queries:
+        tracemalloc.start()
+        try:
+            result = function()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {'seconds': min(timings), 'median_seconds': statistics.median(timings), 'queries': len(queries), 'peak_bytes': peak}, result
+
+
+def _get(client, url):
+    def request():
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError("GET %s answered %s." % (url, response.status_code))
+        return b''.join(response.streaming_content) if response.streaming else response.content
+    return request
+
+
+def api_benchmarks(simulation):
+    """ {name: url} of the list and detail endpoints, on objects of the portfolio """
+    composition = simulation.compositions.order_by('pk').first()
+    element = BaseElement.objects.filter(composition=composition).order_by('pk').first()
+    specification = Specification.objects.filter(composition=composition).order_by('pk').first()
+    benchmarks = {
+        'api.base_element.list': '/api/base_element/',
+        'api.base_element_value.list': '/api/base_element_value/',
+        'api.possible_specification.list': '/api/possible_specification/',
+        'api.specification.list': '/api/specification/',
+        'api.composition.list': '/api/composition/',
+        'api.simulation.list': '/api/simulation/',
+        'api.simulation.detail': '/api/simulation/%s/' % simulation.pk,
+    }
+    if composition is not None:
+        benchmarks['api.composition.detail'] = '/api/composition/%s/' % composition.pk
+        benchmarks['api.composition.units'] = '/api/composition/%s/units/' % composition.pk
+    if element is not None:
+        benchmarks['api.base_element.detail'] = '/api/base_element/%s/' % element.pk
+    if specification is not None:
+        benchmarks['api.specification.detail'] = '/api/specification/%s/' % specification.pk
+    return benchmarks
+
+
+def run(simulation, repeat=3, progress=None):
+    """ Run every benchmark on the portfolio of simulation """
+    metrics = {}
+
+    def record(name, function, setup=None):
+        if progress is not None:
+            progress(name)
+        metrics[name], result = measure(function, repeat, setup)
+        return result
+
+    client = Client()
+    for name, url in api_benchmarks(simulation).items():
+        response = record(name, _get(client, url), caches[apicache.ALIAS].clear)
+        metrics[name]['response_bytes'] = len(response)
+
+    compositions = simulation.compositions.count()
+    grid = TimeGrid.between(simulation.start, simulation.end, 'D')
+    periods = len(grid)
+    cells = compositions * periods
+    for name, report_freq in (('engine.run.daily', None), ('engine.run.monthly_report', 'MS')):
+        record(name, lambda: run_simulation(simulation, report_freq=report_freq))
+        metrics[name]['cells'] = cells
+        metrics[name]['cells_per_second'] = cells / metrics[name]['seconds'] if metrics[name]['seconds'] else None
+
+    # Cold queries: the cache is emptied before every call
+    queried = list(simulation.compositions.order_by('pk').values_list('pk', flat=True)[:LAZY_COMPOSITIONS])
+    middle = grid.dates.values[periods // 2]
+
+    def spot_query():
+        lazy.cache.clear()
+        return lazy.query(simulation, queried, start=middle, end=middle)
+    record('engine.query.spot', spot_query)
+
+    return {
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'numpy': np.__version__,
+            'database': connection.vendor,
+            'machine': platform.machine(),
+        },
+        'portfolio': {
+            'simulation': simulation.pk,
+            'compositions': compositions,
+            'base_elements': BaseElement.objects.filter(composition__simulation=simulation).count(),
+            'periods': periods,
+        },
+        'repeat': repeat,
+        'metrics': metrics,
+    }
+
+
+def compare(document, baseline, tolerance=TOLERANCE):
+    """ Descriptions of the metrics of document which regressed past baseline """
+    regressions = []
+    for name, metrics in sorted(document['metrics'].items()):
+        reference = baseline.get('metrics', {}).get(name)
+        if reference is None:
+            continue
+        for key, regressed in CHECKS:
+            if metrics.get(key) is not None and reference.get(key) is not None and regressed(metrics[key], reference[key], tolerance):
+                regressions.append("%s %s: %s, baseline %s" % (name, key, _format(key, metrics[key]), _format(key, reference[key])))
+    return regressions
+
+
+def _format(key, value):
+    if key == 'seconds':
+        return "%.1f ms" % (value * 1000)
+    if key == 'peak_bytes':
+        return "%.1f KiB" % (value / 1024)
+    return str(value)
@@ -0,0 +1,230 @@
+"""
+    Bulk import of BaseElement rows and BaseElementValue series.
+
+    Records come from CSV or JSON (read with pandas) or from a list of dicts
+    posted to the API. They are validated column by column for a whole chunk,
+    then written with bulk_create / bulk_update, or COPY on PostgreSQL, each
+    chunk in its own transaction. Invalid rows are skipped and reported with
+    their position in the input.
+"""
+
+import csv
+import io
+import json
+
+import numpy as np
+import pandas as pd
+from django.db import connection, transaction
+
+from . import apicache, graph, timeseries
+from .models import BaseElement, BaseElementValue, Enums
+
+CHUNK_SIZE = 5000
+FORMATS = ('csv', 'json')
+UNIT_SEPARATORS = [choice for choice, label in Enums.UNIT_SEPARATOR if choice]
+
+
+class BulkImportError(Exception):
+    pass
+
+
+def read_records(source, format=None, name=''):
+    """ DataFrame of the rows of a CSV or JSON file, format is guessed from name when missing """
+    format = format or name.rsplit('.', 1)[-1].lower()
+    if format not in FORMATS:
+        raise BulkImportError("Unsupported format '%s', use one of %s." % (format, ', '.join(FORMATS)))
+    try:
+        if format == 'csv':
+            return pd.read_csv(source, dtype={'label': str, 'unit': str, 'unit_separator': str}, keep_default_na=False, na_values=[''])
+        return pd.read_json(source, orient='records', dtype=False)
+    except ValueError as error:
+        raise BulkImportError("Unreadable %s file: %s" % (format, error))
+
+
+def _frame(records):
+    frame = records if isinstance(records, pd.DataFrame) else pd.DataFrame.from_records(list(records))
+    return frame.reset_index(drop=True)
+
+
+def _ids(frame):
+    if 'id' not in frame:
+        return pd.Series(np.nan, index=frame.index)
+    return pd.to_numeric(frame['id'], errors='coerce')
+
+
+def _unit(value):
+    if isinstance(value, dict):
+        return value
+    if isinstance(value, str) and value.strip():
+        unit = json.loads(value)
+        if isinstance(unit, dict):
+            return unit
+    raise ValueError()
+
+
+class Report:
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.errors = {} # {position in the input: {field: message}}
+
+    def error(self, row, field, message):
+        self.errors.setdefault(row, {})[field] = message
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'errors': [{'row': row, 'errors': self.errors[row]} for row in sorted(self.errors)],
+        }
+
+
+def _invalid(report, frame, mask, field, message):
+    for row in frame.index[mask]:
+        report.error(int(row), field, message)
+
+
+def _validate_base_elements(frame, report):
+    """ Cleaned columns of a chunk of BaseElements and the mask of its valid rows """
+    valid = pd.Series(True, index=frame.index)
+
+    labels = frame['label'] if 'label' in frame else pd.Series(None, index=frame.index, dtype=object)
+    labels = labels.where(labels.notna(), '').astype(str).str.strip()
+    bad = (labels == '') | (labels.str.len() > 255)
+    _invalid(report, frame, bad, 'label', "A label of 1 to 255 characters is required.")
+    valid &= ~bad
+
+    values = pd.to_numeric(frame['value'], errors='coerce') if 'value' in frame else pd.Series(np.nan, index=frame.index)
+    bad = ~np.isfinite(values)
+    _invalid(report, frame, bad, 'value', "A finite number is required.")
+    valid &= ~bad
+
+    units = pd.Series([None] * len(frame), index=frame.index, dtype=object)
+    raw = frame['unit'] if 'unit' in frame else units
+    for row, unit in raw.items():
+        try:
+            units[row] = _unit(unit)
+        except ValueError:
+            report.error(int(row), 'unit', "A JSON object of units is required.")
+            valid[row] = False
+
+    separators = frame['unit_separator'] if 'unit_separator' in frame else pd.Series(None, index=frame.index, dtype=object)
+    separators = separators.where(separators.notna(), '').astype(str)
+    bad = (separators != '') & ~separators.isin(UNIT_SEPARATORS)
+    _invalid(report, frame, bad, 'unit_separator', "Must be empty or one of %s." % ', '.join(UNIT_SEPARATORS))
+    valid &= ~bad
+
+    return pd.DataFrame({'id': _ids(frame), 'label': labels, 'value': values, 'unit': units, 'unit_separator': separators}), valid
+
+
+# An empty unit_separator is a bare empty field, which COPY reads as NULL unless forced
+COPY_BASE_ELEMENTS = 'COPY %s (label, value, unit, unit_separator) FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (unit_separator))'
+
+
+def _copy_csv(rows):
+    """ CSV of new BaseElements in the column order of COPY_BASE_ELEMENTS """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows.itertuples(index=False):
+        writer.writerow([row.label, repr(float(row.value)), json.dumps(row.unit), row.unit_separator])
+    buffer.seek(0)
+    return buffer
+
+
+def _copy_base_elements(rows):
+    """ Insert new BaseElements with COPY FROM STDIN """
+    with connection.cursor() as cursor:
+        cursor.copy_expert(COPY_BASE_ELEMENTS % BaseElement._meta.db_table, _copy_csv(rows))
+
+
+def import_base_elements(records, chunk_size=CHUNK_SIZE, use_copy=True):
+    """
+        Create the rows without id and update the rows with one. A missing unit_separator
+        is stored as an empty string
+    """
+    frame, report = _frame(records), Report()
+    use_copy = use_copy and connection.vendor == 'postgresql'
+
+    for begin in range(0, len(frame), chunk_size):
+        cleaned, valid = _validate_base_elements(frame.iloc[begin:begin + chunk_size], report)
+        cleaned = cleaned[valid]
+        updates = cleaned[cleaned['id'].notna()]
+        creations = cleaned[cleaned['id'].isna()]
+
+        existing = set(BaseElement.objects.filter(pk__in=updates['id'].astype(int).tolist()).values_list('pk', flat=True))
+        missing = ~updates['id'].astype(int).isin(existing)
+        _invalid(report, updates, missing, 'id', "No BaseElement with this id.")
+        updates = updates[~missing]
+
+        with transaction.atomic():
+            apicache.bump(BaseElement)
+            if len(creations):
+                if use_copy:
+                    _copy_base_elements(creations)
+                else:
+                    BaseElement.objects.bulk_create([
+                        BaseElement(label=row.label, value=row.value, unit=row.unit, unit_separator=row.unit_separator)
+                        for row in creations.itertuples(index=False)
+                    ], batch_size=chunk_size)
+            if len(updates):
+                ids = updates['id'].astype(int).tolist()
+                BaseElement.objects.bulk_update([
+                    BaseElement(pk=pk, label=row.label, value=row.value, unit=row.unit, unit_separator=row.unit_separator)
+                    for pk, row in zip(ids, updates.itertuples(index=False))
+                ], ['label', 'value', 'unit', 'unit_separator'], batch_size=chunk_size)
+                # bulk_update sends no post_save signal
+                graph.mark_base_elements(ids)
+        report.created += len(creations)
+        report.updated += len(updates)
+    return report
+
+
+def import_base_element_values(records, chunk_size=CHUNK_SIZE):
+    """
+        Create BaseElementValue series, each referencing an existing BaseElement. Rows with
+        date and value columns are points: the points of a BaseElement become one packed series.
+        Rows without them create empty series
+    """
+    frame, report = _frame(records), Report()
+    elements = pd.to_numeric(frame['base_element'], errors='coerce') if 'base_element' in frame else pd.Series(np.nan, index=frame.index)
+    known = set()
+    for begin in range(0, len(frame), chunk_size):
+        chunk = elements.iloc[begin:begin + chunk_size].dropna().astype(int).unique().tolist()
+        known.update(BaseElement.objects.filter(pk__in=chunk).values_list('pk', flat=True))
+    valid = elements.notna() & elements.fillna(-1).astype(int).isin(known)
+    _invalid(report, frame, ~valid, 'base_element', "An existing BaseElement id is required.")
+
+    if 'date' not in frame or 'value' not in frame:
+        series = [BaseElementValue(base_element_id=pk) for pk in elements[valid].astype(int)]
+    else:
+        dates = pd.to_datetime(frame['date'], errors='coerce', utc=True)
+        values = pd.to_numeric(frame['value'], errors='coerce')
+        bad = valid & dates.isna()
+        _invalid(report, frame, bad, 'date', "An ISO 8601 date is required.")
+        valid &= ~bad
+        bad = valid & ~np.isfinite(values)
+        _invalid(report, frame, bad, 'value', "A finite number is required.")
+        valid &= ~bad
+
+        series = []
+        for pk, rows in frame.index[valid].groupby(elements[valid].astype(int)).items():
+            try:
+                packed = timeseries.pack(values[rows].to_numpy(), dates[rows])
+            except timeseries.SeriesError as error:
+                report.error(int(rows[0]), 'date', str(error))
+                continue
+            series.append(BaseElementValue(base_element_id=pk, **packed))
+
+    for begin in range(0, len(series), chunk_size):
+        with transaction.atomic():
+            apicache.bump(BaseElementValue)
+            BaseElementValue.objects.bulk_create(series[begin:begin + chunk_size], batch_size=chunk_size)
+    report.created += len(series)
+    return report
+
+
+IMPORTERS = {
+    'base_element': import_base_elements,
+    'base_element_value': import_base_element_values,
+}
@@ -0,0 +1,171 @@
+"""
+    Compiler of PossibleSpecification functions.
+
+    The JSON of a PossibleSpecification is validated once and turned into a
+    CompiledSpecification: a single vectorized callable chaining its kernels,
+    with the type and default of every parameter resolved. Results are kept in
+    a process-wide LRU cache keyed by a hash of the JSON content, so every
+    Composition referencing the same functions shares the same kernel.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from .exceptions import SpecificationError
+from .kernels import KERNELS
+
+TYPES = {
+    'float': np.float64,
+    'int': np.int64,
+    'bool': np.bool_,
+}
+
+
+"""
+    Resolved parameter of a specification
+"""
+class Parameter:
+
+    def __init__(self, name, variable_type, default=None):
+        self.name = name
+        self.type = variable_type
+        self.dtype = TYPES[variable_type]
+        self.default = None if default is None else self.dtype(default).item()
+
+    def __eq__(self, other):
+        return (self.name, self.type, self.default) == (other.name, other.type, other.default)
+
+
+"""
+    Vectorized callable of a PossibleSpecification
+"""
+class CompiledSpecification:
+
+    def __init__(self, key, steps, parameters):
+        self.key = key
+        self.steps = steps # [(step name, function name, kernel)]
+        self.parameters = parameters # {parameter name: Parameter}
+        kernels = tuple(kernel for step, function, kernel in steps)
+        self.kernels = tuple(kernel for kernel in kernels if not getattr(kernel, 'summed', False))
+        self.summed_kernels = tuple(kernel for kernel in kernels if getattr(kernel, 'summed', False))
+        self.pointwise = all(getattr(kernel, 'pointwise', False) for kernel in kernels)
+        self.time_invariant = all(getattr(kernel, 'time_invariant', False) for kernel in kernels)
+        self.causal = all(getattr(kernel, 'causal', False) for kernel in kernels)
+        # Parameters in the unit of the values, see kernels._units_like
+        self.scaled = frozenset(name for kernel in kernels for name in getattr(getattr(kernel, 'units', None), 'scaled', ()))
+
+    def __call__(self, values, grid, params):
+        """ Apply the kernels of the elements to a (..., rows, periods) block """
+        for kernel in self.kernels:
+            values = kernel(values, grid, params)
+        return values
+
+    def summed(self, values, grid, params):
+        """ Apply the summed kernels to a (..., compositions, periods) block """
+        for kernel in self.summed_kernels:
+            values = kernel(values, grid, params)
+        return values
+
+
+def specification_hash(functions_associate, functions_parameters):
+    content = json.dumps([functions_associate, functions_parameters], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def _parameter(name, description):
+    if isinstance(description, dict):
+        variable_type, default = description.get('type', 'float'), description.get('default')
+    else:
+        variable_type, default = description, None
+    if variable_type not in TYPES:
+        raise SpecificationError("Unknown type '%s' for parameter '%s'." % (variable_type, name))
+    try:
+        return Parameter(name, variable_type, default)
+    except (TypeError, ValueError):
+        raise SpecificationError("Invalid default '%s' for parameter '%s'." % (default, name))
+
+
+def compile_functions(functions_associate, functions_parameters, key=None):
+    """ Validate the JSON of a specification and build its CompiledSpecification """
+    functions_associate = functions_associate or {}
+    functions_parameters = functions_parameters or {}
+    if not isinstance(functions_associate, dict) or not isinstance(functions_parameters, dict):
+        raise SpecificationError("Functions and parameters must be JSON objects.")
+
+    steps, summed = [], None
+    for step, function in functions_associate.items():
+        if not isinstance(function, str) or function not in KERNELS:
+            raise SpecificationError("Unknown function '%s' for step '%s'." % (function, step))
+        if getattr(KERNELS[function], 'summed', False):
+            summed = summed or step
+        elif summed is not None:
+            raise SpecificationError("Step '%s' comes after step '%s', which applies to the sum of the composition." % (step, summed))
+        steps.append((step, function, KERNELS[function]))
+    parameters = {name: _parameter(name, description) for name, description in functions_parameters.items()}
+    if key is None:
+        key = specification_hash(functions_associate, functions_parameters)
+    return CompiledSpecification(key, steps, parameters)
+
+
+"""
+    Process-wide LRU cache of compiled specifications
+"""
+class SpecificationCache:
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict() # {content hash: CompiledSpecification}
+        self.keys = {} # {PossibleSpecification pk: content hash}
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, possible):
+        key = specification_hash(possible.functions_associate, possible.functions_parameters)
+        with self.lock:
+            compiled = self.entries.get(key)
+            if compiled is not None:
+                self.entries.move_to_end(key)
+                self.keys[possible.pk] = key
+                self.hits += 1
+                return compiled
+            self.misses += 1
+
+        try:
+            compiled = compile_functions(possible.functions_associate, possible.functions_parameters, key)
+        except SpecificationError as error:
+            raise SpecificationError("Specification '%s': %s" % (possible.specification_name, error))
+
+        with self.lock:
+            self.entries[key] = compiled
+            self.keys[possible.pk] = key
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return compiled
+
+    def evict(self, pk):
+        with self.lock:
+            key = self.keys.pop(pk, None)
+            if key is not None:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.keys.clear()
+            self.hits = self.misses = 0
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries), 'max_size': self.size}
+
+
+cache = SpecificationCache(getattr(settings, 'SIMULATOR_SPECIFICATION_CACHE_SIZE', 1024))
+
+
+def compile_specification(possible):
+    """ CompiledSpecification of a PossibleSpecification, compiled at most once per content """
+    return cache.get(possible)
@@ -0,0 +1,407 @@
+"""
+    Vectorized simulation engine.
+
+    A Simulation is evaluated on a time grid between its start and end. Every
+    BaseElement of a Composition becomes one row of a (rows, periods) array,
+    the functions of the Composition's specifications are applied to the whole
+    block at once and the rows are then summed per Composition.
+
+    Compositions sharing the same specifications are stacked in the same block,
+    so the number of numpy calls depends on the number of distinct
+    specification sets, not on the number of elements or periods.
+
+    Arrays always keep time on the last axis, any leading axis (scenarios,
+    perturbations...) is carried through untouched.
+
+    Groups are only evaluated on the periods that can differ (see
+    step_positions): BaseElement values are constant over the horizon, so a
+    group of time invariant kernels has a single step, expanded to every
+    period on output, and a group of pointwise kernels only needs the
+    reported periods. Plans are built from BaseElement.value alone: the dated
+    BaseElementValue series (see timeseries.py) are stored and served by the
+    API but are not inputs of the engine, so they add no step. Feeding them to
+    the plan will require their dates in the steps of time invariant and
+    pointwise groups.
+
+    Stages (planning, evaluation, storage...) are timed by stage() and
+    reported to the callables of STAGE_HOOKS, see metrics.py.
+"""
+
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from . import units
+from .exceptions import EngineError, UnitError
+from .compiler import compile_specification
+
+# Bump when a change of the engine changes outputs, to invalidate every memoized run and stored series
+ENGINE_VERSION = 4
+DAYS_PER_YEAR = 365.25
+# Maximum number of cells (rows * periods) evaluated in a single block
+BLOCK_SIZE = 2 ** 24
+# Callables receiving (stage name, seconds) at the end of every stage
+STAGE_HOOKS = []
+
+
+@contextmanager
+def stage(name):
+    """ Time a block, or a function when used as a decorator, as the stage name """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        for hook in STAGE_HOOKS:
+            hook(name, seconds)
+
+
+"""
+    Time axis of a simulation, years being counted from origin (the first date by default)
+"""
+class TimeGrid:
+
+    def __init__(self, dates, origin=None):
+        self.dates = pd.DatetimeIndex(dates)
+        if len(self.dates) == 0:
+            raise EngineError("The simulation horizon is empty.")
+        self.origin = self.dates[0] if origin is None else pd.Timestamp(origin)
+        offsets = (self.dates - self.origin) / pd.Timedelta(days=1)
+        self.years = np.asarray(offsets, dtype=np.float64) / DAYS_PER_YEAR
+
+    def __len__(self):
+        return len(self.dates)
+
+    def take(self, positions):
+        """ Grid of some periods of this one, years still counted from its origin """
+        return TimeGrid(self.dates[positions], origin=self.origin)
+
+    @classmethod
+    def between(cls, start, end, freq='D'):
+        if end < start:
+            raise EngineError("The simulation ends before it starts.")
+        return cls(pd.date_range(start, end, freq=freq))
+
+
+def report_positions(grid, freq):
+    """ Index of the last period of every reporting interval, always including the last period """
+    if not freq:
+        return np.arange(len(grid))
+    positions = pd.Series(np.arange(len(grid)), index=grid.dates).resample(freq).last().dropna()
+    return np.unique(np.append(positions.to_numpy(dtype=np.intp), len(grid) - 1))
+
+
+"""
+    Compositions sharing the same specifications, evaluated as one block
+"""
+class Group:
+
+    def __init__(self, specifications):
+        self.specifications = specifications    # [CompiledSpecification]
+        self.parameters = {}                    # {parameter name: Parameter}
+        for specification in specifications:
+            for name, parameter in specification.parameters.items():
+                if name in self.parameters and self.parameters[name].type != parameter.type:
+                    raise EngineError("Parameter '%s' is declared with two different types." % name)
+                self.parameters[name] = parameter
+        self.composition_ids = []
+        self.rows = []                  # index of the summed elements, composition after composition
+        self.counts = []                # number of rows of each composition
+        self.sources = {name: [] for name in self.parameters} # element index feeding each parameter, -1 if none
+        self.scales = []                # multiplier to base units of the defaults of the scaled parameters of each composition
+        self.scaled = {name for specification in specifications for name in specification.scaled if name in self.parameters}
+        self.pointwise = all(specification.pointwise for specification in specifications)
+        self.time_invariant = all(specification.time_invariant for specification in specifications)
+        self.causal = all(specification.causal for specification in specifications)
+        self.summed = False
+        for specification in specifications:
+            # Any earlier summed specification, not only the previous one
+            if self.summed and specification.kernels:
+                raise EngineError("Specifications applying to the sum of a composition must come after the others.")
+            self.summed = self.summed or bool(specification.summed_kernels)
+
+    def add(self, composition_id, rows, sources, scale=1.0):
+        self.composition_ids.append(composition_id)
+        self.rows.extend(rows)
+        self.counts.append(len(rows))
+        self.scales.append(scale)
+        for name in self.parameters:
+            self.sources[name].append(sources.get(name, -1))
+
+    def freeze(self):
+        self.rows = np.asarray(self.rows, dtype=np.intp)
+        self.counts = np.asarray(self.counts, dtype=np.intp)
+        self.scales = np.asarray(self.scales, dtype=np.float64)
+        self.starts = np.concatenate(([0], np.cumsum(self.counts)[:-1])).astype(np.intp)
+        self.sources = {name: np.asarray(source, dtype=np.intp) for name, source in self.sources.items()}
+
+    def chunks(self, periods, size=BLOCK_SIZE):
+        """ Split the group on composition boundaries so every block stays under size cells """
+        limit = max(size // max(periods, 1), 1)
+        begin, size = 0, 0
+        for index, count in enumerate(self.counts):
+            if size and size + count > limit:
+                yield begin, index
+                begin, size = index, 0
+            size += count
+        if begin < len(self.counts):
+            yield begin, len(self.counts)
+
+
+"""
+    Array form of a set of compositions, independent from the database.
+    values are in base units, scales being the multiplier applied to every BaseElement value
+"""
+class Plan:
+
+    def __init__(self, element_ids, values, groups, composition_ids, scales=None, dimensions=None):
+        self.element_ids = np.asarray(element_ids)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.groups = groups
+        self.composition_ids = list(composition_ids)
+        self.position = {composition_id: index for index, composition_id in enumerate(self.composition_ids)}
+        self.scales = np.ones(len(self.values)) if scales is None else np.asarray(scales, dtype=np.float64)
+        self.dimensions = dimensions or {} # {composition id: output dimension, see units.py}
+
+    def unit_labels(self):
+        """ {composition id: unit of its series}, in base units """
+        return {composition_id: units.label(dimension) for composition_id, dimension in self.dimensions.items()}
+
+
+"""
+    Output of a simulation: one series per composition
+"""
+class SimulationResult:
+
+    def __init__(self, grid, composition_ids, values, unit_labels=None):
+        self.grid = grid
+        self.composition_ids = list(composition_ids)
+        self.values = values # (..., compositions, periods)
+        self.unit_labels = unit_labels or {} # {composition id: unit of its series, see Plan.unit_labels}
+
+    @staticmethod
+    def series_name(composition_id):
+        return "composition_%s" % composition_id
+
+    def series(self):
+        return {
+            self.series_name(composition_id): self.values[..., index, :]
+            for index, composition_id in enumerate(self.composition_ids)
+        }
+
+    def series_units(self):
+        return {self.series_name(composition_id): self.unit_labels.get(composition_id) for composition_id in self.composition_ids}
+
+    def to_frame(self):
+        if self.values.ndim != 2:
+            raise EngineError("Only single scenario results can be converted to a DataFrame.")
+        return pd.DataFrame(self.series(), index=self.grid.dates)
+
+
+def _possibles(composition):
+    possibles = []
+    for specification in sorted(composition.specification_set.all(), key=lambda specification: specification.pk):
+        possibles.extend(sorted(specification.specifications_possible.all(), key=lambda possible: possible.pk))
+    return possibles
+
+
+@stage('plan')
+def build_plan(compositions):
+    """
+        Turn compositions into a Plan. BaseElements whose label matches a parameter
+        of the composition's specifications feed that parameter instead of being summed.
+        Units are resolved here, raising UnitError, and values converted to base units.
+        Defaults of the parameters in the unit of the values (e.g. the amount of an offset) are
+        in the unit of the first summed element with one, and converted with its multiplier
+    """
+    compositions = compositions.prefetch_related('base_elements', 'specification_set__specifications_possible')
+    element_index, element_ids, values, scales, element_dimensions = {}, [], [], [], []
+    groups, composition_ids, dimensions = {}, [], {}
+
+    for composition in compositions:
+        specifications = [compile_specification(possible) for possible in _possibles(composition)]
+        key = tuple(specification.key for specification in specifications)
+        if key not in groups:
+            groups[key] = Group(specifications)
+        group = groups[key]
+
+        rows, sources = [], {}
+        for element in composition.base_elements.all():
+            if element.pk not in element_index:
+                try:
+                    dimension, scale = units.parse(element.unit, element.unit_separator)
+                except UnitError as error:
+                    raise UnitError("BaseElement %s: %s" % (element.pk, error))
+                element_index[element.pk] = len(element_ids)
+                element_ids.append(element.pk)
+                values.append(element.value * scale)
+                scales.append(scale)
+                element_dimensions.append(dimension)
+            if element.label in group.parameters:
+                sources[element.label] = element_index[element.pk]
+            else:
+                rows.append(element_index[element.pk])
+        for name, parameter in group.parameters.items():
+            if name not in sources and parameter.default is None:
+                raise EngineError("Parameter '%s' of composition %s has no value." % (name, composition.pk))
+        dimensions[composition.pk] = units.resolve(
+            composition.pk, specifications,
+            [element_dimensions[row] for row in rows],
+            {name: element_dimensions[source] for name, source in sources.items()}
+        )
+        scale = next((scales[row] for row in rows if element_dimensions[row] is not None), 1.0)
+        group.add(composition.pk, rows, sources, scale)
+        composition_ids.append(composition.pk)
+
+    for group in groups.values():
+        group.freeze()
+    return Plan(element_ids, values, list(groups.values()), composition_ids, scales, dimensions)
+
+
+def _parameters(group, values, begin, end, per_row=True):
+    """
+        Parameter arrays of the compositions [begin, end) of a group, shaped (..., rows, 1),
+        or (..., compositions, 1) when not per_row
+    """
+    parameters = {}
+    counts = group.counts[begin:end]
+    for name, parameter in group.parameters.items():
+        sources = group.sources[name][begin:end]
+        column = np.full(values.shape[:-1] + (len(sources),), np.nan if parameter.default is None else parameter.default, dtype=np.float64)
+        if name in group.scaled:
+            column *= group.scales[begin:end]
+        filled = sources >= 0
+        column[..., filled] = values[..., sources[filled]]
+        column = column.astype(parameter.dtype, copy=False)
+        parameters[name] = (np.repeat(column, counts, axis=-1) if per_row else column)[..., None]
+    return parameters
+
+
+def row_range(group, begin, end):
+    """ Slice of group.rows holding the elements of the compositions [begin, end) """
+    counts = group.counts[begin:end]
+    first = group.starts[begin] if len(counts) else 0
+    return slice(first, first + int(counts.sum()))
+
+
+def evaluate_rows(group, grid, values, begin=0, end=None, row_values=None):
+    """
+        Series of every summed element of the compositions [begin, end) of a group, shaped
+        (..., rows, periods). row_values replaces the values of these rows, parameters
+        still being read from values
+    """
+    end = len(group.counts) if end is None else end
+    rows = group.rows[row_range(group, begin, end)]
+    if row_values is None:
+        row_values = values[..., rows]
+    shape = np.broadcast_shapes(values.shape[:-1], row_values.shape[:-1]) + (len(rows), len(grid))
+    block = np.broadcast_to(row_values[..., None], shape)
+    parameters = _parameters(group, values, begin, end)
+    for specification in group.specifications:
+        block = specification(block, grid, parameters)
+    return np.broadcast_to(block, shape)
+
+
+def sum_rows(group, block, begin=0, end=None):
+    """ Sum the (..., rows, periods) block of the compositions [begin, end) per composition """
+    end = len(group.counts) if end is None else end
+    counts = group.counts[begin:end]
+    output = np.zeros(block.shape[:-2] + (len(counts), block.shape[-1]))
+    filled = counts > 0
+    if filled.any():
+        starts = group.starts[begin:end][filled] - group.starts[begin]
+        output[..., filled, :] = np.add.reduceat(block, starts, axis=-2)
+    return output
+
+
+def evaluate_summed(group, grid, values, totals, begin=0, end=None, per_row=False):
+    """
+        Apply the summed kernels of a group to totals, the (..., compositions, periods) sums of
+        the compositions [begin, end), or a (..., rows, periods) block holding one variant of the
+        sum of the composition of every row when per_row
+    """
+    if not group.summed:
+        return totals
+    end = len(group.counts) if end is None else end
+    parameters = _parameters(group, values, begin, end, per_row)
+    for specification in group.specifications:
+        totals = specification.summed(totals, grid, parameters)
+    return totals
+
+
+def evaluate_group(group, grid, values, begin=0, end=None):
+    """ Series of the compositions [begin, end) of a group, shaped (..., compositions, periods) """
+    end = len(group.counts) if end is None else end
+    if not group.counts[begin:end].sum():
+        totals = np.zeros(values.shape[:-1] + (end - begin, len(grid)))
+    else:
+        totals = sum_rows(group, evaluate_rows(group, grid, values, begin, end), begin, end)
+    return evaluate_summed(group, grid, values, totals, begin, end)
+
+
+def step_positions(group, grid, report=None):
+    """
+        Periods of grid a group is evaluated on to know its series at the report positions (every
+        period when None): the first one when it is time invariant, the reported ones when it is
+        pointwise, every period up to the last reported one when it is causal, all of them otherwise.
+        Inputs are the constant BaseElement values, the BaseElementValue series are not read
+    """
+    if group.time_invariant:
+        return np.zeros(1, dtype=np.intp)
+    if group.pointwise and report is not None:
+        return np.asarray(report, dtype=np.intp)
+    if group.causal and report is not None:
+        return np.arange(int(report[-1]) + 1, dtype=np.intp)
+    return np.arange(len(grid), dtype=np.intp)
+
+
+def evaluate_reported(group, grid, values, begin=0, end=None, report=None):
+    """
+        Series of the compositions [begin, end) of a group at the report positions of grid,
+        shaped (..., compositions, reported periods), computed on the steps of the group only
+    """
+    steps = step_positions(group, grid, report)
+    reported = len(grid) if report is None else len(report)
+    block = evaluate_group(group, grid if len(steps) == len(grid) else grid.take(steps), values, begin, end)
+    if group.time_invariant:
+        return np.broadcast_to(block, block.shape[:-1] + (reported,))
+    if report is None or group.pointwise:
+        return block
+    return block[..., report]
+
+
+@stage('evaluate')
+def evaluate(plan, grid, values=None, progress=None, report=None):
+    """
+        Evaluate a plan on a grid. values overrides the BaseElement values and may carry
+        leading axes, e.g. (scenarios, elements), in which case so does the result.
+        report restricts the output to some positions of grid (see report_positions).
+        progress is called with the fraction of compositions computed after every block
+    """
+    values = plan.values if values is None else np.asarray(values, dtype=np.float64)
+    output_grid = grid if report is None else grid.take(report)
+    output = np.zeros(values.shape[:-1] + (len(plan.composition_ids), len(output_grid)))
+    total, done = max(len(plan.composition_ids), 1), 0
+    for group in plan.groups:
+        positions = np.asarray([plan.position[composition_id] for composition_id in group.composition_ids], dtype=np.intp)
+        for begin, end in group.chunks(len(step_positions(group, grid, report))):
+            output[..., positions[begin:end], :] = evaluate_reported(group, grid, values, begin, end, report)
+            done += end - begin
+            if progress is not None:
+                progress(done / total)
+    return SimulationResult(output_grid, plan.composition_ids, output, plan.unit_labels())
+
+
+def run_simulation(simulation, compositions=None, freq='D', progress=None, report_freq=None):
+    """
+        Evaluate the compositions of a simulation between its start and end, reporting
+        the last period of every report_freq interval when given
+    """
+    if compositions is None:
+        compositions = simulation.compositions.all()
+    grid = TimeGrid.between(simulation.start, simulation.end, freq)
+    plan = build_plan(compositions.order_by('pk'))
+    report = report_positions(grid, report_freq) if report_freq else None
+    return evaluate(plan, grid, progress=progress, report=report)
@@ -0,0 +1,195 @@
+"""
+    Live progress of simulation jobs as server-sent events.
+
+    GET /api/simulation_job/<id>/events/ is answered by a plain ASGI handler
+    (see azasimul/asgi.py): the stream sends a 'progress' event whenever the
+    status or progress of the job changes and a 'complete' event, carrying
+    the job result or error, when it ends. Comments are sent every
+    KEEPALIVE seconds so proxies keep the connection open.
+
+    Workers publish with notify(). On PostgreSQL this is a NOTIFY on CHANNEL,
+    and every ASGI process runs a single thread LISTENing on it. Other
+    databases are polled by that thread every SIMULATOR_EVENTS_POLL seconds,
+    one query for all the jobs watched by the process. Either way no outside
+    broker is needed, and clients no longer poll the job detail endpoint.
+"""
+
+import asyncio
+import json
+import re
+import select
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection, connections
+
+from .models import SimulationJob
+
+CHANNEL = 'simulator_job'
+KEEPALIVE = 15.0
+FINAL = ('done', 'failed', 'cancelled')
+PATH = re.compile(r'^/api/simulation_job/(\d+)/events/?$')
+
+
+def _poll_interval():
+    return getattr(settings, 'SIMULATOR_EVENTS_POLL', 1.0)
+
+
+def notify(job_id, **fields):
+    """ Publish the new status and/or progress of a job """
+    event = dict(fields, job=job_id)
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [CHANNEL, json.dumps(event)])
+    else:
+        hub.publish(event)
+
+
+"""
+    Subscribers of the current process, fed by a single listener thread
+"""
+class Hub:
+
+    def __init__(self):
+        self.subscribers = {} # {job id: {(event loop, asyncio.Queue)}}
+        self.lock = threading.Lock()
+        self.listener = None
+
+    def subscribe(self, job_id):
+        queue = asyncio.Queue()
+        with self.lock:
+            self.subscribers.setdefault(job_id, set()).add((asyncio.get_running_loop(), queue))
+            if self.listener is None or not self.listener.is_alive():
+                self.listener = threading.Thread(target=self._listen, name='simulator-events', daemon=True)
+                self.listener.start()
+        return queue
+
+    def unsubscribe(self, job_id, queue):
+        with self.lock:
+            subscribers = self.subscribers.get(job_id, set())
+            subscribers.difference_update({subscriber for subscriber in subscribers if subscriber[1] is queue})
+            if not subscribers:
+                self.subscribers.pop(job_id, None)
+
+    def watched(self):
+        with self.lock:
+            return list(self.subscribers)
+
+    def publish(self, event):
+        with self.lock:
+            subscribers = list(self.subscribers.get(event['job'], ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    def _listen(self):
+        while True:
+            try:
+                if connections['default'].vendor == 'postgresql':
+                    self._listen_postgresql()
+                else:
+                    self._listen_polling()
+            except Exception:
+                # Lost database connection, retry
+                time.sleep(_poll_interval())
+            finally:
+                close_old_connections()
+
+    def _listen_postgresql(self):
+        wrapper = connections['default']
+        listener = wrapper.get_new_connection(wrapper.get_connection_params())
+        try:
+            listener.autocommit = True
+            with listener.cursor() as cursor:
+                cursor.execute("LISTEN %s" % CHANNEL)
+            while True:
+                if select.select([listener], [], [], KEEPALIVE) == ([], [], []):
+                    continue
+                listener.poll()
+                while listener.notifies:
+                    self.publish(json.loads(listener.notifies.pop(0).payload))
+        finally:
+            listener.close()
+
+    def _listen_polling(self):
+        known = {}
+        while True:
+            time.sleep(_poll_interval())
+            watched = self.watched()
+            if not watched:
+                continue
+            for job_id, status, progress in SimulationJob.objects.filter(pk__in=watched).values_list('pk', 'status', 'progress'):
+                if known.get(job_id) != (status, progress):
+                    known[job_id] = (status, progress)
+                    self.publish({'job': job_id, 'status': status, 'progress': progress})
+
+
+hub = Hub()
+
+
+def _state(job_id, complete=False):
+    fields = ['pk', 'status', 'progress'] + (['error', 'result'] if complete else [])
+    state = SimulationJob.objects.filter(pk=job_id).values(*fields).first()
+    if state is not None:
+        state['job'] = state.pop('pk')
+    return state
+
+
+def _event(name, data):
+    return {'type': 'http.response.body', 'body': ('event: %s\ndata: %s\n\n' % (name, json.dumps(data))).encode(), 'more_body': True}
+
+
+async def _disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def job_events(scope, receive, send, job_id):
+    """ ASGI handler streaming the events of a job until it ends or the client leaves """
+    queue = hub.subscribe(job_id)
+    disconnected = asyncio.ensure_future(_disconnect(receive))
+    try:
+        state = await sync_to_async(_state)(job_id)
+        if state is None:
+            await send({'type': 'http.response.start', 'status': 404, 'headers': [(b'content-type', b'application/json')]})
+            await send({'type': 'http.response.body', 'body': json.dumps({'detail': 'Not found.'}).encode()})
+            return
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+        await send(_event('progress', state))
+
+        while state['status'] not in FINAL:
+            received = asyncio.ensure_future(queue.get())
+            done, pending = await asyncio.wait({received, disconnected}, timeout=KEEPALIVE, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                received.cancel()
+                return
+            if received in done:
+                update = {key: value for key, value in received.result().items() if key in ('status', 'progress')}
+                if any(state.get(key) != value for key, value in update.items()):
+                    state.update(update)
+                    await send(_event('progress', state))
+            else:
+                received.cancel()
+                await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+
+        await send(_event('complete', await sync_to_async(_state)(job_id, complete=True)))
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        disconnected.cancel()
+        hub.unsubscribe(job_id, queue)
+
+
+def router(application):
+    """ ASGI application answering the job event streams and passing everything else to application """
+    async def route(scope, receive, send):
+        if scope['type'] == 'http':
+            match = PATH.match(scope['path'])
+            if match:
+                return await job_events(scope, receive, send, int(match.group(1)))
+        return await application(scope, receive, send)
+    return route
@@ -0,0 +1,14 @@
+class EngineError(Exception):
+    pass
+
+"""
+    Raised when the JSON of a PossibleSpecification can not be compiled
+"""
+class SpecificationError(EngineError):
+    pass
+
+"""
+    Raised when the units of a Composition do not combine
+"""
+class UnitError(EngineError):
+    pass
@@ -0,0 +1,118 @@
+"""
+    Financial kernels usable by name in PossibleSpecification.functions_associate.
+
+    Every kernel is a closed form over the whole (..., rows, periods) block:
+    time comes from grid.years (years since the start of the simulation) and
+    parameters are (..., rows, 1) arrays, so the same numpy calls serve one
+    row or a batch of scenarios. Rates are annual, as decimals (0.05 is 5%).
+
+        compound            values * (1 + interest_rate / periods_per_year) ** (periods_per_year * years)
+        discount            values / (1 + discount_rate) ** years
+        npv                 running sum of the discounted values, values being cash flows
+        irr                 internal rate of return of the cash flows of each composition,
+                            applied once its elements are summed, NaN when there is none
+        annuity_payment     payment of a loan of values over term years
+        amortization        outstanding balance of that loan
+        straight_line       book value depreciated linearly to salvage over life years
+        declining_balance   book value depreciated by depreciation_rate a year, down to salvage
+        indexation          values indexed on inflation after a lag of lag years
+        tariff_escalation   values escalated by escalation every interval years after delay
+                            years, the multiplier being capped by cap
+"""
+
+import numpy as np
+
+from .kernels import _param, _units_dimensionless, _units_like, register_kernel
+from .units import DIMENSIONLESS
+
+IRR_ITERATIONS = 50
+IRR_TOLERANCE = 1e-10
+
+
+def _units_rate(dimension, parameters):
+    return DIMENSIONLESS
+
+
+def _installments(grid, params):
+    """ Number of installments paid at every period and the rate per installment """
+    periods_per_year = _param(params, 'periods_per_year', 12)
+    paid = np.floor(grid.years * periods_per_year + 1e-9)
+    return paid, _param(params, 'interest_rate', 0.0) / periods_per_year, _param(params, 'term', 1) * periods_per_year
+
+
+def _payment(principal, rate, count):
+    """ Constant installment of an annuity, rate being per installment """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        payment = principal * rate / (1.0 - (1.0 + rate) ** -count)
+    return np.where(rate == 0, principal / np.maximum(count, 1), payment)
+
+
+@register_kernel('compound', units=_units_dimensionless('interest_rate', 'periods_per_year'))
+def kernel_compound(values, grid, params):
+    periods_per_year = _param(params, 'periods_per_year', 1)
+    return values * (1.0 + _param(params, 'interest_rate', 0.0) / periods_per_year) ** (periods_per_year * grid.years)
+
+@register_kernel('discount', units=_units_dimensionless('discount_rate'))
+def kernel_discount(values, grid, params):
+    return values / (1.0 + _param(params, 'discount_rate', 0.0)) ** grid.years
+
+@register_kernel('npv', pointwise=False, units=_units_dimensionless('discount_rate'))
+def kernel_npv(values, grid, params):
+    return np.cumsum(kernel_discount(values, grid, params), axis=-1)
+
+@register_kernel('irr', pointwise=False, causal=False, summed=True, units=_units_rate)
+def kernel_irr(values, grid, params):
+    flows = np.asarray(values, dtype=np.float64)
+    years = grid.years
+    rate = np.full(flows.shape[:-1] + (1,), 0.1)
+    converged = np.zeros(rate.shape, dtype=bool)
+    # A flat net present value (a single period, no cash flow...) has no root to move to
+    failed = np.zeros(rate.shape, dtype=bool)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        for iteration in range(IRR_ITERATIONS):
+            factors = (1.0 + rate) ** -years
+            value = (flows * factors).sum(axis=-1, keepdims=True)
+            slope = (-years * flows * factors / (1.0 + rate)).sum(axis=-1, keepdims=True)
+            failed |= ~converged & ((slope == 0) | ~np.isfinite(slope) | ~np.isfinite(value))
+            step = np.where(converged | failed, 0.0, value / slope)
+            rate = np.maximum(rate - step, -0.999999)
+            converged |= ~failed & (np.abs(step) < IRR_TOLERANCE)
+            if (converged | failed).all():
+                break
+    return np.broadcast_to(np.where(converged, rate, np.nan), flows.shape)
+
+@register_kernel('annuity_payment', units=_units_dimensionless('interest_rate', 'term', 'periods_per_year'))
+def kernel_annuity_payment(values, grid, params):
+    paid, rate, count = _installments(grid, params)
+    return np.where(paid < count, _payment(values, rate, count), 0.0)
+
+@register_kernel('amortization', units=_units_dimensionless('interest_rate', 'term', 'periods_per_year'))
+def kernel_amortization(values, grid, params):
+    paid, rate, count = _installments(grid, params)
+    paid = np.minimum(paid, count)
+    payment = _payment(values, rate, count)
+    growth = (1.0 + rate) ** paid
+    with np.errstate(divide='ignore', invalid='ignore'):
+        balance = values * growth - payment * (growth - 1.0) / rate
+    balance = np.where(rate == 0, values - payment * paid, balance)
+    return np.where(paid >= count, 0.0, balance)
+
+@register_kernel('straight_line', units=_units_like('salvage'))
+def kernel_straight_line(values, grid, params):
+    salvage = _param(params, 'salvage', 0.0)
+    used = np.minimum(grid.years / _param(params, 'life', 1.0), 1.0)
+    return values - (values - salvage) * used
+
+@register_kernel('declining_balance', units=_units_like('salvage'))
+def kernel_declining_balance(values, grid, params):
+    book = values * (1.0 - _param(params, 'depreciation_rate', 0.0)) ** grid.years
+    return np.maximum(book, _param(params, 'salvage', 0.0))
+
+@register_kernel('indexation', units=_units_dimensionless('inflation', 'lag'))
+def kernel_indexation(values, grid, params):
+    return values * (1.0 + _param(params, 'inflation', 0.0)) ** np.maximum(grid.years - _param(params, 'lag', 0.0), 0.0)
+
+@register_kernel('tariff_escalation', units=_units_dimensionless('escalation', 'interval', 'delay', 'cap'))
+def kernel_tariff_escalation(values, grid, params):
+    steps = np.floor(np.maximum(grid.years - _param(params, 'delay', 0.0), 0.0) / _param(params, 'interval', 1.0) + 1e-9)
+    return values * np.minimum((1.0 + _param(params, 'escalation', 0.0)) ** steps, _param(params, 'cap', np.inf))
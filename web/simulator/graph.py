@@ -0,0 +1,161 @@
+"""
+    Dependency graph between the inputs of a simulation and its compositions.
+
+    A Composition depends on its BaseElements (Composition.base_elements), its
+    Specifications (Specification.composition) and, through them, on the
+    PossibleSpecifications they use (Specification.specifications_possible).
+    Model signals call the mark_* functions below, which bump Composition.revision
+    for the affected compositions only. The result store remembers the revision
+    every series was computed from, so a new run only recomputes the series
+    whose revision moved and reuses the stored arrays for the others.
+
+    Queryset deletes of the inputs (see models.MarkedQuerySet) mark the
+    compositions of all the deleted rows with one UPDATE, the per row
+    receivers being suspended meanwhile.
+"""
+
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+from django.db.models import F, QuerySet
+
+from . import apicache, results
+from .engine import ENGINE_VERSION, TimeGrid, SimulationResult, build_plan, report_positions
+from .exceptions import EngineError
+from .sharding import evaluate_sharded
+from .models import BaseElement, Composition, PossibleSpecification, Specification
+
+_local = threading.local()
+
+
+def mark_dirty(compositions):
+    """ Bump the revision of a queryset of compositions """
+    apicache.bump(Composition)
+    return compositions.update(revision=F('revision') + 1)
+
+
+def _ids(ids):
+    """ ids as a subquery when it is a queryset, as a list otherwise """
+    return ids if isinstance(ids, QuerySet) else list(ids)
+
+
+def mark_compositions(composition_ids):
+    return mark_dirty(Composition.objects.filter(pk__in=_ids(composition_ids)))
+
+
+def mark_base_elements(element_ids):
+    return mark_dirty(Composition.objects.filter(base_elements__pk__in=_ids(element_ids)).distinct())
+
+
+def mark_specifications(specification_ids):
+    return mark_dirty(Composition.objects.filter(specification__pk__in=_ids(specification_ids)).distinct())
+
+
+def mark_possible_specifications(possible_ids):
+    return mark_dirty(Composition.objects.filter(specification__specifications_possible__pk__in=_ids(possible_ids)).distinct())
+
+
+# Marking of the compositions depending on the rows of a model, None when nothing depends on them
+MARKERS = {
+    BaseElement: mark_base_elements,
+    PossibleSpecification: mark_possible_specifications,
+    Specification: mark_specifications,
+    Composition: None,
+}
+
+
+def marking_suspended():
+    """ Whether the signal receivers must leave the marking to a bulk delete in progress """
+    return getattr(_local, 'suspended', 0) > 0
+
+
+@contextmanager
+def _suspended():
+    _local.suspended = getattr(_local, 'suspended', 0) + 1
+    try:
+        yield
+    finally:
+        _local.suspended -= 1
+
+
+def delete_marked(queryset, delete):
+    """
+        Run delete, the delete of queryset, after marking the compositions depending on its
+        rows with one UPDATE, while their links still exist
+    """
+    with transaction.atomic():
+        marker = MARKERS.get(queryset.model)
+        if marker is not None:
+            marker(queryset.values('pk'))
+        with _suspended():
+            return delete()
+
+
+def reusable(stored, grid):
+    """ Stored series can only be reused when they were computed by this engine version on the same time axis """
+    if stored is None or stored.engine != ENGINE_VERSION or len(stored.dates) != len(grid):
+        return False
+    return np.array_equal(stored.dates, grid.dates.values.astype('datetime64[s]'))
+
+
+def validate(parameters):
+    """ Cleaned parameters of a run, raises EngineError """
+    parameters = dict(parameters or {})
+    cleaned = {'report_freq': parameters.get('report_freq') or None}
+    if cleaned['report_freq']:
+        try:
+            pd.tseries.frequencies.to_offset(cleaned['report_freq'])
+        except ValueError:
+            raise EngineError("Unknown reporting frequency '%s'." % cleaned['report_freq'])
+    return cleaned
+
+
+def run_incremental(simulation, freq='D', progress=None, processes=1, report_freq=None):
+    """
+        Evaluate a simulation, recomputing only the compositions whose revision changed since
+        its stored result. Returns the full SimulationResult, the revision of every series
+        and the number of recomputed compositions. processes > 1 shards the computation,
+        report_freq keeps the last period of every reporting interval only
+    """
+    grid = TimeGrid.between(simulation.start, simulation.end, freq)
+    report = report_positions(grid, report_freq) if report_freq else None
+    output_grid = grid if report is None else grid.take(report)
+    revisions = dict(simulation.compositions.order_by('pk').values_list('pk', 'revision'))
+    composition_ids = list(revisions)
+
+    try:
+        stored = results.StoredResult(simulation.pk)
+    except results.ResultNotFound:
+        stored = None
+    if not reusable(stored, output_grid):
+        stored = None
+
+    dirty = []
+    for composition_id, revision in revisions.items():
+        name = SimulationResult.series_name(composition_id)
+        if stored is None or stored.revisions.get(name) != revision:
+            dirty.append(composition_id)
+
+    output = np.empty((len(composition_ids), len(output_grid)))
+    position = {composition_id: index for index, composition_id in enumerate(composition_ids)}
+    unit_labels = {}
+    for composition_id in composition_ids:
+        if composition_id not in dirty:
+            name = SimulationResult.series_name(composition_id)
+            output[position[composition_id]] = stored.series(name)
+            unit_labels[composition_id] = stored.units.get(name)
+
+    if dirty:
+        plan = build_plan(Composition.objects.filter(pk__in=dirty).order_by('pk'))
+        fresh = evaluate_sharded(plan, grid, processes, progress=progress, report=report)
+        output[[position[composition_id] for composition_id in fresh.composition_ids]] = fresh.values
+        unit_labels.update(fresh.unit_labels)
+    elif progress is not None:
+        progress(1.0)
+
+    result = SimulationResult(output_grid, composition_ids, output, unit_labels)
+    series_revisions = {result.series_name(composition_id): revision for composition_id, revision in revisions.items()}
+    return result, series_revisions, len(dirty)
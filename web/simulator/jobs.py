@@ -0,0 +1,232 @@
+"""
+    Simulation job queue backed by the database.
+
+    Jobs are SimulationJob rows. Workers claim pending jobs with
+    SELECT ... FOR UPDATE SKIP LOCKED so several worker processes can share the
+    same table without an outside broker. Progress and cancellation go through
+    the row as well: the engine reports progress after every block and the
+    worker checks cancel_requested at the same time.
+
+    Workers record a heartbeat on the jobs they run. A running job whose
+    heartbeat is older than SIMULATOR_JOB_TIMEOUT seconds belongs to a worker
+    which died with its host, it is put back in the queue by the next claim.
+"""
+
+import datetime
+import os
+import socket
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import events, memo, metrics, results
+from .graph import run_incremental
+from .scenarios import run_scenarios
+from .sensitivity import run_sensitivity
+from .engine import SimulationResult
+from .exceptions import EngineError
+from .models import SimulationJob
+
+# Minimum delay in seconds between two progress writes of a job
+PROGRESS_INTERVAL = 1.0
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def worker_name():
+    return "%s:%s" % (socket.gethostname(), os.getpid())
+
+
+def _revisions(simulation):
+    return {
+        SimulationResult.series_name(composition_id): revision
+        for composition_id, revision in simulation.compositions.values_list('pk', 'revision')
+    }
+
+
+def _install_cached(simulation, key):
+    """ Install the memoized run of key as the result of simulation, None when there is none """
+    directory = memo.lookup(key)
+    if directory is None:
+        return None
+    results.install(simulation.pk, directory, _revisions(simulation))
+    stored = results.StoredResult(simulation.pk)
+    return {'series': len(stored.series_names), 'periods': len(stored.dates), 'recomputed': 0, 'cached': True}
+
+
+def enqueue(simulation, kind='run', parameters=None):
+    """ Queue a simulation, or complete the job right away when an identical run is memoized """
+    parameters = parameters or {}
+    if kind != 'run':
+        return SimulationJob.objects.create(simulation=simulation, kind=kind, parameters=parameters)
+    key = memo.run_key(simulation, report_freq=parameters.get('report_freq'))
+    cached = _install_cached(simulation, key)
+    if cached is not None:
+        now = timezone.now()
+        return SimulationJob.objects.create(
+            simulation=simulation, parameters=parameters, input_hash=key, status='done', progress=1, result=cached, started_at=now, finished_at=now
+        )
+    return SimulationJob.objects.create(simulation=simulation, parameters=parameters, input_hash=key)
+
+
+def cancel(job):
+    """ Cancel a pending job right away, ask the worker to stop a running one """
+    with transaction.atomic():
+        job = SimulationJob.objects.select_for_update().get(pk=job.pk)
+        if job.status == 'pending':
+            job.status = 'cancelled'
+            job.finished_at = timezone.now()
+        elif job.status == 'running':
+            job.cancel_requested = True
+        job.save(update_fields=['status', 'finished_at', 'cancel_requested'])
+    if job.status == 'cancelled':
+        events.notify(job.pk, status='cancelled')
+    return job
+
+
+def _timeout():
+    return getattr(settings, 'SIMULATOR_JOB_TIMEOUT', 300)
+
+
+def claim(worker, limit=1):
+    """ Mark up to limit pending jobs as running for this worker and return them """
+    reclaim()
+    with transaction.atomic():
+        jobs = list(
+            SimulationJob.objects.select_for_update(skip_locked=True)
+            .filter(status='pending')
+            .order_by('created_at')[:limit]
+        )
+        now = timezone.now()
+        for job in jobs:
+            job.status, job.worker, job.started_at, job.heartbeat_at = 'running', worker, now, now
+        SimulationJob.objects.bulk_update(jobs, ['status', 'worker', 'started_at', 'heartbeat_at'])
+    for job in jobs:
+        events.notify(job.pk, status='running', progress=job.progress)
+    return jobs
+
+
+def _back_in_queue(jobs):
+    return jobs.update(status='pending', worker='', started_at=None, heartbeat_at=None, progress=0)
+
+
+def requeue(worker, job_ids=None):
+    """ Put back in the queue the jobs a stopping worker did not finish, or only job_ids of them """
+    jobs = SimulationJob.objects.filter(status='running', worker=worker)
+    if job_ids is not None:
+        jobs = jobs.filter(pk__in=list(job_ids))
+    return _back_in_queue(jobs)
+
+
+def heartbeat(worker):
+    """ Record that the jobs of a worker are still running """
+    return SimulationJob.objects.filter(status='running', worker=worker).update(heartbeat_at=timezone.now())
+
+
+def reclaim():
+    """ Put back in the queue the running jobs without heartbeat for SIMULATOR_JOB_TIMEOUT seconds """
+    expired = timezone.now() - datetime.timedelta(seconds=_timeout())
+    return _back_in_queue(SimulationJob.objects.filter(status='running').filter(
+        Q(heartbeat_at__lt=expired) | Q(heartbeat_at__isnull=True, started_at__lt=expired)
+    ))
+
+
+class ProgressReporter:
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.last = 0
+
+    def __call__(self, fraction):
+        now = time.monotonic()
+        if fraction < 1 and now - self.last < PROGRESS_INTERVAL:
+            return
+        self.last = now
+        SimulationJob.objects.filter(pk=self.job_id).update(progress=fraction)
+        events.notify(self.job_id, progress=fraction)
+        if SimulationJob.objects.filter(pk=self.job_id, cancel_requested=True).exists():
+            raise JobCancelled()
+
+
+def _finish(job_id, **fields):
+    SimulationJob.objects.filter(pk=job_id).update(finished_at=timezone.now(), **fields)
+    events.notify(job_id, status=fields['status'])
+    # The stage timings of the job, for /metrics
+    metrics.registry.flush(force=True)
+
+
+def _run_scenarios(job):
+    dates, series, scenarios = run_scenarios(job.simulation, job.parameters, progress=ProgressReporter(job.pk))
+    results.write_kind(job.simulation.pk, 'scenarios', dates, series, scenarios=scenarios, parameters=job.parameters)
+    return {'series': len(series), 'periods': len(dates), 'scenarios': scenarios}
+
+
+def _run_sensitivity(job):
+    return run_sensitivity(job.simulation, job.parameters, progress=ProgressReporter(job.pk))
+
+
+KINDS = {
+    'scenarios': _run_scenarios,
+    'sensitivity': _run_sensitivity,
+}
+
+
+def _run_other(job):
+    """ Compute a job of another kind than 'run', which are not memoized """
+    started = time.monotonic()
+    try:
+        result = KINDS[job.kind](job)
+    except JobCancelled:
+        _finish(job.pk, status='cancelled')
+        return 'cancelled'
+    except EngineError as error:
+        _finish(job.pk, status='failed', error=str(error))
+        return 'failed'
+    except Exception as error:
+        _finish(job.pk, status='failed', error="%s: %s" % (type(error).__name__, error))
+        raise
+    _finish(job.pk, status='done', progress=1, result=dict(result, duration=time.monotonic() - started))
+    return 'done'
+
+
+def run_job(job_id, processes=1):
+    """ Compute a claimed job, processes > 1 shards it over a pool of processes """
+    job = SimulationJob.objects.select_related('simulation').get(pk=job_id)
+    if job.kind != 'run':
+        return _run_other(job)
+    started = time.monotonic()
+    report_freq = job.parameters.get('report_freq')
+    key = memo.run_key(job.simulation, report_freq=report_freq)
+    try:
+        cached = _install_cached(job.simulation, key)
+        if cached is None:
+            result, revisions, recomputed = run_incremental(job.simulation, progress=ProgressReporter(job.pk), processes=processes, report_freq=report_freq)
+            directory = results.write(job.simulation.pk, result, revisions)
+            # Inputs edited during the run would make the result inconsistent with the key
+            if memo.run_key(job.simulation, report_freq=report_freq) == key:
+                memo.store(key, directory)
+    except JobCancelled:
+        _finish(job_id, status='cancelled')
+        return 'cancelled'
+    except EngineError as error:
+        _finish(job_id, status='failed', error=str(error))
+        return 'failed'
+    except Exception as error:
+        _finish(job_id, status='failed', error="%s: %s" % (type(error).__name__, error))
+        raise
+
+    if cached is not None:
+        _finish(job_id, status='done', progress=1, input_hash=key, result=dict(cached, duration=time.monotonic() - started))
+        return 'done'
+    _finish(job_id, status='done', progress=1, input_hash=key, result={
+        'series': len(result.composition_ids),
+        'periods': len(result.grid),
+        'recomputed': recomputed,
+        'duration': time.monotonic() - started,
+    })
+    return 'done'
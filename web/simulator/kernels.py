@@ -0,0 +1,104 @@
+"""
+    Vectorized functions which PossibleSpecification.functions_associate can reference by name
+"""
+
+import numpy as np
+
+from .exceptions import UnitError
+from .units import DIMENSIONLESS, label, multiply, same
+
+KERNELS = {}
+
+
+def register_kernel(name, pointwise=True, time_invariant=False, causal=True, summed=False, units=None):
+    """
+        Register a vectorized function usable in PossibleSpecification.functions_associate
+        A kernel is called as kernel(values, grid, params) where values is a (..., rows, periods)
+        array and params a dict of arrays broadcastable against values.
+        A pointwise kernel computes every period from that period alone, so it can be
+        evaluated on any subset of the dates of a grid. A time invariant kernel does not read
+        the grid, so its output only changes when its input does. A kernel which is not causal
+        reads periods after the one it computes (e.g. an IRR over the whole horizon), so it
+        is always evaluated on the full grid. A summed kernel is applied to the (..., compositions,
+        periods) series of the compositions, once their elements are summed (e.g. an IRR of the
+        cash flows of a composition), so it must come after the other kernels.
+        units(dimension, parameters) gives the dimension of the output from the dimension of
+        values and {parameter name: dimension}, raising UnitError. Kernels without units
+        keep the dimension of their input
+    """
+    def decorator(function):
+        function.pointwise = pointwise
+        function.time_invariant = time_invariant
+        function.causal = causal
+        function.summed = summed
+        function.units = units
+        KERNELS[name] = function
+        return function
+    return decorator
+
+
+def _param(params, name, default):
+    return params.get(name, default)
+
+
+def _units_like(*names):
+    """
+        Unit rule of kernels whose parameters names have the dimension of the values. The defaults
+        of these parameters are in the unit of the values too, see engine.build_plan
+    """
+    def rule(dimension, parameters):
+        for name in names:
+            if not same(dimension, parameters.get(name)):
+                raise UnitError("'%s' is in %s, the values in %s." % (name, label(parameters.get(name)), label(dimension)))
+        return dimension
+    rule.scaled = names
+    return rule
+
+
+def _units_dimensionless(*names):
+    def rule(dimension, parameters):
+        for name in names:
+            if not same(DIMENSIONLESS, parameters.get(name)):
+                raise UnitError("'%s' must have no dimension, it is in %s." % (name, label(parameters.get(name))))
+        return dimension
+    return rule
+
+
+def _units_scale(dimension, parameters):
+    factor = parameters.get('factor')
+    if dimension is None or factor is None:
+        return dimension if factor is None else None
+    return multiply(dimension, factor)
+
+
+@register_kernel('value', time_invariant=True)
+def kernel_value(values, grid, params):
+    return values
+
+@register_kernel('scale', time_invariant=True, units=_units_scale)
+def kernel_scale(values, grid, params):
+    return values * _param(params, 'factor', 1.0)
+
+@register_kernel('offset', time_invariant=True, units=_units_like('amount'))
+def kernel_offset(values, grid, params):
+    return values + _param(params, 'amount', 0.0)
+
+@register_kernel('growth', units=_units_dimensionless('rate'))
+def kernel_growth(values, grid, params):
+    return values * (1.0 + _param(params, 'rate', 0.0)) ** grid.years
+
+@register_kernel('linear', units=_units_like('slope'))
+def kernel_linear(values, grid, params):
+    return values + _param(params, 'slope', 0.0) * grid.years
+
+@register_kernel('cumulative', pointwise=False)
+def kernel_cumulative(values, grid, params):
+    return np.cumsum(values, axis=-1)
+
+@register_kernel('clip', time_invariant=True, units=_units_like('lower', 'upper'))
+def kernel_clip(values, grid, params):
+    return np.clip(values, _param(params, 'lower', -np.inf), _param(params, 'upper', np.inf))
+
+
+# Financial library, registered on import
+from . import finance  # noqa: E402,F401
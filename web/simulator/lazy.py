@@ -0,0 +1,176 @@
+"""
+    Demand-driven evaluation of a few outputs of a Simulation.
+
+    A query names the compositions and the dates it needs. Only these
+    compositions are planned, so only their BaseElements and specifications
+    are read, and only the dates needed are computed: groups made of
+    pointwise kernels are evaluated on the requested dates alone (once when
+    they are time invariant), the others (e.g. cumulative) from the start of
+    the simulation up to the last requested date (see engine.step_positions).
+
+    Series already known are never recomputed. They are read from the stored
+    run of the simulation when its revision is current, or from a process-wide
+    LRU cache of computed periods keyed by (composition, revision, start, end,
+    frequency), so follow-up queries on the same compositions are memory reads.
+    The unit of every series is kept with its values.
+    The end is part of the key as non causal kernels (e.g. irr) read the whole
+    horizon: simulations sharing a start do not share their series.
+
+    Queries are computed in the request, so the API caps them at
+    SIMULATOR_QUERY_MAX_COMPOSITIONS compositions: whole simulations are
+    computed by run jobs (see jobs.py).
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from . import results
+from .engine import TimeGrid, SimulationResult, build_plan, evaluate_group, stage, step_positions
+from .exceptions import EngineError
+from .graph import reusable
+from .models import Composition
+
+
+"""
+    Process-wide LRU cache of computed periods, bounded by a number of cells
+"""
+class SeriesCache:
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict() # {(composition id, revision, first date, last date, freq): (sorted positions, values, unit)}
+        self.cells = 0
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key, positions):
+        """ Values of key at positions and their unit, or None when any of them is missing """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                known, values, unit = entry
+                index = np.minimum(np.searchsorted(known, positions), len(known) - 1)
+                if np.array_equal(known[index], positions):
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return values[index], unit
+            self.misses += 1
+        return None
+
+    def put(self, key, positions, values, unit=None):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.cells -= len(entry[0])
+                known = np.union1d(entry[0], positions)
+                merged = np.empty(len(known))
+                merged[np.searchsorted(known, entry[0])] = entry[1]
+                merged[np.searchsorted(known, positions)] = values
+                positions, values = known, merged
+            self.entries[key] = (positions, values, unit)
+            self.cells += len(positions)
+            while self.cells > self.size and len(self.entries) > 1:
+                _, (known, _, _) = self.entries.popitem(last=False)
+                self.cells -= len(known)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.cells = 0
+            self.hits = self.misses = 0
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'cells': self.cells, 'max_cells': self.size}
+
+
+cache = SeriesCache(getattr(settings, 'SIMULATOR_QUERY_CACHE_SIZE', 2 ** 24))
+
+
+def _key(composition_id, revision, grid, freq):
+    return (composition_id, revision, grid.dates[0], grid.dates[-1], freq)
+
+
+def _window(grid, start, end):
+    """ Positions of the periods of grid covering start to end, the first one being the period in effect at start """
+    dates = grid.dates.values
+    first = 0 if start is None else max(np.searchsorted(dates, np.datetime64(start, 'ns'), side='right') - 1, 0)
+    last = len(dates) if end is None else np.searchsorted(dates, np.datetime64(end, 'ns'), side='right')
+    if first >= last:
+        raise EngineError("No date of the simulation between the requested start and end.")
+    return np.arange(first, last, dtype=np.intp)
+
+
+def _stored(simulation, grid):
+    try:
+        stored = results.StoredResult(simulation.pk)
+    except results.ResultNotFound:
+        return None
+    return stored if reusable(stored, grid) else None
+
+
+def _compute(compositions, grid, positions, freq):
+    """ {composition id: values at positions} and {composition id: unit}, caching every computed period """
+    plan = build_plan(Composition.objects.filter(pk__in=list(compositions)).order_by('pk'))
+    series, unit_labels = {}, plan.unit_labels()
+    for group in plan.groups:
+        steps = step_positions(group, grid, positions)
+        # A time invariant group is evaluated once and broadcast
+        computed = positions if group.time_invariant else steps
+        sub_grid = grid.take(steps)
+        for begin, end in group.chunks(len(sub_grid)):
+            block = evaluate_group(group, sub_grid, plan.values, begin, end)
+            block = np.broadcast_to(block, block.shape[:-1] + (len(computed),))
+            for composition_id, values in zip(group.composition_ids[begin:end], block):
+                cache.put(_key(composition_id, compositions[composition_id], grid, freq), computed, values, unit_labels[composition_id])
+                series[composition_id] = values[np.searchsorted(computed, positions)]
+    return series, unit_labels
+
+
+@stage('query')
+def query(simulation, composition_ids=None, start=None, end=None, freq='D'):
+    """
+        Series of some compositions of a simulation between start and end, computing only what is
+        not known yet. start == end gives the values in effect at that date.
+        Returns the dates, {series name: values} and {series name: unit}
+    """
+    grid = TimeGrid.between(simulation.start, simulation.end, freq)
+    positions = _window(grid, start, end)
+    compositions = simulation.compositions.order_by('pk')
+    if composition_ids is not None:
+        compositions = compositions.filter(pk__in=list(composition_ids))
+    revisions = dict(compositions.values_list('pk', 'revision'))
+    if composition_ids is not None:
+        unknown = set(composition_ids) - set(revisions)
+        if unknown:
+            raise EngineError("Compositions %s are not part of the simulation." % ', '.join(map(str, sorted(unknown))))
+
+    series, unit_labels, missing = {}, {}, {}
+    for composition_id, revision in revisions.items():
+        cached = cache.get(_key(composition_id, revision, grid, freq), positions)
+        if cached is None:
+            missing[composition_id] = revision
+        else:
+            series[composition_id], unit_labels[composition_id] = cached
+
+    stored = _stored(simulation, grid) if missing else None
+    if stored is not None:
+        for composition_id, revision in list(missing.items()):
+            name = SimulationResult.series_name(composition_id)
+            if stored.revisions.get(name) == revision:
+                series[composition_id] = np.asarray(stored.series(name)[positions])
+                unit_labels[composition_id] = stored.units.get(name)
+                del missing[composition_id]
+
+    if missing:
+        computed, computed_units = _compute(missing, grid, positions, freq)
+        series.update(computed)
+        unit_labels.update(computed_units)
+    names = {composition_id: SimulationResult.series_name(composition_id) for composition_id in revisions}
+    return (
+        grid.dates.values[positions],
+        {name: series[composition_id] for composition_id, name in names.items()},
+        {name: unit_labels[composition_id] for composition_id, name in names.items()},
+    )
@@ -0,0 +1,65 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from simulator import benchmarks, portfolio
+from simulator.models import Simulation
+
+
+class Command(BaseCommand):
+    help = "Time the API endpoints and the engine on a portfolio, and fail when a metric regressed past a baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--simulation', type=int, help="Benchmark the portfolio of this simulation instead of a generated one")
+        parser.add_argument('--compositions', type=int, default=1000, help="Size of the generated portfolio")
+        parser.add_argument('--elements-per-composition', type=int, default=10)
+        parser.add_argument('--years', type=int, default=30)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=3, help="Timed runs of every benchmark")
+        parser.add_argument('--output', help="Write the results to this JSON file")
+        parser.add_argument('--baseline', help="JSON results of a previous run to compare with")
+        parser.add_argument('--tolerance', type=float, default=benchmarks.TOLERANCE, help="Allowed relative slowdown and memory growth")
+        parser.add_argument('--save-baseline', action='store_true', help="Write the results to --baseline instead of comparing")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['save_baseline'] and not options['baseline']:
+            raise CommandError("--save-baseline requires --baseline.")
+        if options['baseline'] and not options['save_baseline']:
+            try:
+                with open(options['baseline']) as source:
+                    baseline = json.load(source)
+            except (OSError, ValueError) as error:
+                raise CommandError("Cannot read the baseline: %s" % error)
+
+        generated = options['simulation'] is None
+        if generated:
+            simulation = portfolio.generate(
+                'benchmark', options['compositions'], options['elements_per_composition'],
+                years=options['years'], seed=options['seed']
+            )
+        else:
+            simulation = Simulation.objects.filter(pk=options['simulation']).first()
+            if simulation is None:
+                raise CommandError("Simulation %s does not exist." % options['simulation'])
+        try:
+            document = benchmarks.run(simulation, options['repeat'], progress=lambda name: self.stderr.write("Running %s" % name))
+        finally:
+            if generated:
+                portfolio.delete(simulation)
+
+        for name, metrics in sorted(document['metrics'].items()):
+            self.stdout.write("%-36s %10.2f ms %6s queries %10.1f KiB peak" % (name, metrics['seconds'] * 1000, metrics['queries'], metrics['peak_bytes'] / 1024))
+        for path in [options['output']] + ([options['baseline']] if options['save_baseline'] else []):
+            if path:
+                with open(path, 'w') as output:
+                    json.dump(document, output, indent=2)
+
+        if baseline is None:
+            return
+        if baseline.get('portfolio', {}).get('compositions') != document['portfolio']['compositions']:
+            self.stderr.write("The baseline was measured on another portfolio, comparisons are approximate")
+        regressions = benchmarks.compare(document, baseline, options['tolerance'])
+        if regressions:
+            raise CommandError("%s regression(s):\n%s" % (len(regressions), '\n'.join(regressions)))
+        self.stdout.write("No regression against %s" % options['baseline'])
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from simulator import portfolio
+from simulator.models import Simulation
+
+
+class Command(BaseCommand):
+    help = "Create a synthetic portfolio (elements, specifications, compositions and their simulation) for benchmarks and load tests"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--name', default='synthetic', help="Title of the simulation, prefix of the specification names")
+        parser.add_argument('--compositions', type=int, default=1000)
+        parser.add_argument('--elements-per-composition', type=int, default=10)
+        parser.add_argument('--specifications', type=int, default=len(portfolio.TEMPLATES), help="Number of distinct PossibleSpecifications")
+        parser.add_argument('--years', type=int, default=30, help="Length of the simulation")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--delete', type=int, metavar='SIMULATION', help="Delete the portfolio of this simulation instead")
+
+    def handle(self, *args, **options):
+        if options['delete'] is not None:
+            simulation = Simulation.objects.filter(pk=options['delete']).first()
+            if simulation is None:
+                raise CommandError("Simulation %s does not exist." % options['delete'])
+            portfolio.delete(simulation)
+            self.stdout.write("Portfolio of simulation %s deleted" % options['delete'])
+            return
+
+        if options['compositions'] < 1 or options['elements_per_composition'] < 1 or options['years'] < 1:
+            raise CommandError("--compositions, --elements-per-composition and --years must be positive.")
+        started = time.perf_counter()
+        simulation = portfolio.generate(
+            options['name'], options['compositions'], options['elements_per_composition'],
+            options['specifications'], options['years'], options['seed']
+        )
+        self.stdout.write("Simulation %s created with %s compositions in %.1f s" % (simulation.pk, options['compositions'], time.perf_counter() - started))
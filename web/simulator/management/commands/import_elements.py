@@ -0,0 +1,30 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from simulator import bulk
+
+
+class Command(BaseCommand):
+    help = "Import BaseElement rows or BaseElementValue series (base_element, date, value points) from a CSV or JSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or JSON file, JSON being a list of objects")
+        parser.add_argument('--model', choices=sorted(bulk.IMPORTERS), default='base_element')
+        parser.add_argument('--format', choices=bulk.FORMATS, help="Defaults to the extension of the file")
+        parser.add_argument('--chunk-size', type=int, default=bulk.CHUNK_SIZE, help="Rows validated and written per transaction")
+        parser.add_argument('--report', help="Write the per-row error report to this JSON file")
+
+    def handle(self, *args, **options):
+        try:
+            records = bulk.read_records(options['path'], options['format'], options['path'])
+        except (bulk.BulkImportError, OSError) as error:
+            raise CommandError(str(error))
+
+        report = bulk.IMPORTERS[options['model']](records, chunk_size=options['chunk_size']).as_dict()
+        if options['report']:
+            with open(options['report'], 'w') as output:
+                json.dump(report, output, indent=2)
+        for error in report['errors'][:20]:
+            self.stderr.write("Row %s: %s" % (error['row'], error['errors']))
+        self.stdout.write("%s created, %s updated, %s rejected" % (report['created'], report['updated'], len(report['errors'])))
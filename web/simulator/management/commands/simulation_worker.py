@@ -0,0 +1,90 @@
+import logging
+import multiprocessing
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from simulator import jobs
+
+logger = logging.getLogger('simulator.worker')
+
+
+def _initialize():
+    # Forked after the handler of the main process was installed
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = "Run queued simulation jobs on a pool of processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=getattr(settings, 'SIMULATOR_WORKER_PROCESSES', None) or multiprocessing.cpu_count(),
+                            help="Number of simulations computed at the same time")
+        parser.add_argument('--shards', type=int, default=getattr(settings, 'SIMULATOR_SHARD_PROCESSES', 1),
+                            help="Number of processes sharing the computation of one simulation")
+        parser.add_argument('--poll', type=float, default=getattr(settings, 'SIMULATOR_WORKER_POLL', 2.0),
+                            help="Seconds between two checks of the queue when it is empty")
+        parser.add_argument('--once', action='store_true', help="Stop when the queue is empty")
+
+    def handle(self, *args, **options):
+        processes, shards, name = options['processes'], options['shards'], jobs.worker_name()
+        # Pool processes are not daemonic, so each job can start its own shard pool
+        executor = ProcessPoolExecutor(processes, initializer=_initialize)
+        signal.signal(signal.SIGTERM, self.stop)
+        self.stdout.write("Worker %s started with %s processes and %s shard(s) per job" % (name, processes, shards))
+
+        running = {} # {future: job id}
+        try:
+            while True:
+                broken = False
+                for future in [future for future in running if future.done()]:
+                    broken |= self.collect(future, running.pop(future), name)
+                if broken:
+                    # A dead process breaks the whole pool: every job it ran is put back in the queue
+                    executor.shutdown(wait=True)
+                    for future in list(running):
+                        self.collect(future, running.pop(future), name)
+                    executor = ProcessPoolExecutor(processes, initializer=_initialize)
+                jobs.heartbeat(name)
+                claimed = jobs.claim(name, processes - len(running)) if len(running) < processes else []
+                # Processes forked by submit must not share the connection of this one
+                connections.close_all()
+                for job in claimed:
+                    self.stdout.write("Running job %s" % job.pk)
+                    running[executor.submit(jobs.run_job, job.pk, shards)] = job.pk
+                if options['once'] and not claimed and not running:
+                    break
+                if not claimed:
+                    time.sleep(options['poll'])
+        except KeyboardInterrupt:
+            # The pool processes are the children of this process
+            for process in multiprocessing.active_children():
+                process.terminate()
+            executor.shutdown(wait=True, cancel_futures=True)
+            count = jobs.requeue(name)
+            self.stdout.write("Worker stopped, %s job(s) put back in the queue" % count)
+        else:
+            executor.shutdown(wait=True)
+
+    def collect(self, future, job_id, worker):
+        """ Log the error of a finished job, requeue it when its process died and return whether it did """
+        try:
+            future.result()
+        except BrokenProcessPool:
+            logger.error("The process running job %s died, the job is put back in the queue.", job_id)
+            jobs.requeue(worker, [job_id])
+            return True
+        except Exception:
+            # run_job marked the job as failed
+            logger.exception("Job %s failed.", job_id)
+        return False
+
+    def stop(self, signum, frame):
+        raise KeyboardInterrupt()
@@ -0,0 +1,104 @@
+"""
+    Content-addressed memoization of whole simulation runs.
+
+    The key of a run is a hash of everything its output depends on: the time
+    axis, the compositions, the BaseElements feeding them and the content of
+    their PossibleSpecifications. Completed runs are kept on disk under
+    SIMULATOR_RUN_CACHE_ROOT/<key>/ in the columnar layout of results.py, and
+    installed into the result store of a simulation with hard links on a hit.
+    The cache is bounded to SIMULATOR_RUN_CACHE_SIZE bytes, least recently
+    used entries being evicted first.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from django.conf import settings
+
+from . import results
+from .compiler import specification_hash
+from .engine import ENGINE_VERSION
+from .models import Composition, Specification
+
+_lock = threading.Lock()
+
+
+def _root():
+    return str(getattr(settings, 'SIMULATOR_RUN_CACHE_ROOT', os.path.join(settings.BASE_DIR, 'run_cache')))
+
+
+def _limit():
+    return getattr(settings, 'SIMULATOR_RUN_CACHE_SIZE', 2 * 1024 ** 3)
+
+
+def _directory(key):
+    return os.path.join(_root(), key)
+
+
+def run_key(simulation, freq='D', report_freq=None):
+    """ Canonical hash of the input graph of a simulation, computed with three flat queries """
+    composition_ids = sorted(simulation.compositions.values_list('pk', flat=True))
+    elements = list(
+        Composition.base_elements.through.objects
+        .filter(composition_id__in=composition_ids)
+        .order_by('composition_id', 'baseelement_id')
+        .values_list('composition_id', 'baseelement_id', 'baseelement__label', 'baseelement__value', 'baseelement__unit', 'baseelement__unit_separator')
+    )
+    specifications = [
+        (composition_id, specification_id, specification_hash(functions, parameters) if possible_id else None)
+        for composition_id, specification_id, possible_id, functions, parameters in
+        Specification.objects.filter(composition_id__in=composition_ids)
+        .order_by('composition_id', 'pk', 'specifications_possible__pk')
+        .values_list('composition_id', 'pk', 'specifications_possible__pk', 'specifications_possible__functions_associate', 'specifications_possible__functions_parameters')
+    ]
+    content = json.dumps({
+        'engine': ENGINE_VERSION,
+        'horizon': [simulation.start.isoformat(), simulation.end.isoformat(), freq, report_freq],
+        'compositions': composition_ids,
+        'elements': elements,
+        'specifications': specifications,
+    }, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def lookup(key):
+    """ Directory of a cached run, or None """
+    directory = _directory(key)
+    if not os.path.exists(os.path.join(directory, results.INDEX)):
+        return None
+    # The modification time of the entry is its last use
+    os.utime(directory)
+    return directory
+
+
+def store(key, source):
+    """ Keep the columnar directory source as the cached run of key, an existing entry being a hit """
+    os.makedirs(_root(), exist_ok=True)
+    # Entries are never replaced: a run with the same key stored meanwhile has the same content
+    if lookup(key) is None:
+        results.link_directory(source, _directory(key), replace=False)
+    evict()
+
+
+def _size(directory):
+    return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+
+def evict(limit=None):
+    """ Remove least recently used entries until the cache fits in limit bytes """
+    limit = _limit() if limit is None else limit
+    with _lock:
+        entries = []
+        for entry in os.scandir(_root()):
+            if entry.is_dir() and not entry.name.startswith('.'):
+                entries.append((entry.stat().st_mtime, _size(entry.path), entry.path))
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= limit:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+    return total
@@ -0,0 +1,326 @@
+"""
+    Performance instrumentation, exposed in the Prometheus text format at /metrics.
+
+    MetricsMiddleware records for every request, labelled by view name, its
+    latency, the number and duration of its database queries (counted with a
+    connection execute_wrapper, so DEBUG is not needed) and the size of its
+    response, streamed responses being measured once sent. The engine stages
+    (plan, evaluate, store, query) are timed through engine.STAGE_HOOKS.
+
+    Metrics live in the process recording them. When SIMULATOR_METRICS_DIR is
+    set, every process also writes a snapshot of its metrics to that
+    directory at most every FLUSH_INTERVAL seconds (and at the end of every
+    job for the workers), and /metrics serves the sum of the snapshots, so that
+    the simulation workers and all the server processes are counted.
+    Processes come and go (gunicorn recycles its workers after max_requests):
+    when /metrics is served, the snapshots of the processes of this host which
+    are not alive any more are added to the <hostname>-exited.json snapshot and
+    removed, so the directory keeps one file per live process and the counts
+    of the exited ones are not lost.
+
+    Requests slower than SIMULATOR_SLOW_REQUEST_SECONDS, when set, are logged
+    on the 'simulator.slow_requests' logger with their slowest statements and
+    the statements they repeated, which is how N+1 queries show up.
+"""
+
+import atexit
+import fcntl
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+from . import engine
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+FLUSH_INTERVAL = 5.0
+EXITED = 'exited'
+LOGGED_STATEMENTS = 10
+# name: (help, buckets)
+HISTOGRAMS = {
+    'simulator_http_request_duration_seconds': (
+        "Latency of the requests by view, method and status",
+        (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    ),
+    'simulator_http_db_queries': (
+        "Database queries per request by view",
+        (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+    ),
+    'simulator_http_db_duration_seconds': (
+        "Database time per request by view",
+        (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    ),
+    'simulator_http_response_bytes': (
+        "Size of the response bodies by view",
+        (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864),
+    ),
+    'simulator_engine_stage_duration_seconds': (
+        "Duration of the simulation stages",
+        (0.001, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900),
+    ),
+}
+
+logger = logging.getLogger('simulator.slow_requests')
+
+
+def _snapshot_path(directory, process):
+    return os.path.join(directory, '%s-%s.json' % (socket.gethostname(), process))
+
+
+"""
+    Histograms of the current process, {(name, labels): [count per bucket..., +Inf count, sum]}
+"""
+class Registry:
+
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.flushed = 0.0
+
+    def observe(self, name, labels, value):
+        buckets = HISTOGRAMS[name][1]
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            counts = self.histograms.get(key)
+            if counts is None:
+                counts = self.histograms[key] = [0] * (len(buckets) + 2)
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[len(buckets)] += 1
+            counts[-1] += value
+
+    def snapshot(self):
+        with self.lock:
+            return [[name, list(labels), list(counts)] for (name, labels), counts in self.histograms.items()]
+
+    def flush(self, force=False):
+        """ Write the snapshot of the process to SIMULATOR_METRICS_DIR when it is set """
+        directory = getattr(settings, 'SIMULATOR_METRICS_DIR', None)
+        if not directory or (not force and time.monotonic() - self.flushed < FLUSH_INTERVAL):
+            return
+        self.flushed = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        path = _snapshot_path(directory, os.getpid())
+        with open(path + '.tmp', 'w') as output:
+            json.dump(self.snapshot(), output)
+        os.replace(path + '.tmp', path)
+
+
+registry = Registry()
+atexit.register(registry.flush, force=True)
+
+
+def _read(path):
+    """ Snapshot stored at path, None when it was removed or is being replaced """
+    try:
+        with open(path) as source:
+            return json.load(source)
+    except (OSError, ValueError):
+        return None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running under another user
+        return True
+    return True
+
+
+def _merge(totals, snapshot):
+    """ Add the counts of snapshot to totals, {(name, labels): counts} """
+    for name, labels, counts in snapshot:
+        if name not in HISTOGRAMS:
+            continue
+        key = (name, tuple(tuple(pair) for pair in labels))
+        current = totals.setdefault(key, [0] * len(counts))
+        for index, count in enumerate(counts):
+            current[index] += count
+    return totals
+
+
+def _prune(directory):
+    """ Add the snapshots of the exited processes of this host to its exited snapshot and remove them """
+    prefix = '%s-' % socket.gethostname()
+    dead = []
+    for filename in os.listdir(directory):
+        pid = filename[len(prefix):-len('.json')]
+        if filename.startswith(prefix) and filename.endswith('.json') and pid.isdigit() and not _alive(int(pid)):
+            dead.append(os.path.join(directory, filename))
+    if not dead:
+        return
+    exited = _snapshot_path(directory, EXITED)
+    totals = _merge({}, _read(exited) or [])
+    for path in dead:
+        _merge(totals, _read(path) or [])
+    with open(exited + '.tmp', 'w') as output:
+        json.dump([[name, list(labels), counts] for (name, labels), counts in totals.items()], output)
+    os.replace(exited + '.tmp', exited)
+    for path in dead:
+        os.remove(path)
+
+
+def _snapshots():
+    """ Snapshots of every process, or of the current one """
+    directory = getattr(settings, 'SIMULATOR_METRICS_DIR', None)
+    if not directory:
+        return [registry.snapshot()]
+    registry.flush(force=True)
+    # Serving processes prune and read one at a time, so that no count is read twice or merged twice
+    with open(os.path.join(directory, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        _prune(directory)
+        snapshots = []
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith('.json'):
+                snapshot = _read(os.path.join(directory, filename))
+                if snapshot is not None:
+                    snapshots.append(snapshot)
+    return snapshots
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"')) for key, value in pairs)
+
+
+def render():
+    """ Prometheus text exposition of the summed snapshots """
+    totals = {}
+    for snapshot in _snapshots():
+        _merge(totals, snapshot)
+
+    lines = []
+    for name, (description, buckets) in HISTOGRAMS.items():
+        lines.append('# HELP %s %s' % (name, description))
+        lines.append('# TYPE %s histogram' % name)
+        for (metric, labels), counts in sorted(totals.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], counts):
+                cumulative += count
+                lines.append('%s_bucket%s %s' % (name, _labels(labels, [('le', bound)]), cumulative))
+            lines.append('%s_sum%s %r' % (name, _labels(labels), float(counts[-1])))
+            lines.append('%s_count%s %s' % (name, _labels(labels), cumulative))
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
+
+
+def observe_stage(name, seconds):
+    registry.observe('simulator_engine_stage_duration_seconds', {'stage': name}, seconds)
+    registry.flush()
+
+
+engine.STAGE_HOOKS.append(observe_stage)
+
+
+"""
+    Database queries of a request, through connection.execute_wrapper
+"""
+class QueryRecorder:
+
+    def __init__(self, statements=False):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = [] if statements else None # [(seconds, sql)]
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = time.perf_counter() - started
+            self.count += 1
+            self.seconds += seconds
+            if self.statements is not None:
+                self.statements.append((seconds, sql))
+
+
+def _slow_request_seconds():
+    return getattr(settings, 'SIMULATOR_SLOW_REQUEST_SECONDS', None)
+
+
+def _log_slow_request(request, status, seconds, queries):
+    repeated = Counter(sql for duration, sql in queries.statements)
+    lines = ["%s %s answered %s in %.3f s, %s queries in %.3f s" % (request.method, request.get_full_path(), status, seconds, queries.count, queries.seconds)]
+    for duration, sql in sorted(queries.statements, key=lambda statement: -statement[0])[:LOGGED_STATEMENTS]:
+        lines.append("  %.4f s  %s" % (duration, sql))
+    for sql, count in repeated.most_common(LOGGED_STATEMENTS):
+        if count > 1:
+            lines.append("  repeated %s times  %s" % (count, sql))
+    logger.warning('\n'.join(lines))
+
+
+def _recording(queries):
+    """ Context manager passing the queries of every database connection to queries """
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(queries))
+    return stack
+
+
+def _streamed(content, queries, done):
+    """ content of a streaming response, its queries being recorded and its size measured """
+    size = 0
+    try:
+        with _recording(queries):
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+    finally:
+        done(size)
+
+
+"""
+    Latency, queries and response size of every request, by view name.
+    Streaming responses are recorded once their content is sent, with the queries made meanwhile
+"""
+class MetricsMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        threshold = _slow_request_seconds()
+        queries = QueryRecorder(statements=threshold is not None)
+        started = time.perf_counter()
+        with _recording(queries):
+            response = self.get_response(request)
+
+        def done(size):
+            seconds = time.perf_counter() - started
+            match = getattr(request, 'resolver_match', None)
+            view = match.view_name if match is not None else 'unresolved'
+            registry.observe('simulator_http_request_duration_seconds', {'view': view, 'method': request.method, 'status': response.status_code}, seconds)
+            registry.observe('simulator_http_db_queries', {'view': view}, queries.count)
+            registry.observe('simulator_http_db_duration_seconds', {'view': view}, queries.seconds)
+            registry.observe('simulator_http_response_bytes', {'view': view}, size)
+            registry.flush()
+            if threshold is not None and seconds >= threshold:
+                _log_slow_request(request, response.status_code, seconds, queries)
+
+        if response.streaming:
+            response.streaming_content = _streamed(response.streaming_content, queries, done)
+        else:
+            done(len(response.content))
+        return response
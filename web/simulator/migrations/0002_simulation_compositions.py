@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 07:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulator', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='simulation',
+            name='compositions',
+            field=models.ManyToManyField(blank=True, to='simulator.Composition'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 07:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulator', '0003_simulationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='composition',
+            name='revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
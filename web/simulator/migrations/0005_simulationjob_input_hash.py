@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 07:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulator', '0004_composition_revision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='simulationjob',
+            name='input_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-17 07:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulator', '0005_simulationjob_input_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='baseelement',
+            name='distribution',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='simulationjob',
+            name='kind',
+            field=models.CharField(choices=[('run', 'Run'), ('scenarios', 'Scenarios')], default='run', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='simulationjob',
+            name='parameters',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 07:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulator', '0006_scenarios'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='simulationjob',
+            name='kind',
+            field=models.CharField(choices=[('run', 'Run'), ('scenarios', 'Scenarios'), ('sensitivity', 'Sensitivity')], default='run', max_length=16),
+        ),
+    ]
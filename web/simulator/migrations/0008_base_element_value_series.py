@@ -0,0 +1,38 @@
+# Generated by Django 3.2.25 on 2026-10-17 07:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulator', '0007_sensitivity_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='baseelementvalue',
+            name='freq',
+            field=models.CharField(blank=True, default='D', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='baseelementvalue',
+            name='length',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='baseelementvalue',
+            name='offsets',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='baseelementvalue',
+            name='start',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='baseelementvalue',
+            name='values',
+            field=models.BinaryField(blank=True, default=bytes),
+        ),
+    ]
@@ -6,7 +6,12 @@ class Enums:
     UNIT = (
         (None, ''),
         ("W", "Watt"),
-        ("$", "Dollar")
+        ("kW", "Kilowatt"),
+        ("MW", "Megawatt"),
+        ("GW", "Gigawatt"),
+        ("$", "Dollar"),
+        ("k$", "Thousand dollars"),
+        ("M$", "Million dollars")
     )
 
     UNIT_SEPARATOR = (
@@ -14,6 +19,30 @@ class Enums:
         ('/', 'By')
     )
 
+    JOB_KIND = (
+        ('run', 'Run'),
+        ('scenarios', 'Scenarios'),
+        ('sensitivity', 'Sensitivity')
+    )
+
+    JOB_STATUS = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled')
+    )
+
+"""
+    Deletes mark the compositions depending on the deleted rows with one UPDATE instead
+    of one per row, see graph.delete_marked
+"""
+class MarkedQuerySet(models.QuerySet):
+
+    def delete(self):
+        from .graph import delete_marked
+        return delete_marked(self, super().delete)
+
 class Simulation(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField()
@@ -21,6 +50,7 @@ class Simulation(models.Model):
     description = models.TextField()
     start = models.DateTimeField()
     end = models.DateTimeField()
+    compositions = models.ManyToManyField('Composition', blank=True)
     #user = models.ForeignKey('User', on_delete=models.CASCADE)
 
     def __str__(self) -> str:
@@ -34,12 +64,20 @@ class BaseElement(models.Model):
     value = models.FloatField()
     unit = models.JSONField() #{'value1': UNIT, 'value2': UNIT }
     unit_separator = models.CharField(max_length=3, choices=Enums.UNIT_SEPARATOR, default=None)
+    distribution = models.JSONField(null=True, blank=True) # uncertainty of value for scenario runs, see scenarios.py
+
+    objects = MarkedQuerySet.as_manager()
 
 """
-    Define a value of baseElement's values 
+    Define a value of baseElement's values: a whole time series packed in binary columns, see timeseries.py
 """
 class BaseElementValue(models.Model):
     base_element = models.ForeignKey(BaseElement, on_delete=models.CASCADE)
+    start = models.DateTimeField(null=True, blank=True)
+    freq = models.CharField(max_length=16, blank=True, default='D') # pandas offset alias, empty when the dates are irregular
+    length = models.PositiveIntegerField(default=0)
+    values = models.BinaryField(default=bytes, blank=True) # little endian float64
+    offsets = models.BinaryField(null=True, blank=True) # delta encoded uint32 seconds of irregular dates
 
 """
     List all specification which are possible in the system
@@ -49,6 +87,8 @@ class PossibleSpecification(models.Model):
     functions_associate = models.JSONField() #{function_name: function_associate}
     functions_parameters = models.JSONField() # {parameter_name: variable_type}
 
+    objects = MarkedQuerySet.as_manager()
+
 """
     Define calculation's rules of the system for a given Composition
 """
@@ -56,9 +96,39 @@ class Specification(models.Model):
     composition = models.ForeignKey('Composition', on_delete=models.CASCADE)
     specifications_possible = models.ManyToManyField(PossibleSpecification)
 
+    objects = MarkedQuerySet.as_manager()
+
 
 """
     Define a composition of baseElements with its calculation's rules
 """
 class Composition(models.Model):
-    base_elements = models.ManyToManyField(BaseElement)
\ No newline at end of file
+    base_elements = models.ManyToManyField(BaseElement)
+    revision = models.PositiveIntegerField(default=0) # bumped whenever an input of the composition changes
+
+    objects = MarkedQuerySet.as_manager()
+
+"""
+    Queued computation of a Simulation, executed by the simulation_worker command
+"""
+class SimulationJob(models.Model):
+    simulation = models.ForeignKey(Simulation, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=16, choices=Enums.JOB_KIND, default='run')
+    parameters = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=16, choices=Enums.JOB_STATUS, default='pending', db_index=True)
+    progress = models.FloatField(default=0)
+    cancel_requested = models.BooleanField(default=False)
+    worker = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    result = models.JSONField(default=dict, blank=True)
+    input_hash = models.CharField(max_length=64, blank=True, db_index=True) # see memo.run_key
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True) # last sign of life of the worker running the job, see jobs.reclaim
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self) -> str:
+        return "%s (%s)" % (self.simulation, self.status)
@@ -0,0 +1,11 @@
+from rest_framework.pagination import CursorPagination
+
+"""
+    Keyset pagination on the primary key: every page is an indexed range scan,
+    however deep the client goes
+"""
+class KeysetPagination(CursorPagination):
+    ordering = 'pk'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
@@ -0,0 +1,112 @@
+"""
+    Synthetic portfolios for benchmarks and load tests.
+
+    generate() creates BaseElements, PossibleSpecifications drawn from
+    TEMPLATES, Compositions with their Specifications and a Simulation over
+    all of them, with bulk inserts only. The same seed gives the same
+    portfolio. The simulation is titled after the portfolio and the names of
+    its PossibleSpecifications start with it, so delete() can find them.
+"""
+
+import datetime
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import apicache
+from .models import BaseElement, Composition, PossibleSpecification, Simulation, Specification
+
+BATCH_SIZE = 5000
+
+# (functions_associate, functions_parameters, {parameter: (low, high)} of the elements feeding parameters)
+TEMPLATES = [
+    ({'base': 'value'}, {}, {}),
+    ({'index': 'growth'}, {'rate': 'float'}, {'rate': (0.0, 0.06)}),
+    ({'index': 'indexation'}, {'inflation': {'type': 'float', 'default': 0.02}, 'lag': {'type': 'float', 'default': 1}}, {}),
+    ({'tariff': 'tariff_escalation'}, {'escalation': 'float', 'interval': {'type': 'float', 'default': 1}}, {'escalation': (0.0, 0.04)}),
+    ({'scale': 'scale', 'offset': 'offset'}, {'factor': 'float', 'amount': {'type': 'float', 'default': 0}}, {'factor': (0.5, 1.5)}),
+    ({'total': 'cumulative'}, {}, {}),
+    ({'loan': 'amortization'}, {'interest_rate': 'float', 'term': {'type': 'int', 'default': 20}}, {'interest_rate': (0.01, 0.07)}),
+    ({'book': 'straight_line'}, {'life': {'type': 'float', 'default': 25}, 'salvage': {'type': 'float', 'default': 0}}, {}),
+]
+UNITS = [{'value1': '$'}, {'value1': 'k$'}, {'value1': 'W'}, {'value1': 'kW'}]
+
+
+def _max_pk(model):
+    return model.objects.aggregate(last=Max('pk'))['last'] or 0
+
+
+def _created(model, objects, last):
+    """ pks of bulk created objects, read back on databases which do not return them """
+    if all(instance.pk is not None for instance in objects):
+        return [instance.pk for instance in objects]
+    return list(model.objects.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True))
+
+
+def _bulk_create(model, objects):
+    last = _max_pk(model)
+    model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+    return _created(model, objects, last)
+
+
+def generate(name='synthetic', compositions=1000, elements_per_composition=10, specifications=4, years=30, seed=0):
+    """ Create a portfolio and return its Simulation """
+    rng = np.random.default_rng(seed)
+    templates = [TEMPLATES[index % len(TEMPLATES)] for index in range(max(specifications, 1))]
+
+    with transaction.atomic():
+        # bulk_create sends no signal
+        apicache.bump(BaseElement, PossibleSpecification, Composition, Specification, Simulation)
+        possible_ids = _bulk_create(PossibleSpecification, [
+            PossibleSpecification(specification_name='%s-%s' % (name, index), functions_associate=functions, functions_parameters=parameters)
+            for index, (functions, parameters, fed) in enumerate(templates)
+        ])
+
+        # Every composition uses one template; each of its units is used by whole compositions so they sum
+        chosen = rng.integers(0, len(templates), compositions)
+        units = rng.integers(0, len(UNITS), compositions)
+        elements, owners = [], []
+        for composition, (template, unit) in enumerate(zip(chosen, units)):
+            for index in range(elements_per_composition):
+                elements.append(BaseElement(label='%s-%s-%s' % (name, composition, index), value=float(rng.uniform(1, 1000)), unit=UNITS[unit], unit_separator='/'))
+                owners.append(composition)
+            for parameter, (low, high) in templates[template][2].items():
+                elements.append(BaseElement(label=parameter, value=float(rng.uniform(low, high)), unit={}, unit_separator='/'))
+                owners.append(composition)
+        element_ids = _bulk_create(BaseElement, elements)
+
+        composition_ids = _bulk_create(Composition, [Composition() for composition in range(compositions)])
+        Composition.base_elements.through.objects.bulk_create([
+            Composition.base_elements.through(composition_id=composition_ids[owner], baseelement_id=element_id)
+            for owner, element_id in zip(owners, element_ids)
+        ], batch_size=BATCH_SIZE)
+
+        specification_ids = _bulk_create(Specification, [Specification(composition_id=composition_id) for composition_id in composition_ids])
+        Specification.specifications_possible.through.objects.bulk_create([
+            Specification.specifications_possible.through(specification_id=specification_id, possiblespecification_id=possible_ids[template])
+            for specification_id, template in zip(specification_ids, chosen)
+        ], batch_size=BATCH_SIZE)
+
+        start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        simulation = Simulation.objects.create(
+            updated_at=timezone.now(), title=name, description="Synthetic portfolio, seed %s" % seed,
+            start=start, end=start + datetime.timedelta(days=int(365.25 * years))
+        )
+        Simulation.compositions.through.objects.bulk_create([
+            Simulation.compositions.through(simulation_id=simulation.pk, composition_id=composition_id)
+            for composition_id in composition_ids
+        ], batch_size=BATCH_SIZE)
+    return simulation
+
+
+def delete(simulation):
+    """ Delete a generated portfolio: its simulation, compositions, elements and specifications """
+    name = simulation.title
+    with transaction.atomic():
+        compositions = Composition.objects.filter(simulation=simulation)
+        BaseElement.objects.filter(composition__in=compositions).delete()
+        compositions.delete()
+        PossibleSpecification.objects.filter(specification_name__startswith='%s-' % name).delete()
+        simulation.delete()
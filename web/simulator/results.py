@@ -0,0 +1,258 @@
+"""
+    Columnar store of simulation outputs.
+
+    Every run of a Simulation is written under SIMULATOR_RESULTS_ROOT/<simulation id>/
+    (<simulation id>.<kind>/ for other kinds of outputs, such as scenario statistics)
+    as one .npy file per output series, a dates.npy file holding the time axis
+    and an index.json describing them. Files are opened with memory mapping, so
+    a range query only reads the pages of the requested periods and series.
+
+    That path is a symbolic link to a versioned directory (.<name>-<uuid>) in
+    the same root. A write fills a new version and publishes it by renaming a
+    new link over the old one, a single atomic operation: readers resolve the
+    link once and see either version whole, and concurrent writers never
+    collide, the last rename winning. Replaced versions are removed by later
+    writes once SIMULATOR_RESULTS_RETENTION seconds have passed, so readers
+    opening their series lazily can finish.
+"""
+
+import json
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.utils import timezone
+
+from .engine import ENGINE_VERSION, stage
+
+DATES = 'dates'
+INDEX = 'index.json'
+
+
+class ResultNotFound(Exception):
+    pass
+
+
+def _root():
+    return str(getattr(settings, 'SIMULATOR_RESULTS_ROOT', os.path.join(settings.BASE_DIR, 'results')))
+
+
+KINDS = ('run', 'scenarios')
+
+
+def _directory(simulation_id, kind='run'):
+    name = str(simulation_id) if kind == 'run' else '%s.%s' % (simulation_id, kind)
+    return os.path.join(_root(), name)
+
+
+def _retention():
+    return getattr(settings, 'SIMULATOR_RESULTS_RETENTION', 600)
+
+
+def _temporary(root, name):
+    os.makedirs(root, exist_ok=True)
+    temporary = os.path.join(root, '.%s-%s' % (name, uuid.uuid4().hex))
+    os.makedirs(temporary)
+    return temporary
+
+
+def _versions(directory):
+    """ Paths of the versions of directory, published or not """
+    root, name = os.path.split(directory)
+    prefix = '.%s-' % name
+    try:
+        return [entry.path for entry in os.scandir(root) if entry.name.startswith(prefix) and entry.is_dir(follow_symlinks=False)]
+    except FileNotFoundError:
+        return []
+
+
+def json_values(values):
+    """ Nested lists of values, non finite values (e.g. an IRR which does not converge) as None for JSON """
+    values = np.asarray(values, dtype=float)
+    return np.where(np.isfinite(values), values, None).tolist()
+
+
+def _write_index(directory, index):
+    with open(os.path.join(directory, INDEX), 'w') as output:
+        json.dump(index, output)
+
+
+def _publish(version, directory):
+    """ Atomically point directory to the version directory, which must be in the same root """
+    link = version + '.link'
+    os.symlink(os.path.basename(version), link)
+    if os.path.isdir(directory) and not os.path.islink(directory):
+        # Directory written before versions were used, moved aside to be collected as one
+        try:
+            os.rename(directory, os.path.join(os.path.dirname(directory), '.%s-%s' % (os.path.basename(directory), uuid.uuid4().hex)))
+        except FileNotFoundError:
+            pass
+    try:
+        previous = os.path.join(os.path.dirname(directory), os.readlink(directory))
+    except OSError:
+        previous = None
+    os.replace(link, directory)
+    if previous is not None:
+        # The retention of a replaced version starts when it is replaced
+        try:
+            os.utime(previous)
+        except OSError:
+            pass
+    _collect(directory)
+    return version
+
+
+def _collect(directory):
+    """ Remove the versions of directory replaced more than SIMULATOR_RESULTS_RETENTION seconds ago """
+    try:
+        current = os.path.basename(os.readlink(directory))
+    except OSError:
+        current = None
+    expired = time.time() - _retention()
+    for path in _versions(directory):
+        if os.path.basename(path) == current:
+            continue
+        try:
+            if os.stat(path).st_mtime < expired:
+                shutil.rmtree(path, ignore_errors=True)
+        except FileNotFoundError:
+            continue
+
+
+def write_series(directory, dates, series, revisions=None, units=None, **metadata):
+    """
+        Write {name: array} series sharing the time axis dates in the columnar layout, replacing
+        directory, and return the directory of the published version. units maps series to their unit
+    """
+    temporary = _temporary(os.path.dirname(directory), os.path.basename(directory))
+    dates = pd.DatetimeIndex(dates).values.astype('datetime64[s]')
+    np.save(os.path.join(temporary, DATES + '.npy'), dates)
+    for name, values in series.items():
+        np.save(os.path.join(temporary, name + '.npy'), np.ascontiguousarray(values, dtype=np.float64))
+    _write_index(temporary, {
+        'series': list(series),
+        'periods': len(dates),
+        'start': str(dates[0]),
+        'end': str(dates[-1]),
+        'revisions': revisions or {},
+        'units': units or {},
+        'engine': ENGINE_VERSION,
+        'metadata': metadata,
+        'written_at': timezone.now().isoformat(),
+    })
+    return _publish(temporary, directory)
+
+
+def write_directory(directory, result, revisions=None):
+    """ Write the series of a SimulationResult in the columnar layout, replacing directory """
+    return write_series(directory, result.grid.dates, result.series(), revisions, result.series_units())
+
+
+def link_directory(source, directory, revisions=None, replace=True):
+    """
+        Replace directory by a copy of the columnar files of source, hard linked when possible
+        since stored files are never modified in place.
+        With replace False, an existing directory is kept as is: the copy is only moved in
+        place when directory is missing, which suits content-addressed directories
+    """
+    if not replace and os.path.exists(directory):
+        return directory
+    temporary = _temporary(os.path.dirname(directory), os.path.basename(directory))
+    with open(os.path.join(source, INDEX)) as index:
+        index = json.load(index)
+    for name in index['series'] + [DATES]:
+        filename = name + '.npy'
+        try:
+            os.link(os.path.join(source, filename), os.path.join(temporary, filename))
+        except OSError:
+            shutil.copyfile(os.path.join(source, filename), os.path.join(temporary, filename))
+    index['revisions'] = revisions or {}
+    index['written_at'] = timezone.now().isoformat()
+    _write_index(temporary, index)
+    if replace:
+        return _publish(temporary, directory)
+    try:
+        os.rename(temporary, directory)
+    except OSError:
+        # Moved in place meanwhile by another process, with the same content
+        shutil.rmtree(temporary, ignore_errors=True)
+        if not os.path.exists(directory):
+            raise
+    return directory
+
+
+@stage('store')
+def write(simulation_id, result, revisions=None):
+    """
+        Replace the stored outputs of a simulation by the series of a SimulationResult.
+        revisions maps each series to the Composition.revision it was computed from
+    """
+    return write_directory(_directory(simulation_id), result, revisions)
+
+
+@stage('store')
+def write_kind(simulation_id, kind, dates, series, **metadata):
+    """ Replace the stored outputs of another kind than 'run' for a simulation """
+    return write_series(_directory(simulation_id, kind), dates, series, **metadata)
+
+
+def install(simulation_id, source, revisions=None):
+    """ Replace the stored outputs of a simulation by the files of another columnar directory """
+    return link_directory(source, _directory(simulation_id), revisions)
+
+
+def delete(simulation_id):
+    for kind in KINDS:
+        directory = _directory(simulation_id, kind)
+        if os.path.islink(directory):
+            os.unlink(directory)
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+        for version in _versions(directory):
+            shutil.rmtree(version, ignore_errors=True)
+
+
+"""
+    Read-only, memory mapped view of the stored outputs of a simulation
+"""
+class StoredResult:
+
+    def __init__(self, simulation_id, kind='run'):
+        # Resolved once, so that every series is read from the same version
+        self.directory = os.path.realpath(_directory(simulation_id, kind))
+        try:
+            with open(os.path.join(self.directory, INDEX)) as index:
+                self.index = json.load(index)
+        except FileNotFoundError:
+            raise ResultNotFound("Simulation %s has no stored %s result." % (simulation_id, kind))
+        self.series_names = self.index['series']
+        self.revisions = self.index.get('revisions', {})
+        self.units = self.index.get('units', {}) # {series: unit label, see engine.Plan.unit_labels}
+        # Version of the engine which computed the series, None before it was recorded
+        self.engine = self.index.get('engine')
+        self.metadata = self.index.get('metadata', {})
+        self.dates = self._load(DATES)
+
+    def _load(self, name):
+        return np.load(os.path.join(self.directory, name + '.npy'), mmap_mode='r')
+
+    def series(self, name):
+        if name not in self.series_names:
+            raise KeyError(name)
+        return self._load(name)
+
+    def bounds(self, start=None, end=None):
+        """ Slice of periods between start and end, both included """
+        begin = 0 if start is None else int(np.searchsorted(self.dates, np.datetime64(start, 's'), side='left'))
+        stop = len(self.dates) if end is None else int(np.searchsorted(self.dates, np.datetime64(end, 's'), side='right'))
+        return slice(begin, max(begin, stop))
+
+    def query(self, start=None, end=None, series=None):
+        """ Dates and {series: values} between start and end, only the selected slice is read """
+        names = self.series_names if not series else series
+        window = self.bounds(start, end)
+        return self.dates[window], {name: self.series(name)[..., window] for name in names}
@@ -0,0 +1,177 @@
+"""
+    Monte Carlo and parameter sweep runs of a Simulation.
+
+    Distributions and sweep ranges are declared on BaseElement.distribution
+    (or passed with the request) and turned into a (scenarios, elements)
+    matrix of values. The engine carries this leading scenario axis through
+    every kernel, so all scenarios of a block are computed by the same numpy
+    calls. Blocks are sized so scenarios * rows * periods stays under the
+    engine BLOCK_SIZE, and only the statistics of each block are kept:
+    percentile bands, mean, standard deviation, min and max per composition
+    at the reporting dates.
+
+    Distributions, the center defaulting to BaseElement.value:
+        {"type": "normal", "std": 0.1}
+        {"type": "lognormal", "sigma": 0.2}           value is the median
+        {"type": "uniform", "low": 0.5, "high": 1.5}
+        {"type": "triangular", "low": 0.5, "high": 1.5}   value is the mode
+        {"type": "sweep", "values": [0.01, 0.02]} or {"type": "sweep", "start": 0, "stop": 1, "num": 5}
+    Sweeps are combined as a cartesian product, each combination getting
+    the requested number of random scenarios.
+"""
+
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from .engine import BLOCK_SIZE, TimeGrid, build_plan, evaluate, evaluate_reported, report_positions, step_positions
+from .exceptions import EngineError
+from .models import BaseElement
+
+DEFAULT_PERCENTILES = [5, 25, 50, 75, 95]
+MAX_SCENARIOS = 100000
+
+SAMPLERS = {
+    'normal': lambda rng, value, spec, size: rng.normal(spec.get('mean', value), spec['std'], size),
+    'lognormal': lambda rng, value, spec, size: value * rng.lognormal(0.0, spec['sigma'], size),
+    'uniform': lambda rng, value, spec, size: rng.uniform(spec['low'], spec['high'], size),
+    'triangular': lambda rng, value, spec, size: rng.triangular(spec['low'], spec.get('mode', value), spec['high'], size),
+}
+
+
+def _sweep(spec):
+    if 'values' in spec:
+        values = np.asarray(spec['values'], dtype=np.float64)
+    else:
+        values = np.linspace(spec['start'], spec['stop'], int(spec.get('num', 5)))
+    if values.ndim != 1 or not len(values):
+        raise EngineError("A sweep needs a non empty list of values.")
+    return values
+
+
+def validate(parameters):
+    """ Cleaned parameters of a scenario run, raises EngineError """
+    parameters = dict(parameters or {})
+    cleaned = {
+        'scenarios': int(parameters.get('scenarios', 1000)),
+        'seed': parameters.get('seed'),
+        'percentiles': [float(percentile) for percentile in parameters.get('percentiles', DEFAULT_PERCENTILES)],
+        'report_freq': parameters.get('report_freq', 'MS'),
+        'distributions': parameters.get('distributions') or {},
+    }
+    if not 1 <= cleaned['scenarios'] <= MAX_SCENARIOS:
+        raise EngineError("The number of scenarios must be between 1 and %s." % MAX_SCENARIOS)
+    if any(not 0 <= percentile <= 100 for percentile in cleaned['percentiles']):
+        raise EngineError("Percentiles must be between 0 and 100.")
+    try:
+        pd.tseries.frequencies.to_offset(cleaned['report_freq'])
+    except ValueError:
+        raise EngineError("Unknown reporting frequency '%s'." % cleaned['report_freq'])
+    if not isinstance(cleaned['distributions'], dict):
+        raise EngineError("Distributions must map BaseElement ids to a distribution.")
+    for key, spec in cleaned['distributions'].items():
+        if not str(key).isdigit() or not isinstance(spec, dict) or spec.get('type') not in list(SAMPLERS) + ['sweep']:
+            raise EngineError("Invalid distribution for BaseElement %s." % key)
+    return cleaned
+
+
+def sample(plan, distributions, scenarios, seed=None):
+    """ (scenarios * sweep combinations, elements) matrix of BaseElement values """
+    rng = np.random.default_rng(seed)
+    sweeps, randoms = [], []
+    for index, element_id in enumerate(plan.element_ids):
+        spec = distributions.get(int(element_id))
+        if spec is None:
+            continue
+        try:
+            if spec['type'] == 'sweep':
+                sweeps.append((index, _sweep(spec)))
+            else:
+                randoms.append((index, spec))
+        except (KeyError, TypeError, ValueError) as error:
+            raise EngineError("Invalid distribution for BaseElement %s: %s" % (element_id, error))
+
+    combinations = list(itertools.product(*[values for index, values in sweeps])) or [()]
+    total = len(combinations) * scenarios
+    if total > MAX_SCENARIOS:
+        raise EngineError("%s scenarios requested, the maximum is %s." % (total, MAX_SCENARIOS))
+
+    # Distributions are given in the unit of their BaseElement, plan values in base units
+    values = np.tile(plan.values, (total, 1))
+    for position, (index, points) in enumerate(sweeps):
+        values[:, index] = np.repeat([combination[position] for combination in combinations], scenarios) * plan.scales[index]
+    for index, spec in randoms:
+        try:
+            values[:, index] = SAMPLERS[spec['type']](rng, plan.values[index] / plan.scales[index], spec, total) * plan.scales[index]
+        except (KeyError, TypeError, ValueError) as error:
+            raise EngineError("Invalid distribution for BaseElement %s: %s" % (plan.element_ids[index], error))
+    return values
+
+
+def evaluate_statistics(plan, grid, values, percentiles, report, progress=None):
+    """ {statistic: (compositions, reporting dates)} over the scenario axis of values """
+    compositions, scenarios = len(plan.composition_ids), values.shape[0]
+    statistics = {'p%g' % percentile: np.zeros((compositions, len(report))) for percentile in percentiles}
+    for name in ('mean', 'std', 'min', 'max'):
+        statistics[name] = np.zeros((compositions, len(report)))
+
+    total, done = max(compositions, 1), 0
+    for group in plan.groups:
+        positions = np.asarray([plan.position[composition_id] for composition_id in group.composition_ids], dtype=np.intp)
+        periods = len(step_positions(group, grid, report))
+        # Every composition of a chunk keeps scenarios * reporting dates statistics inputs
+        for begin, end in group.chunks(max(scenarios * len(report), periods)):
+            rows = max(int(group.counts[begin:end].sum()), 1)
+            batch = max(BLOCK_SIZE // (rows * periods), 1)
+            collected = np.empty((scenarios, end - begin, len(report)))
+            for first in range(0, scenarios, batch):
+                last = min(first + batch, scenarios)
+                collected[first:last] = evaluate_reported(group, grid, values[first:last], begin, end, report)
+
+            bands = np.percentile(collected, percentiles, axis=0)
+            for percentile, band in zip(percentiles, bands):
+                statistics['p%g' % percentile][positions[begin:end]] = band
+            statistics['mean'][positions[begin:end]] = collected.mean(axis=0)
+            statistics['std'][positions[begin:end]] = collected.std(axis=0)
+            statistics['min'][positions[begin:end]] = collected.min(axis=0)
+            statistics['max'][positions[begin:end]] = collected.max(axis=0)
+            done += end - begin
+            if progress is not None:
+                progress(done / total)
+    return statistics
+
+
+def run_scenarios(simulation, parameters, freq='D', progress=None):
+    """
+        Evaluate the scenarios of a simulation. Returns the reporting dates, {series: values}
+        where series are named composition_<id>_<statistic>, and the number of scenarios.
+        Compositions fed by no uncertain BaseElement are evaluated once, their statistics
+        being their deterministic series
+    """
+    parameters = validate(parameters)
+    grid = TimeGrid.between(simulation.start, simulation.end, freq)
+    report = report_positions(grid, parameters['report_freq'])
+    compositions = simulation.compositions.order_by('pk')
+
+    distributions = dict(
+        BaseElement.objects.filter(composition__in=compositions, distribution__isnull=False)
+        .distinct().values_list('pk', 'distribution')
+    )
+    distributions.update({int(key): spec for key, spec in parameters['distributions'].items()})
+    uncertain = compositions.filter(base_elements__pk__in=list(distributions)).distinct()
+
+    plan = build_plan(uncertain)
+    values = sample(plan, distributions, parameters['scenarios'], parameters['seed'])
+    statistics = evaluate_statistics(plan, grid, values, parameters['percentiles'], report, progress)
+    series = {}
+    for index, composition_id in enumerate(plan.composition_ids):
+        for name, values_by_composition in statistics.items():
+            series['composition_%s_%s' % (composition_id, name)] = values_by_composition[index]
+
+    certain = evaluate(build_plan(compositions.exclude(pk__in=plan.composition_ids)), grid, report=report)
+    for index, composition_id in enumerate(certain.composition_ids):
+        deterministic = certain.values[index]
+        for name in statistics:
+            series['composition_%s_%s' % (composition_id, name)] = np.zeros(len(report)) if name == 'std' else deterministic
+    return grid.dates[report], series, len(values)
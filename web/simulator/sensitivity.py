@@ -0,0 +1,147 @@
+"""
+    Sensitivity (tornado) analysis of a Simulation.
+
+    Every BaseElement feeding the simulation is moved up and down by delta (a
+    fraction of its value, or an amount in its own unit in 'absolute' mode)
+    and the change of each composition output is reported per input.
+
+    Summed elements are independent rows of the engine blocks, so their effect
+    on a composition is the change of their own row: one evaluation of each
+    block with a (base, up, down) leading axis gives the effect of every
+    summed element at once, the unperturbed rows being the shared baseline.
+    Elements feeding a parameter move every row of their compositions, they
+    are handled with one extra (up, down) evaluation per parameter name.
+    Kernels applied to the sum of a composition (e.g. irr) are not additive:
+    for their groups, every row stands for its composition total with that
+    row moved, and the summed kernels are applied to these totals.
+"""
+
+import numpy as np
+
+from .engine import TimeGrid, build_plan, evaluate_rows, evaluate_summed, row_range, sum_rows
+from .exceptions import EngineError
+from .models import BaseElement
+
+METRICS = {
+    'final': lambda series: series[..., -1],
+    'total': lambda series: series.sum(axis=-1),
+    'mean': lambda series: series.mean(axis=-1),
+}
+
+
+def validate(parameters):
+    """ Cleaned parameters of a sensitivity run, raises EngineError """
+    parameters = dict(parameters or {})
+    cleaned = {
+        'delta': float(parameters.get('delta', 0.1)),
+        'mode': parameters.get('mode', 'relative'),
+        'metric': parameters.get('metric', 'final'),
+        'outputs': [int(output) for output in parameters.get('outputs') or []],
+        'top': int(parameters.get('top', 20)),
+    }
+    if cleaned['delta'] <= 0:
+        raise EngineError("delta must be positive.")
+    if cleaned['mode'] not in ('relative', 'absolute'):
+        raise EngineError("mode must be 'relative' or 'absolute'.")
+    if cleaned['metric'] not in METRICS:
+        raise EngineError("metric must be one of %s." % ', '.join(METRICS))
+    return cleaned
+
+
+def _perturb(values, scales, delta, mode):
+    """ (up, down) values, an absolute delta being in the unit of each element, converted to base units by scales """
+    if mode == 'relative':
+        return values * (1 + delta), values * (1 - delta)
+    return values + delta * scales, values - delta * scales
+
+
+def _effects(plan, grid, delta, mode, metric, progress=None):
+    """ Base metric per composition and {(composition id, element id): (up change, down change)} """
+    reduce = METRICS[metric]
+    base = np.zeros(len(plan.composition_ids))
+    effects = {}
+    total, done = max(len(plan.composition_ids), 1), 0
+
+    for group in plan.groups:
+        for begin, end in group.chunks(3 * len(grid)):
+            composition_ids = group.composition_ids[begin:end]
+            rows = group.rows[row_range(group, begin, end)]
+            owners = np.repeat(composition_ids, group.counts[begin:end])
+
+            # Summed elements: base, up and down rows in a single pass
+            up, down = _perturb(plan.values[rows], plan.scales[rows], delta, mode)
+            block = evaluate_rows(group, grid, plan.values, begin, end, np.stack([plan.values[rows], up, down]))
+            sums = sum_rows(group, block[0], begin, end)
+            if group.summed:
+                # Total of the composition of every row, that row being moved
+                owned = np.repeat(np.arange(end - begin), group.counts[begin:end])
+                block = evaluate_summed(group, grid, plan.values, sums[owned] - block[0] + block, begin, end, per_row=True)
+            metrics = reduce(block)
+            for row, owner in enumerate(owners):
+                key = (int(owner), int(plan.element_ids[rows[row]]))
+                change = (metrics[1, row] - metrics[0, row], metrics[2, row] - metrics[0, row])
+                previous = effects.get(key, (0.0, 0.0))
+                effects[key] = (previous[0] + change[0], previous[1] + change[1])
+            totals = reduce(evaluate_summed(group, grid, plan.values, sums, begin, end))
+            for index, composition_id in enumerate(composition_ids):
+                base[plan.position[composition_id]] = totals[index]
+
+            # Parameter elements: every composition of the chunk moves its own source at once
+            for name in group.parameters:
+                sources = group.sources[name][begin:end]
+                fed = np.flatnonzero(sources >= 0)
+                if not len(fed):
+                    continue
+                values = np.tile(plan.values, (2, 1))
+                values[0, sources[fed]], values[1, sources[fed]] = _perturb(plan.values[sources[fed]], plan.scales[sources[fed]], delta, mode)
+                moved = reduce(evaluate_summed(group, grid, values, sum_rows(group, evaluate_rows(group, grid, values, begin, end), begin, end), begin, end))
+                for index in fed:
+                    key = (composition_ids[index], int(plan.element_ids[sources[index]]))
+                    previous = effects.get(key, (0.0, 0.0))
+                    effects[key] = (previous[0] + moved[0, index] - totals[index], previous[1] + moved[1, index] - totals[index])
+
+            done += end - begin
+            if progress is not None:
+                progress(done / total)
+    return base, effects
+
+
+def _number(value):
+    """ value as a float, None when it is not finite (JSON has no NaN) """
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def run_sensitivity(simulation, parameters, freq='D', progress=None):
+    """
+        Tornado data of a simulation: for every output composition, its base metric and its
+        top inputs sorted by swing (|up change - down change|), metrics which are not finite being None
+    """
+    parameters = validate(parameters)
+    grid = TimeGrid.between(simulation.start, simulation.end, freq)
+    compositions = simulation.compositions.order_by('pk')
+    if parameters['outputs']:
+        compositions = compositions.filter(pk__in=parameters['outputs'])
+    plan = build_plan(compositions)
+    base, effects = _effects(plan, grid, parameters['delta'], parameters['mode'], parameters['metric'], progress)
+
+    labels = dict(BaseElement.objects.filter(pk__in=plan.element_ids.tolist()).values_list('pk', 'label'))
+    outputs = {composition_id: [] for composition_id in plan.composition_ids}
+    for (composition_id, element_id), (up, down) in effects.items():
+        outputs[composition_id].append({
+            'element': element_id,
+            'label': labels.get(element_id, ''),
+            'up': _number(up),
+            'down': _number(down),
+            'swing': _number(abs(up - down)),
+        })
+    return {
+        'metric': parameters['metric'],
+        'outputs': {
+            str(composition_id): {
+                'base': _number(base[plan.position[composition_id]]),
+                'inputs': sorted(inputs, key=lambda item: (item['swing'] is None, -(item['swing'] or 0)))[:parameters['top']],
+            }
+            for composition_id, inputs in outputs.items()
+        },
+    }
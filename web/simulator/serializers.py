@@ -1,27 +1,122 @@
 from rest_framework import serializers
-from .models import BaseElement, BaseElementValue, PossibleSpecification, Specification, Composition
+from .models import BaseElement, BaseElementValue, PossibleSpecification, Specification, Composition, SimulationJob, Simulation, Enums
+from . import timeseries
+from .compiler import compile_functions
+from .exceptions import SpecificationError
+import numpy as np
 
-class BaseElementSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """ Only keep the fields listed in the ?fields= parameter of the request, e.g. ?fields=id,label """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        fields = request.query_params.get('fields') if request is not None and request.method == 'GET' else None
+        if fields:
+            for name in set(self.fields) - set(fields.split(',')):
+                self.fields.pop(name)
+
+class BaseElementSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = BaseElement
         fields = '__all__'
 
-class BaseElementValueSerializer(serializers.ModelSerializer):
+class SeriesValuesField(serializers.Field):
+    """ Values of a packed series, as a list of numbers """
+
+    def __init__(self, **kwargs):
+        super().__init__(source='*', **kwargs)
+
+    def to_representation(self, instance):
+        return timeseries.values(instance).tolist()
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            raise serializers.ValidationError("A list of numbers is required.")
+        return {'series_values': data}
+
+class SeriesDatesField(serializers.Field):
+    """ Dates of a packed series, as a list of ISO 8601 strings """
+
+    def __init__(self, **kwargs):
+        super().__init__(source='*', **kwargs)
+
+    def to_representation(self, instance):
+        return np.datetime_as_string(timeseries.dates(instance)).tolist()
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            raise serializers.ValidationError("A list of dates is required.")
+        return {'series_dates': data}
+
+class BaseElementValueSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    dates = SeriesDatesField(required=False)
+    values = SeriesValuesField(required=False)
+
     class Meta:
         model = BaseElementValue
-        fields = '__all__'
+        fields = ['id', 'base_element', 'start', 'freq', 'length', 'dates', 'values']
+        read_only_fields = ['length']
+
+    def validate(self, attrs):
+        values = attrs.pop('series_values', None)
+        dates = attrs.pop('series_dates', None)
+        if values is None:
+            if dates is not None:
+                raise serializers.ValidationError({'values': "Dates were sent without values."})
+            if self.instance is None:
+                values = []
+            elif self.instance.freq and ('start' in attrs or 'freq' in attrs):
+                # Re-date the stored values of a regular series
+                values = timeseries.values(self.instance)
+            else:
+                return attrs
+        elif dates is None and self.instance is not None and not self.instance.freq and 'freq' not in attrs:
+            # New values on the stored irregular dates
+            dates = timeseries.dates(self.instance)
+        start = attrs.get('start', getattr(self.instance, 'start', None))
+        freq = attrs.get('freq', getattr(self.instance, 'freq', None))
+        try:
+            attrs.update(timeseries.pack(values, dates, start, freq))
+        except timeseries.SeriesError as error:
+            raise serializers.ValidationError({'values': str(error)})
+        return attrs
 
-class PossibleSpecificationSerializer(serializers.ModelSerializer):
+class PossibleSpecificationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = PossibleSpecification
         fields = '__all__'
 
-class SpecificationSerializer(serializers.ModelSerializer):
+    def validate(self, attrs):
+        """ Compile the functions, so that a specification the engine would reject is never saved """
+        functions = attrs.get('functions_associate', getattr(self.instance, 'functions_associate', None))
+        parameters = attrs.get('functions_parameters', getattr(self.instance, 'functions_parameters', None))
+        try:
+            compile_functions(functions, parameters)
+        except SpecificationError as error:
+            raise serializers.ValidationError({'functions_associate': str(error)})
+        return attrs
+
+class SpecificationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Specification
         fields = '__all__'
 
-class CompositionSerializer(serializers.ModelSerializer):
+class CompositionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Composition
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+        read_only_fields = ['revision']
+
+class SimulationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Simulation
+        fields = '__all__'
+
+class SimulationJobSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    kind = serializers.ChoiceField(choices=Enums.JOB_KIND, default='run')
+
+    class Meta:
+        model = SimulationJob
+        fields = '__all__'
+        read_only_fields = ['status', 'progress', 'cancel_requested', 'worker', 'error', 'result', 'input_hash', 'created_at', 'started_at', 'heartbeat_at', 'finished_at']
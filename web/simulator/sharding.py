@@ -0,0 +1,103 @@
+"""
+    Sharded evaluation of a Plan on a pool of processes.
+
+    The blocks of every group (see Group.chunks) are independent, so they are
+    handed out to a process pool as shards. The BaseElement values and the
+    (compositions, periods) output live in multiprocessing.shared_memory
+    segments: workers read their inputs and write their series in place, and
+    only shard coordinates travel between processes. Every block is computed
+    by the same code as in evaluate(), so results are identical to a single
+    process run.
+"""
+
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .engine import BLOCK_SIZE, SimulationResult, evaluate, evaluate_reported, stage
+
+# Plans with fewer cells (compositions * periods) than this are not worth a pool
+MIN_CELLS = 2 ** 20
+SHARDS_PER_PROCESS = 4
+
+_state = {}
+
+
+def _shared(shape):
+    size = max(int(np.prod(shape)) * np.dtype(np.float64).itemsize, 1)
+    memory = shared_memory.SharedMemory(create=True, size=size)
+    return memory, np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+
+
+def _initialize(plan, grid, report, values_name, values_shape, output_name, output_shape):
+    values = shared_memory.SharedMemory(name=values_name)
+    output = shared_memory.SharedMemory(name=output_name)
+    _state.update({
+        'plan': plan,
+        'grid': grid,
+        'report': report,
+        'memory': (values, output),
+        'values': np.ndarray(values_shape, dtype=np.float64, buffer=values.buf),
+        'output': np.ndarray(output_shape, dtype=np.float64, buffer=output.buf),
+        'positions': [
+            np.asarray([plan.position[composition_id] for composition_id in group.composition_ids], dtype=np.intp)
+            for group in plan.groups
+        ],
+    })
+
+
+def _evaluate_shard(shard):
+    index, begin, end = shard
+    group = _state['plan'].groups[index]
+    positions = _state['positions'][index][begin:end]
+    _state['output'][..., positions, :] = evaluate_reported(group, _state['grid'], _state['values'], begin, end, _state['report'])
+    return end - begin
+
+
+def shards(plan, grid, processes):
+    """
+        (group index, first composition, last composition) of every block of a plan,
+        small enough to give each process several shards to balance the load
+    """
+    cells = sum(len(group.rows) for group in plan.groups) * len(grid)
+    size = max(min(BLOCK_SIZE, cells // (processes * SHARDS_PER_PROCESS)), 1)
+    return [
+        (index, begin, end)
+        for index, group in enumerate(plan.groups)
+        for begin, end in group.chunks(len(grid), size)
+    ]
+
+
+def evaluate_sharded(plan, grid, processes, values=None, progress=None, report=None):
+    """ Same as engine.evaluate, spread over processes worker processes """
+    values = plan.values if values is None else np.asarray(values, dtype=np.float64)
+    output_grid = grid if report is None else grid.take(report)
+    output_shape = values.shape[:-1] + (len(plan.composition_ids), len(output_grid))
+    tasks = shards(plan, grid, processes)
+    # Daemonic processes, such as multiprocessing.Pool workers, can not start a pool
+    if processes <= 1 or len(tasks) <= 1 or np.prod(output_shape) < MIN_CELLS or multiprocessing.current_process().daemon:
+        return evaluate(plan, grid, values, progress, report)
+
+    with stage('evaluate'):
+        values_memory = output_memory = shared_values = shared_output = None
+        try:
+            values_memory, shared_values = _shared(values.shape)
+            output_memory, shared_output = _shared(output_shape)
+            shared_values[...] = values
+            shared_output[...] = 0
+            total, done = max(len(plan.composition_ids), 1), 0
+            arguments = (plan, grid, report, values_memory.name, values.shape, output_memory.name, output_shape)
+            with multiprocessing.Pool(min(processes, len(tasks)), initializer=_initialize, initargs=arguments) as pool:
+                for count in pool.imap_unordered(_evaluate_shard, tasks):
+                    done += count
+                    if progress is not None:
+                        progress(done / total)
+            return SimulationResult(output_grid, plan.composition_ids, np.array(shared_output), plan.unit_labels())
+        finally:
+            # The arrays must be released before their memory is closed, only the allocated ones exist
+            shared_values = shared_output = None
+            for memory in (values_memory, output_memory):
+                if memory is not None:
+                    memory.close()
+                    memory.unlink()
@@ -0,0 +1,98 @@
+from django.db.models.signals import pre_save, post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import BaseElement, BaseElementValue, Composition, PossibleSpecification, Simulation, Specification
+from . import apicache, compiler, graph, results
+
+
+@receiver(post_save, sender=PossibleSpecification)
+@receiver(post_delete, sender=PossibleSpecification)
+def evict_compiled_specification(sender, instance, **kwargs):
+    compiler.cache.evict(instance.pk)
+
+
+@receiver(post_delete, sender=Simulation)
+def delete_simulation_results(sender, instance, **kwargs):
+    results.delete(instance.pk)
+
+
+"""
+    Dirty marking of the compositions depending on a changed input, see graph.py
+    Deletions are caught before the M2M rows linking the input to its compositions disappear.
+    Queryset deletes mark all their rows at once, see graph.delete_marked
+"""
+
+@receiver(post_save, sender=BaseElement)
+@receiver(pre_delete, sender=BaseElement)
+def base_element_changed(sender, instance, **kwargs):
+    if not graph.marking_suspended():
+        graph.mark_base_elements([instance.pk])
+
+
+@receiver(post_save, sender=PossibleSpecification)
+@receiver(pre_delete, sender=PossibleSpecification)
+def possible_specification_changed(sender, instance, **kwargs):
+    if not graph.marking_suspended():
+        graph.mark_possible_specifications([instance.pk])
+
+
+@receiver(pre_save, sender=Specification)
+def specification_moving(sender, instance, **kwargs):
+    """ Remember the composition a saved Specification belonged to, which changes too when it moves """
+    instance._previous_composition_id = None
+    if instance.pk is not None:
+        instance._previous_composition_id = Specification.objects.filter(pk=instance.pk).values_list('composition_id', flat=True).first()
+
+
+@receiver(post_save, sender=Specification)
+@receiver(post_delete, sender=Specification)
+def specification_changed(sender, instance, **kwargs):
+    if not graph.marking_suspended():
+        previous = getattr(instance, '_previous_composition_id', None)
+        graph.mark_compositions({instance.composition_id, previous} - {None})
+
+
+@receiver(m2m_changed, sender=Composition.base_elements.through)
+def composition_elements_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        graph.mark_compositions([instance.pk])
+    elif action == 'pre_clear':
+        graph.mark_base_elements([instance.pk])
+    else:
+        graph.mark_compositions(pk_set)
+
+
+@receiver(m2m_changed, sender=Specification.specifications_possible.through)
+def specification_possibles_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        graph.mark_compositions([instance.composition_id])
+    elif action == 'pre_clear':
+        graph.mark_possible_specifications([instance.pk])
+    else:
+        graph.mark_specifications(pk_set)
+
+
+"""
+    New versions of the cached API responses, see apicache.py
+    Connected per model: a receiver for every sender would disable the fast deletes of all models
+"""
+
+def model_changed(sender, **kwargs):
+    apicache.bump(sender)
+
+
+for model in (BaseElement, BaseElementValue, PossibleSpecification, Specification, Composition, Simulation):
+    post_save.connect(model_changed, sender=model, dispatch_uid='apicache_save_%s' % model._meta.label_lower)
+    post_delete.connect(model_changed, sender=model, dispatch_uid='apicache_delete_%s' % model._meta.label_lower)
+
+
+@receiver(m2m_changed, sender=Composition.base_elements.through)
+@receiver(m2m_changed, sender=Specification.specifications_possible.through)
+@receiver(m2m_changed, sender=Simulation.compositions.through)
+def relation_changed(sender, instance, action, model, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        apicache.bump(type(instance), model)
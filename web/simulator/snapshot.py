@@ -0,0 +1,47 @@
+"""
+    Single document describing the whole model graph of a simulation:
+    its compositions, their specifications, BaseElements and PossibleSpecifications.
+
+    The graph is loaded with a fixed number of queries whatever its size, and
+    its ETag is derived from Composition.revision (bumped by signals whenever an
+    input of a composition changes), so an unchanged graph is detected with a
+    single cheap query before anything is serialized.
+"""
+
+import hashlib
+
+from django.db.models import Prefetch
+
+from .models import Specification
+from .serializers import BaseElementSerializer, CompositionSerializer, PossibleSpecificationSerializer, SimulationSerializer, SpecificationSerializer
+
+
+def etag(simulation):
+    revisions = list(simulation.compositions.order_by('pk').values_list('pk', 'revision'))
+    content = repr((SimulationSerializer(simulation).data, revisions))
+    return '"%s"' % hashlib.sha256(content.encode()).hexdigest()
+
+
+def build(simulation):
+    compositions = list(
+        simulation.compositions.order_by('pk').prefetch_related(
+            'base_elements',
+            Prefetch('specification_set', queryset=Specification.objects.order_by('pk').prefetch_related('specifications_possible')),
+        )
+    )
+    base_elements, specifications, possibles = {}, [], {}
+    for composition in compositions:
+        for element in composition.base_elements.all():
+            base_elements[element.pk] = element
+        for specification in composition.specification_set.all():
+            specifications.append(specification)
+            for possible in specification.specifications_possible.all():
+                possibles[possible.pk] = possible
+
+    return {
+        'simulation': SimulationSerializer(simulation).data,
+        'compositions': CompositionSerializer(compositions, many=True).data,
+        'specifications': SpecificationSerializer(specifications, many=True).data,
+        'base_elements': BaseElementSerializer(sorted(base_elements.values(), key=lambda element: element.pk), many=True).data,
+        'possible_specifications': PossibleSpecificationSerializer(sorted(possibles.values(), key=lambda possible: possible.pk), many=True).data,
+    }
@@ -18,7 +18,7 @@ class Form extends React.Component{
                     method: 'OPTIONS'
                 }).then(response => response.json())
                 models[element] = model.actions.POST
-                forms[element] =  await fetch(`/api/${element}`).then(response => response.json())
+                forms[element] =  await fetchAll(`/api/${element}/`)
                 if(models[element] && forms[element]) resolve()
             })
         })).then(() => {
@@ -59,6 +59,17 @@ class Form extends React.Component{
     }
 }
 
+// Rows of every page of a paginated list, following the next cursors
+async function fetchAll(url){
+    let rows = []
+    while(url){
+        const page = await fetch(url).then(response => response.json())
+        rows = rows.concat(page.results)
+        url = page.next
+    }
+    return rows
+}
+
 function Elements({ type, forms, model, count, children }){
 
 
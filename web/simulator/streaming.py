@@ -0,0 +1,135 @@
+"""
+    Constant memory exports of the REST viewsets and of simulation results.
+
+    Rows are read in keyset chunks (pk > last pk, ordered by pk) rather than
+    with a single queryset.iterator(), so the prefetch_related of the viewsets
+    still applies to each chunk and M2M fields do not cost a query per row.
+    Every chunk is serialized and sent before the next one is read.
+
+    Stored results are memory mapped (see results.py) and exported period
+    chunk by period chunk, as CSV or as an .npz archive (a zip of one .npy
+    file per column, read back with numpy.load), optionally gzipped on the fly.
+"""
+
+import io
+import zipfile
+import zlib
+
+import numpy as np
+import pandas as pd
+from django.http import StreamingHttpResponse
+from rest_framework.decorators import action
+from rest_framework.utils.encoders import JSONEncoder
+
+CHUNK_SIZE = 2000
+# Number of values (periods * series) read for each chunk of a result export
+CELLS_PER_CHUNK = 2 ** 18
+RESULT_FORMATS = ('csv', 'npz')
+
+
+def iterate_chunks(queryset, chunk_size=CHUNK_SIZE):
+    last = None
+    queryset = queryset.order_by('pk')
+    while True:
+        chunk = list((queryset if last is None else queryset.filter(pk__gt=last))[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last = chunk[-1].pk
+
+
+def stream_json(queryset, serializer_class, context, chunk_size=CHUNK_SIZE):
+    """ JSON array of the serialized rows of a queryset, produced chunk by chunk """
+    encoder = JSONEncoder()
+    yield '['
+    first = True
+    for chunk in iterate_chunks(queryset, chunk_size):
+        rows = [encoder.encode(row) for row in serializer_class(chunk, many=True, context=context).data]
+        yield (',' if not first else '') + ','.join(rows)
+        first = False
+    yield ']'
+
+
+class StreamingExportMixin:
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        response = StreamingHttpResponse(
+            stream_json(queryset, self.get_serializer_class(), self.get_serializer_context()),
+            content_type='application/json'
+        )
+        response['Content-Disposition'] = 'attachment; filename="%s.json"' % self.basename
+        return response
+
+
+def stream_results_csv(stored, window, names):
+    """ CSV of the dates and series names of a StoredResult in the window slice, a header line first """
+    columns = [stored.series(name) for name in names]
+    rows = max(CELLS_PER_CHUNK // max(len(columns), 1), 1)
+    yield ','.join(['date'] + list(names)) + '\n'
+    for begin in range(window.start, window.stop, rows):
+        stop = min(begin + rows, window.stop)
+        block = np.empty((stop - begin, len(columns)))
+        for index, column in enumerate(columns):
+            block[:, index] = column[begin:stop]
+        buffer = io.StringIO()
+        pd.DataFrame(block, index=np.datetime_as_string(stored.dates[begin:stop])).to_csv(buffer, header=False)
+        yield buffer.getvalue()
+
+
+class _Pipe:
+    """ Write only file whose content is taken out by the generator that writes it """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+
+def stream_results_npz(stored, window, names):
+    """ .npz archive of the dates and series names of a StoredResult in the window slice """
+    pipe = _Pipe()
+    with zipfile.ZipFile(pipe, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for name, column in [('date', stored.dates)] + [(name, stored.series(name)) for name in names]:
+            part = column[window]
+            rows = max(CELLS_PER_CHUNK // max(int(np.prod(part.shape[1:])), 1), 1)
+            with archive.open(name + '.npy', 'w', force_zip64=True) as entry:
+                np.lib.format.write_array_header_1_0(entry, np.lib.format.header_data_from_array_1_0(part))
+                for begin in range(0, len(part), rows):
+                    entry.write(np.ascontiguousarray(part[begin:begin + rows]).tobytes())
+                    yield pipe.drain()
+    yield pipe.drain()
+
+
+def gzip_stream(chunks, level=6):
+    """ Gzip a stream of str or bytes chunk by chunk """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def result_response(stored, window, names, format='csv', compress=False, filename='result'):
+    """ StreamingHttpResponse downloading a StoredResult as CSV or .npz """
+    if format == 'csv':
+        chunks, content_type = stream_results_csv(stored, window, names), 'text/csv'
+    else:
+        chunks, content_type = stream_results_npz(stored, window, names), 'application/octet-stream'
+    filename = '%s.%s' % (filename, format)
+    if compress:
+        chunks, content_type, filename = gzip_stream(chunks), 'application/gzip', filename + '.gz'
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    return response
@@ -0,0 +1,53 @@
+"""
+    Fixtures shared by the test modules: small compositions and simulations built
+    in the test database, and temporary result and run cache roots.
+"""
+
+import datetime
+import shutil
+import tempfile
+
+from django.core.cache import caches
+from django.test import override_settings
+
+from .. import lazy
+from ..models import BaseElement, Composition, PossibleSpecification, Simulation, Specification
+
+START = datetime.datetime(2030, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def make_composition(elements, functions, parameters=None, units=None):
+    """ Composition of {label: value} elements with a single specification, units maps labels to a unit symbol """
+    composition = Composition.objects.create()
+    for label, value in elements.items():
+        unit = {'0': units[label]} if units and label in units else {}
+        composition.base_elements.add(BaseElement.objects.create(label=label, value=value, unit=unit, unit_separator='/'))
+    possible = PossibleSpecification.objects.create(specification_name='test', functions_associate=functions, functions_parameters=parameters or {})
+    Specification.objects.create(composition=composition).specifications_possible.add(possible)
+    return composition
+
+
+def make_simulation(compositions, days, start=START):
+    simulation = Simulation.objects.create(updated_at=start, title='test', description='', start=start, end=start + datetime.timedelta(days=days))
+    simulation.compositions.add(*compositions)
+    return simulation
+
+
+class StorageMixin:
+    """ Results and memoized runs written to a temporary directory, caches emptied """
+
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp()
+        self.storage = override_settings(
+            SIMULATOR_RESULTS_ROOT=self.root + '/results',
+            SIMULATOR_RUN_CACHE_ROOT=self.root + '/run_cache',
+        )
+        self.storage.enable()
+        lazy.cache.clear()
+        caches['api'].clear()
+
+    def tearDown(self):
+        self.storage.disable()
+        shutil.rmtree(self.root, ignore_errors=True)
+        super().tearDown()
@@ -0,0 +1,54 @@
+import json
+
+from django.test import TestCase
+
+from ..models import BaseElement, Composition
+from .. import streaming
+from .helpers import StorageMixin, make_composition
+
+
+class ListingTests(StorageMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        BaseElement.objects.bulk_create([BaseElement(label='e%s' % index, value=index, unit={}, unit_separator='/') for index in range(25)])
+
+    def test_keyset_pages(self):
+        seen, url = [], '/api/base_element/?page_size=10'
+        while url:
+            page = self.client.get(url).json()
+            self.assertLessEqual(len(page['results']), 10)
+            seen += [row['id'] for row in page['results']]
+            url = page['next']
+        self.assertEqual(seen, list(BaseElement.objects.order_by('pk').values_list('pk', flat=True)))
+
+    def test_page_size_capped(self):
+        BaseElement.objects.bulk_create([BaseElement(label='more', value=0, unit={}, unit_separator='/') for _ in range(1000)])
+        page = self.client.get('/api/base_element/?page_size=5000').json()
+        self.assertEqual(len(page['results']), 1000)
+
+    def test_fields(self):
+        page = self.client.get('/api/base_element/?fields=id,label').json()
+        self.assertEqual(set(page['results'][0]), {'id', 'label'})
+        page = self.client.get('/api/base_element/').json()
+        self.assertIn('unit_separator', page['results'][0])
+
+    def test_related_fields_prefetched(self):
+        for _ in range(5):
+            make_composition({'a': 1.0, 'b': 2.0}, {'factor': 'scale'})
+        with self.assertNumQueries(2):
+            page = self.client.get('/api/composition/').json()
+        self.assertEqual(len(page['results']), 5)
+        self.assertEqual(len(page['results'][0]['base_elements']), 2)
+
+    def test_export(self):
+        response = self.client.get('/api/base_element/export/?fields=id,value')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="baseelement.json"')
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([row['value'] for row in rows], list(range(25)))
+        self.assertEqual(set(rows[0]), {'id', 'value'})
+
+    def test_export_chunks(self):
+        chunks = list(streaming.iterate_chunks(BaseElement.objects.all(), chunk_size=10))
+        self.assertEqual([len(chunk) for chunk in chunks], [10, 10, 5])
+        self.assertEqual(json.loads(''.join(streaming.stream_json(Composition.objects.none(), None, {}))), [])
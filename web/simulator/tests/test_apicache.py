@@ -0,0 +1,76 @@
+from django.db import transaction
+from django.test import TestCase
+
+from .. import apicache, bulk, graph
+from ..models import BaseElement
+from .helpers import StorageMixin, make_composition
+
+
+class ResponseCacheTests(StorageMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.composition = make_composition({'a': 1.0}, {'factor': 'scale'})
+        self.element = self.composition.base_elements.get()
+
+    def get(self, url, **headers):
+        return self.client.get(url, HTTP_ACCEPT='application/json', **headers)
+
+    def test_cached_until_changed(self):
+        url = '/api/base_element/%s/' % self.element.pk
+        first = self.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(url).json(), first.json())
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(url, {'value': 2.0}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get(url).json()['value'], 2.0)
+
+    def test_not_modified(self):
+        url = '/api/base_element/'
+        tag = self.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.get(url, HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(response.status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            BaseElement.objects.create(label='b', value=1, unit={}, unit_separator='/')
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=tag).status_code, 200)
+
+    def test_writes_without_signals(self):
+        url = '/api/composition/%s/' % self.composition.pk
+        revision = self.get(url).json()['revision']
+        with self.captureOnCommitCallbacks(execute=True):
+            graph.mark_compositions([self.composition.pk])
+        self.assertEqual(self.get(url).json()['revision'], revision + 1)
+
+        url = '/api/base_element/%s/' % self.element.pk
+        self.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk.import_base_elements([{'id': self.element.pk, 'label': 'renamed', 'value': 1, 'unit': {}}])
+        self.assertEqual(self.get(url).json()['label'], 'renamed')
+
+    def test_many_to_many_changes(self):
+        url = '/api/composition/%s/' % self.composition.pk
+        self.get(url)
+        other = BaseElement.objects.create(label='b', value=1, unit={}, unit_separator='/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.composition.base_elements.add(other)
+        self.assertEqual(len(self.get(url).json()['base_elements']), 2)
+
+    def test_rolled_back_change_keeps_the_version(self):
+        version = apicache.versions([BaseElement])
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    apicache.bump(BaseElement)
+                    raise RuntimeError()
+            except RuntimeError:
+                pass
+        self.assertEqual(apicache.versions([BaseElement]), version)
+
+    def test_other_formats_not_cached(self):
+        url = '/api/base_element/?format=api'
+        self.client.get(url)
+        # Read again from the database
+        with self.assertNumQueries(1):
+            self.client.get(url)
@@ -0,0 +1,71 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from .. import benchmarks
+from ..models import BaseElement, Simulation
+from .helpers import StorageMixin
+
+PORTFOLIO = ['--compositions', '3', '--elements-per-composition', '2', '--years', '1', '--repeat', '1']
+
+
+class BenchmarkTests(StorageMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def test_measure(self):
+        setup = mock.Mock()
+        metrics, result = benchmarks.measure(lambda: list(BaseElement.objects.all()), repeat=2, setup=setup)
+        self.assertEqual((metrics['queries'], result, setup.call_count), (1, [], 3))
+        self.assertLessEqual(metrics['seconds'], metrics['median_seconds'])
+        self.assertGreater(metrics['peak_bytes'], 0)
+
+    def test_compare(self):
+        baseline = {'metrics': {'a': {'seconds': 0.1, 'queries': 3, 'peak_bytes': 1000}, 'b': {'seconds': 0.1}}}
+        document = {'metrics': {
+            'a': {'seconds': 0.12, 'queries': 4, 'peak_bytes': 1300},
+            'b': {'seconds': 0.2},
+            'new': {'seconds': 5.0},
+        }}
+        self.assertEqual(benchmarks.compare(document, baseline), [
+            "a peak_bytes: 1.3 KiB, baseline 1.0 KiB",
+            "a queries: 4, baseline 3",
+            "b seconds: 200.0 ms, baseline 100.0 ms",
+        ])
+        self.assertEqual(benchmarks.compare(document, baseline, tolerance=1.0), ["a queries: 4, baseline 3"])
+
+    def test_command(self):
+        baseline = os.path.join(self.directory, 'baseline.json')
+        call_command('benchmark', *PORTFOLIO, '--baseline', baseline, '--save-baseline', stdout=StringIO(), stderr=StringIO())
+        with open(baseline) as source:
+            document = json.load(source)
+        self.assertEqual(document['portfolio']['compositions'], 3)
+        self.assertIn('engine.query.spot', document['metrics'])
+        self.assertIn('api.composition.units', document['metrics'])
+        # The generated portfolio is deleted
+        self.assertFalse(Simulation.objects.exists())
+
+        for metrics in document['metrics'].values():
+            metrics['queries'] = 0
+        with open(baseline, 'w') as output:
+            json.dump(document, output)
+        with self.assertRaises(CommandError) as raised:
+            call_command('benchmark', *PORTFOLIO, '--baseline', baseline, stdout=StringIO(), stderr=StringIO())
+        self.assertIn('regression(s)', str(raised.exception))
+
+    def test_command_arguments(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark', '--save-baseline', stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('benchmark', '--baseline', os.path.join(self.directory, 'missing.json'), stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('benchmark', '--simulation', '999999', stdout=StringIO())
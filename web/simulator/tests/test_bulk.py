@@ -0,0 +1,83 @@
+import csv
+import io
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+
+from .. import bulk, timeseries
+from ..models import BaseElement, BaseElementValue
+from .helpers import StorageMixin, make_composition
+
+
+class BulkImportTests(StorageMixin, TestCase):
+
+    def test_copy_csv(self):
+        frame, valid = bulk._validate_base_elements(bulk._frame([
+            {'label': 'a, "quoted"', 'value': 1.5, 'unit': {'0': 'kW'}, 'unit_separator': '/'},
+            {'label': 'b', 'value': 2, 'unit': '{}'},
+        ]), bulk.Report())
+        rows = list(csv.reader(bulk._copy_csv(frame[valid])))
+        self.assertEqual(rows, [['a, "quoted"', '1.5', '{"0": "kW"}', '/'], ['b', '2.0', '{}', '']])
+        # The bare empty separator of the second row must not become NULL
+        self.assertIn('FORCE_NOT_NULL (unit_separator)', bulk.COPY_BASE_ELEMENTS)
+
+    def test_copy_statement(self):
+        cursor = mock.MagicMock()
+        frame, valid = bulk._validate_base_elements(bulk._frame([{'label': 'b', 'value': 2, 'unit': '{}'}]), bulk.Report())
+        with mock.patch.object(bulk.connection, 'cursor', return_value=cursor):
+            bulk._copy_base_elements(frame[valid])
+        statement, buffer = cursor.__enter__.return_value.copy_expert.call_args[0]
+        self.assertEqual(statement, bulk.COPY_BASE_ELEMENTS % BaseElement._meta.db_table)
+        self.assertEqual(buffer.getvalue(), 'b,2.0,{},\r\n')
+
+    def test_create_update_and_report(self):
+        element = BaseElement.objects.create(label='old', value=1, unit={}, unit_separator='/')
+        report = bulk.import_base_elements([
+            {'label': 'new', 'value': 3, 'unit': '{}'},
+            {'id': element.pk, 'label': 'renamed', 'value': 4, 'unit': {}, 'unit_separator': '/'},
+            {'label': '', 'value': 'x', 'unit': '[]', 'unit_separator': '?'},
+            {'id': element.pk + 100, 'label': 'ghost', 'value': 1, 'unit': {}},
+        ], chunk_size=2)
+        self.assertEqual(report.as_dict(), {'created': 1, 'updated': 1, 'errors': [
+            {'row': 2, 'errors': {'label': "A label of 1 to 255 characters is required.", 'value': "A finite number is required.",
+                                  'unit': "A JSON object of units is required.", 'unit_separator': "Must be empty or one of /."}},
+            {'row': 3, 'errors': {'id': "No BaseElement with this id."}},
+        ]})
+        self.assertEqual(BaseElement.objects.get(label='new').unit_separator, '')
+        element.refresh_from_db()
+        self.assertEqual((element.label, element.value), ('renamed', 4))
+
+    def test_update_marks_compositions(self):
+        composition = make_composition({'a': 1.0}, {'factor': 'scale'})
+        composition.refresh_from_db()
+        element, revision = composition.base_elements.get(), composition.revision
+        bulk.import_base_elements([{'id': element.pk, 'label': 'a', 'value': 2, 'unit': {}}])
+        composition.refresh_from_db()
+        self.assertEqual(composition.revision, revision + 1)
+
+    def test_points_packed_per_element(self):
+        first = BaseElement.objects.create(label='a', value=1, unit={}, unit_separator='/')
+        second = BaseElement.objects.create(label='b', value=1, unit={}, unit_separator='/')
+        report = bulk.import_base_element_values([
+            {'base_element': first.pk, 'date': '2030-01-01', 'value': 1},
+            {'base_element': second.pk, 'date': '2030-01-01', 'value': 5},
+            {'base_element': first.pk, 'date': '2030-01-02', 'value': 2},
+            {'base_element': first.pk + second.pk, 'date': '2030-01-01', 'value': 1},
+            {'base_element': second.pk, 'date': 'never', 'value': 1},
+        ])
+        self.assertEqual(report.created, 2)
+        self.assertEqual(sorted(report.errors), [3, 4])
+        self.assertEqual(list(timeseries.values(BaseElementValue.objects.get(base_element=first))), [1.0, 2.0])
+        self.assertEqual(list(timeseries.values(BaseElementValue.objects.get(base_element=second))), [5.0])
+
+    def test_api(self):
+        upload = SimpleUploadedFile('elements.csv', b'label,value,unit,unit_separator\na,1,{},/\nb,2,{},\n,3,{},\n')
+        response = self.client.post('/api/base_element/bulk/', {'file': upload})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.json()['created'], [error['row'] for error in response.json()['errors']]), (2, [2]))
+
+        response = self.client.post('/api/base_element/bulk/', [{'label': ''}], content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/base_element/bulk/', {'file': SimpleUploadedFile('elements.xml', b'<a/>')})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,81 @@
+import numpy as np
+from django.test import TestCase
+
+from ..compiler import SpecificationCache, cache, compile_functions, compile_specification
+from ..engine import TimeGrid
+from ..exceptions import SpecificationError
+from ..models import PossibleSpecification
+
+FUNCTIONS = {'grow': 'growth', 'factor': 'scale'}
+PARAMETERS = {'rate': {'type': 'float', 'default': 0.1}, 'factor': 'float'}
+
+
+class CompilerTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def possible(self, functions=FUNCTIONS, parameters=PARAMETERS):
+        return PossibleSpecification.objects.create(specification_name='test', functions_associate=functions, functions_parameters=parameters)
+
+    def test_compiled_kernels(self):
+        compiled = compile_functions(FUNCTIONS, PARAMETERS)
+        self.assertEqual([step for step, function, kernel in compiled.steps], ['grow', 'factor'])
+        self.assertEqual(compiled.parameters['rate'].default, 0.1)
+        self.assertIsNone(compiled.parameters['factor'].default)
+        grid = TimeGrid(['2030-01-01', '2031-01-01'])
+        values = compiled(np.ones((1, 2)), grid, {'rate': np.array([[0.1]]), 'factor': np.array([[2.0]])})
+        np.testing.assert_allclose(values, [[2.0, 2.0 * 1.1 ** grid.years[1]]])
+
+    def test_invalid_functions(self):
+        for functions, parameters in (
+            ({'step': 'unknown'}, {}),
+            (['growth'], {}),
+            ({'grow': 'growth'}, {'rate': 'complex'}),
+            ({'grow': 'growth'}, {'rate': {'type': 'int', 'default': 'x'}}),
+        ):
+            with self.assertRaises(SpecificationError):
+                compile_functions(functions, parameters)
+
+    def test_same_content_compiled_once(self):
+        first, second = self.possible(), self.possible()
+        self.assertIs(compile_specification(first), compile_specification(second))
+        self.assertEqual(cache.info()['misses'], 1)
+        self.assertEqual(cache.info()['hits'], 1)
+
+    def test_saved_specification_is_recompiled(self):
+        possible = self.possible()
+        compiled = compile_specification(possible)
+        possible.functions_associate = {'grow': 'growth'}
+        possible.save()
+        recompiled = compile_specification(possible)
+        self.assertIsNot(recompiled, compiled)
+        self.assertEqual(len(recompiled.steps), 1)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        lru = SpecificationCache(2)
+        first, second, third = (self.possible({'step': function}, {}) for function in ('growth', 'linear', 'cumulative'))
+        compiled = lru.get(first)
+        lru.get(second)
+        lru.get(first)
+        lru.get(third)
+        self.assertIs(lru.get(first), compiled)
+        self.assertEqual(lru.info()['size'], 2)
+        self.assertEqual(lru.info()['misses'], 3)
+
+    def test_invalid_specification_is_rejected_by_the_api(self):
+        response = self.client.post('/api/possible_specification/', {
+            'specification_name': 'bad', 'functions_associate': {'step': 'unknown'}, 'functions_parameters': {},
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('functions_associate', response.json())
+        self.assertFalse(PossibleSpecification.objects.exists())
+
+        response = self.client.post('/api/possible_specification/', {
+            'specification_name': 'good', 'functions_associate': FUNCTIONS, 'functions_parameters': PARAMETERS,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.patch('/api/possible_specification/%s/' % response.json()['id'], {
+            'functions_parameters': {'rate': 'complex'},
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,80 @@
+import datetime
+
+import numpy as np
+from django.test import TestCase
+
+from ..compiler import compile_specification
+from ..engine import TimeGrid, build_plan, evaluate, report_positions, step_positions
+from ..models import Composition
+from .helpers import START, make_composition
+
+
+def element_rows(composition, grid):
+    """ Series of every summed element of a composition, computed one element at a time """
+    possibles = [possible for specification in composition.specification_set.order_by('pk') for possible in specification.specifications_possible.order_by('pk')]
+    specifications = [compile_specification(possible) for possible in possibles]
+    names = {name: parameter for specification in specifications for name, parameter in specification.parameters.items()}
+    elements = list(composition.base_elements.all())
+    params = {name: np.array([[parameter.default]]) for name, parameter in names.items() if parameter.default is not None}
+    params.update({element.label: np.array([[element.value]]) for element in elements if element.label in names})
+    rows = []
+    for element in elements:
+        if element.label in names:
+            continue
+        row = np.full((1, len(grid)), float(element.value))
+        for specification in specifications:
+            row = specification(row, grid, params)
+        rows.append(np.broadcast_to(row, (1, len(grid)))[0])
+    return np.array(rows), specifications, params
+
+
+def per_element(composition, grid):
+    """ Series of a composition, the sum of its elements computed one at a time """
+    rows, specifications, params = element_rows(composition, grid)
+    total = rows.sum(axis=0)[None]
+    for specification in specifications:
+        total = specification.summed(total, grid, params)
+    return total[0]
+
+
+class EngineTests(TestCase):
+
+    def setUp(self):
+        self.compositions = [
+            make_composition({'a': 100.0, 'b': 250.0, 'rate': 0.05}, {'grow': 'growth', 'total': 'cumulative'}, {'rate': {'type': 'float'}}),
+            make_composition({'a': 10.0, 'b': -4.0}, {'factor': 'scale', 'shift': 'offset'}, {'factor': {'type': 'float', 'default': 3}, 'amount': {'type': 'float', 'default': 1}}),
+            make_composition({'a': 80.0, 'escalation': 0.02}, {'tariff': 'tariff_escalation'}, {'escalation': {'type': 'float'}, 'interval': {'type': 'float', 'default': 1}}),
+            make_composition({'a': 5.0}, {'factor': 'scale'}, {'factor': {'type': 'float', 'default': 2}}),
+        ]
+        self.grid = TimeGrid.between(START, START + datetime.timedelta(days=800))
+
+    def plan(self):
+        return build_plan(Composition.objects.filter(pk__in=[composition.pk for composition in self.compositions]).order_by('pk'))
+
+    def test_evaluate_matches_per_element(self):
+        result = evaluate(self.plan(), self.grid)
+        for composition in self.compositions:
+            np.testing.assert_allclose(result.values[result.composition_ids.index(composition.pk)], per_element(composition, self.grid))
+
+    def test_reported_periods(self):
+        plan = self.plan()
+        report = report_positions(self.grid, 'MS')
+        np.testing.assert_allclose(evaluate(plan, self.grid, report=report).values, evaluate(plan, self.grid).values[:, report])
+
+    def test_leading_axis(self):
+        plan = self.plan()
+        values = np.stack([plan.values, plan.values * 2])
+        result = evaluate(plan, self.grid, values)
+        self.assertEqual(result.values.shape, (2, len(self.compositions), len(self.grid)))
+        np.testing.assert_allclose(result.values[0], evaluate(plan, self.grid).values)
+
+    def test_steps(self):
+        plan, report = self.plan(), report_positions(self.grid, 'MS')
+        steps = {tuple(group.composition_ids): group for group in plan.groups}
+        growth, offset, tariff, scale = [steps[(composition.pk,)] for composition in self.compositions]
+        self.assertEqual(step_positions(offset, self.grid, report).tolist(), [0])
+        self.assertEqual(step_positions(scale, self.grid).tolist(), [0])
+        self.assertEqual(step_positions(tariff, self.grid, report).tolist(), report.tolist())
+        self.assertEqual(len(step_positions(tariff, self.grid)), len(self.grid))
+        # cumulative reads every period up to the last reported one
+        self.assertEqual(len(step_positions(growth, self.grid, report[:3])), report[2] + 1)
@@ -0,0 +1,97 @@
+import asyncio
+import json
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import TestCase
+
+from .. import events
+from ..models import SimulationJob
+from .helpers import make_simulation
+
+
+def _events(messages):
+    """ (event name, data) of the SSE body messages sent, ': keepalive' comments as ('keepalive', None) """
+    parsed = []
+    for message in messages:
+        body = message.get('body', b'').decode()
+        if body.startswith(': keepalive'):
+            parsed.append(('keepalive', None))
+        elif body:
+            name, data = body.strip().split('\n')
+            parsed.append((name[len('event: '):], json.loads(data[len('data: '):])))
+    return parsed
+
+
+class EventStreamTests(TestCase):
+
+    def setUp(self):
+        # Events are published by the tests, not by the polling thread
+        listen = mock.patch.object(events.Hub, '_listen', lambda hub: None)
+        listen.start()
+        self.addCleanup(listen.stop)
+        self.job = SimulationJob.objects.create(simulation=make_simulation([], 10))
+
+    def stream(self, job_id, scenario, disconnect=None):
+        """ Messages sent by the handler while scenario(messages) runs """
+        messages = []
+
+        async def receive():
+            await (disconnect or asyncio.Event()).wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            messages.append(message)
+
+        async def run():
+            handler = asyncio.ensure_future(events.job_events({'type': 'http'}, receive, send, job_id))
+            while not messages and not handler.done():
+                await asyncio.sleep(0)
+            await scenario(messages)
+            await asyncio.wait_for(handler, 5)
+
+        async_to_sync(run)()
+        return messages
+
+    def test_progress_then_complete(self):
+        async def scenario(messages):
+            events.hub.publish({'job': self.job.pk, 'progress': 0.5})
+            events.hub.publish({'job': self.job.pk, 'progress': 0.5})
+            await sync_to_async(SimulationJob.objects.filter(pk=self.job.pk).update)(status='done', progress=1, result={'series': 1})
+            events.hub.publish({'job': self.job.pk, 'status': 'done', 'progress': 1})
+
+        messages = self.stream(self.job.pk, scenario)
+        self.assertEqual(messages[0]['headers'][0], (b'content-type', b'text/event-stream'))
+        self.assertEqual([(name, data['status'], data['progress']) for name, data in _events(messages[1:])], [
+            ('progress', 'pending', 0), ('progress', 'pending', 0.5), ('progress', 'done', 1), ('complete', 'done', 1),
+        ])
+        self.assertEqual(_events(messages)[-1][1]['result'], {'series': 1})
+        self.assertEqual(messages[-1], {'type': 'http.response.body', 'body': b''})
+        self.assertEqual(events.hub.watched(), [])
+
+    def test_keepalive_and_disconnect(self):
+        disconnect = asyncio.Event()
+
+        async def scenario(messages):
+            while len(messages) < 3:
+                await asyncio.sleep(0.01)
+            disconnect.set()
+
+        with mock.patch.object(events, 'KEEPALIVE', 0.01):
+            messages = self.stream(self.job.pk, scenario, disconnect)
+        self.assertEqual(_events(messages[1:3]), [('progress', {'job': self.job.pk, 'status': 'pending', 'progress': 0}), ('keepalive', None)])
+        self.assertEqual(events.hub.watched(), [])
+
+    def test_unknown_job(self):
+        async def scenario(messages):
+            pass
+
+        messages = self.stream(self.job.pk + 1, scenario)
+        self.assertEqual(messages[0]['status'], 404)
+
+    def test_router(self):
+        application = mock.AsyncMock()
+        route = events.router(application)
+        async_to_sync(route)({'type': 'http', 'path': '/api/simulation_job/1/'}, None, None)
+        application.assert_awaited_once()
+        self.assertEqual(events.PATH.match('/api/simulation_job/12/events/').group(1), '12')
@@ -0,0 +1,71 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from .. import portfolio, results
+from ..graph import run_incremental
+from ..models import BaseElement, Composition, PossibleSpecification, Specification
+from .helpers import StorageMixin, make_composition, make_simulation
+
+SCALE = ({'factor': 'scale'}, {'factor': {'type': 'float', 'default': 3}})
+
+
+def _revisions(*compositions):
+    return [Composition.objects.get(pk=composition.pk).revision for composition in compositions]
+
+
+class IncrementalTests(StorageMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.first = make_composition({'a': 2.0}, *SCALE)
+        self.second = make_composition({'b': 5.0}, *SCALE)
+        self.simulation = make_simulation([self.first, self.second], 10)
+
+    def run_stored(self):
+        result, revisions, recomputed = run_incremental(self.simulation)
+        results.write(self.simulation.pk, result, revisions)
+        return result, recomputed
+
+    def test_only_dirty_compositions_recomputed(self):
+        result, recomputed = self.run_stored()
+        self.assertEqual(recomputed, 2)
+        self.assertEqual(self.run_stored()[1], 0)
+
+        BaseElement.objects.filter(label='b').update(value=7.0)
+        self.second.base_elements.get().save()
+        result, recomputed = self.run_stored()
+        self.assertEqual(recomputed, 1)
+        self.assertEqual(list(result.values[:, 0]), [6.0, 21.0])
+
+    def test_revisions_follow_the_inputs(self):
+        before = _revisions(self.first, self.second)
+        self.first.base_elements.get().save()
+        self.assertEqual(_revisions(self.first, self.second), [before[0] + 1, before[1]])
+
+        PossibleSpecification.objects.get(specification__composition=self.second).save()
+        self.assertEqual(_revisions(self.first, self.second), [before[0] + 1, before[1] + 1])
+
+    def test_moved_specification_marks_both_compositions(self):
+        before = _revisions(self.first, self.second)
+        specification = Specification.objects.get(composition=self.first)
+        specification.composition = self.second
+        specification.save()
+        self.assertEqual(_revisions(self.first, self.second), [before[0] + 1, before[1] + 1])
+
+    def test_queryset_delete_marks_in_bulk(self):
+        before = _revisions(self.first, self.second)
+        BaseElement.objects.filter(composition__in=[self.first, self.second]).delete()
+        self.assertEqual(_revisions(self.first, self.second), [before[0] + 1, before[1] + 1])
+
+    def test_portfolio_delete_query_count(self):
+        counts = []
+        for size in (5, 50):
+            simulation = portfolio.generate('size%s' % size, compositions=size, elements_per_composition=5, specifications=2, years=1)
+            with CaptureQueriesContext(connection) as queries:
+                portfolio.delete(simulation)
+            updates = [query for query in queries.captured_queries if query['sql'].startswith('UPDATE "simulator_composition"')]
+            self.assertLessEqual(len(updates), 2)
+            counts.append(len(queries))
+        # No query per deleted row
+        self.assertLess(counts[1] - counts[0], 10)
@@ -0,0 +1,103 @@
+import datetime
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+from django.test import TestCase
+from django.utils import timezone
+
+from .. import jobs
+from ..management.commands.simulation_worker import Command
+from ..models import SimulationJob
+from .helpers import StorageMixin, make_composition, make_simulation
+
+
+def _future(exception=None):
+    future = Future()
+    if exception is None:
+        future.set_result('done')
+    else:
+        future.set_exception(exception)
+    return future
+
+
+class JobQueueTests(StorageMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.simulation = make_simulation([make_composition({'a': 2.0}, {'factor': 'scale'}, {'factor': {'type': 'float', 'default': 3}})], 10)
+
+    def test_run_then_memoized(self):
+        job = jobs.enqueue(self.simulation)
+        self.assertEqual(job.status, 'pending')
+        self.assertEqual([claimed.pk for claimed in jobs.claim('worker')], [job.pk])
+        self.assertEqual(jobs.run_job(job.pk), 'done')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result['series'], job.result['periods']), ('done', 1, 11))
+
+        cached = jobs.enqueue(self.simulation)
+        self.assertEqual(cached.status, 'done')
+        self.assertTrue(cached.result['cached'])
+
+    def test_claim_order_and_limit(self):
+        first, second, third = (jobs.enqueue(self.simulation, 'sensitivity') for index in range(3))
+        self.assertEqual([job.pk for job in jobs.claim('worker', 2)], [first.pk, second.pk])
+        self.assertEqual([job.pk for job in jobs.claim('other', 2)], [third.pk])
+        self.assertEqual(jobs.claim('other'), [])
+        self.assertEqual(SimulationJob.objects.get(pk=first.pk).worker, 'worker')
+
+    def test_cancel(self):
+        pending, running = jobs.enqueue(self.simulation, 'sensitivity'), jobs.enqueue(self.simulation, 'sensitivity')
+        jobs.claim('worker', 2)
+        SimulationJob.objects.filter(pk=pending.pk).update(status='pending')
+        self.assertEqual(jobs.cancel(pending).status, 'cancelled')
+        running = jobs.cancel(running)
+        self.assertEqual((running.status, running.cancel_requested), ('running', True))
+        self.assertEqual(jobs.run_job(running.pk), 'cancelled')
+
+    def test_engine_error_fails_the_job(self):
+        job = jobs.enqueue(self.simulation, 'scenarios', {'scenarios': 0})
+        jobs.claim('worker')
+        self.assertEqual(jobs.run_job(job.pk), 'failed')
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('scenarios', job.error)
+
+    def test_requeue(self):
+        first, second = jobs.enqueue(self.simulation, 'sensitivity'), jobs.enqueue(self.simulation, 'sensitivity')
+        jobs.claim('worker', 2)
+        self.assertEqual(jobs.requeue('worker', [first.pk]), 1)
+        self.assertEqual(SimulationJob.objects.get(pk=first.pk).status, 'pending')
+        self.assertEqual(jobs.requeue('worker'), 1)
+        self.assertEqual(SimulationJob.objects.get(pk=second.pk).status, 'pending')
+
+    def test_lost_jobs_are_reclaimed(self):
+        alive, lost = jobs.enqueue(self.simulation, 'sensitivity'), jobs.enqueue(self.simulation, 'sensitivity')
+        jobs.claim('dead', 2)
+        expired = timezone.now() - datetime.timedelta(seconds=jobs._timeout() + 1)
+        SimulationJob.objects.update(heartbeat_at=expired)
+        SimulationJob.objects.filter(pk=alive.pk).update(worker='alive')
+        self.assertEqual(jobs.heartbeat('alive'), 1)
+        self.assertEqual([job.pk for job in jobs.claim('other')], [lost.pk])
+        self.assertEqual(SimulationJob.objects.get(pk=alive.pk).worker, 'alive')
+
+    def test_worker_requeues_the_jobs_of_a_dead_process(self):
+        job = jobs.enqueue(self.simulation, 'sensitivity')
+        jobs.claim('worker')
+        with self.assertLogs('simulator.worker', 'ERROR'):
+            self.assertTrue(Command().collect(_future(BrokenProcessPool()), job.pk, 'worker'))
+        self.assertEqual(SimulationJob.objects.get(pk=job.pk).status, 'pending')
+
+    def test_worker_logs_job_errors(self):
+        with self.assertLogs('simulator.worker', 'ERROR') as logs:
+            self.assertFalse(Command().collect(_future(ValueError('boom')), 1, 'worker'))
+        self.assertIn('boom', logs.output[0])
+        self.assertFalse(Command().collect(_future(), 1, 'worker'))
+
+    def test_job_api(self):
+        response = self.client.post('/api/simulation_job/', {'simulation': self.simulation.pk, 'kind': 'scenarios', 'parameters': {'scenarios': -1}}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/simulation_job/', {'simulation': self.simulation.pk}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['status'], 'pending')
+        response = self.client.post('/api/simulation_job/%s/cancel/' % response.json()['id'])
+        self.assertEqual(response.json()['status'], 'cancelled')
@@ -0,0 +1,62 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase, TestCase
+
+from ..compiler import compile_functions
+from ..engine import Group, TimeGrid, build_plan, evaluate
+from ..exceptions import EngineError, SpecificationError
+from ..finance import kernel_irr
+from ..models import Composition
+from .helpers import START, make_composition
+from .test_engine import element_rows
+
+
+class KernelTests(SimpleTestCase):
+
+    def grid(self, periods, freq='365D'):
+        return TimeGrid(pd.date_range('2030-01-01', periods=periods, freq=freq))
+
+    def test_irr(self):
+        flows = np.array([[-1000.0, 300.0, 300.0, 300.0, 300.0]])
+        rate = kernel_irr(flows, self.grid(5), {})
+        self.assertEqual(rate.shape, flows.shape)
+        self.assertAlmostEqual(float(rate[0, 0]), 0.0772, places=4)
+        npv = (flows / (1 + rate[0, 0]) ** self.grid(5).years).sum()
+        self.assertAlmostEqual(float(npv), 0.0, places=4)
+
+    def test_irr_without_solution_is_nan(self):
+        self.assertTrue(np.isnan(kernel_irr(np.zeros((1, 5)), self.grid(5), {})).all())
+        self.assertTrue(np.isnan(kernel_irr(np.full((1, 5), 100.0), self.grid(5), {})).all())
+        self.assertTrue(np.isnan(kernel_irr(np.array([[-100.0]]), self.grid(1), {})).all())
+
+    def test_irr_rows_are_independent(self):
+        flows = np.array([[-1000.0, 300.0, 300.0, 300.0, 300.0], [0.0, 0.0, 0.0, 0.0, 0.0]])
+        rate = kernel_irr(flows, self.grid(5), {})
+        self.assertTrue(np.isfinite(rate[0]).all())
+        self.assertTrue(np.isnan(rate[1]).all())
+
+    def test_summed_step_comes_last(self):
+        with self.assertRaises(SpecificationError):
+            compile_functions({'rate': 'irr', 'factor': 'scale'}, {})
+
+    def test_summed_specification_comes_last(self):
+        summed, empty, scale = compile_functions({'rate': 'irr'}, {}), compile_functions({}, {}), compile_functions({'factor': 'scale'}, {})
+        self.assertTrue(Group([scale, empty, summed]).summed)
+        for specifications in ([summed, scale], [summed, empty, scale]):
+            with self.assertRaises(EngineError):
+                Group(specifications)
+
+
+class SummedKernelTests(TestCase):
+
+    def test_irr_of_the_composition_sum(self):
+        composition = make_composition({'a': -1000.0, 'b': -200.0}, {'flows': 'linear', 'rate': 'irr'}, {'slope': {'type': 'float', 'default': 600}})
+        grid = TimeGrid.between(START, START + datetime.timedelta(days=1500), '30D')
+        rate = evaluate(build_plan(Composition.objects.filter(pk=composition.pk)), grid).values[0]
+        rows, specifications, params = element_rows(composition, grid)
+        expected = kernel_irr(rows.sum(axis=0)[None], grid, {})[0]
+        self.assertTrue(np.isfinite(rate).all())
+        np.testing.assert_allclose(rate, expected)
+        self.assertFalse(np.allclose(rate, kernel_irr(rows, grid, {}).sum(axis=0)))
@@ -0,0 +1,94 @@
+import datetime
+from unittest import mock
+
+import numpy as np
+from django.test import TestCase, override_settings
+
+from .. import graph, jobs, lazy, results
+from ..engine import SimulationResult, TimeGrid, build_plan, evaluate
+from ..models import Composition, SimulationJob
+from .helpers import START, StorageMixin, make_composition, make_simulation
+
+
+class QueryTests(StorageMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.compositions = [
+            make_composition({'a': 100.0, 'b': 250.0, 'rate': 0.05}, {'grow': 'growth', 'total': 'cumulative'}, {'rate': {'type': 'float'}}),
+            make_composition({'a': 10.0}, {'factor': 'scale'}, {'factor': {'type': 'float', 'default': 3}}),
+            make_composition({'a': 7.0}, {'factor': 'scale'}, {'factor': {'type': 'float', 'default': 2}}),
+        ]
+        self.simulation = make_simulation(self.compositions, 100)
+        self.url = '/api/simulation/%s/query/' % self.simulation.pk
+
+    def expected(self):
+        plan = build_plan(Composition.objects.filter(pk__in=[composition.pk for composition in self.compositions]).order_by('pk'))
+        return evaluate(plan, TimeGrid.between(self.simulation.start, self.simulation.end))
+
+    def test_window_matches_a_full_run(self):
+        expected = self.expected()
+        start, end = START + datetime.timedelta(days=20), START + datetime.timedelta(days=30)
+        dates, values, unit_labels = lazy.query(self.simulation, [self.compositions[0].pk, self.compositions[2].pk], start, end)
+        self.assertEqual(len(dates), 11)
+        self.assertEqual(sorted(values), sorted('composition_%s' % composition.pk for composition in (self.compositions[0], self.compositions[2])))
+        for composition in (self.compositions[0], self.compositions[2]):
+            np.testing.assert_allclose(values['composition_%s' % composition.pk], expected.values[expected.composition_ids.index(composition.pk), 20:31])
+
+    def test_known_series_not_recomputed(self):
+        lazy.query(self.simulation, [self.compositions[1].pk])
+        with mock.patch.object(lazy, 'build_plan') as plan:
+            lazy.query(self.simulation, [self.compositions[1].pk], end=START + datetime.timedelta(days=5))
+        plan.assert_not_called()
+        self.assertEqual(lazy.cache.info()['hits'], 1)
+
+        # A new revision is computed again
+        self.compositions[1].base_elements.get().save()
+        dates, values, unit_labels = lazy.query(self.simulation, [self.compositions[1].pk])
+        self.assertEqual(lazy.cache.info()['misses'], 2)
+
+    def test_stored_run_read(self):
+        result, revisions, recomputed = graph.run_incremental(self.simulation)
+        results.write(self.simulation.pk, result, revisions)
+        with mock.patch.object(lazy, 'build_plan') as plan:
+            dates, values, unit_labels = lazy.query(self.simulation, [self.compositions[0].pk], START, START)
+        plan.assert_not_called()
+        self.assertEqual(values['composition_%s' % self.compositions[0].pk].tolist(), [result.values[0, 0]])
+
+    def test_api(self):
+        response = self.client.get(self.url, {'compositions': self.compositions[1].pk, 'date': '2030-01-03'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['series'], {'composition_%s' % self.compositions[1].pk: [30.0]})
+
+        for parameters in ({}, {'compositions': 'a,b'}, {'compositions': '999999'}, {'compositions': self.compositions[1].pk, 'start': '2030-02-01', 'end': '2030-01-10'}):
+            self.assertEqual(self.client.get(self.url, parameters).status_code, 400)
+
+    @override_settings(SIMULATOR_QUERY_MAX_COMPOSITIONS=2)
+    def test_api_limit(self):
+        ids = [str(composition.pk) for composition in self.compositions]
+        self.assertEqual(self.client.get(self.url, {'compositions': ','.join(ids[:2])}).status_code, 200)
+        response = self.client.get(self.url, {'compositions': ','.join(ids)})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('compositions', response.json())
+
+    def test_cache_is_keyed_by_end(self):
+        composition = make_composition({'a': -1000.0}, {'flows': 'linear', 'rate': 'irr'}, {'slope': {'type': 'float', 'default': 600}})
+        short, long = make_simulation([composition], 800), make_simulation([composition], 1500)
+        # irr is not causal: the periods shared by both horizons differ
+        date = START + datetime.timedelta(days=10)
+        lazy.query(short, [composition.pk])
+        dates, values, unit_labels = lazy.query(long, [composition.pk], start=date, end=date)
+        expected = evaluate(build_plan(Composition.objects.filter(pk=composition.pk)), TimeGrid.between(long.start, long.end)).values[0]
+        np.testing.assert_allclose(values[SimulationResult.series_name(composition.pk)], expected[10:11])
+
+    def test_non_finite_results_are_null(self):
+        composition = make_composition({'a': 5.0}, {'rate': 'irr'})
+        simulation = make_simulation([composition], 10)
+        response = self.client.get('/api/simulation/%s/query/' % simulation.pk, {'compositions': composition.pk, 'date': '2030-01-03'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.json()['series'].values()), [[None]])
+        job = jobs.enqueue(simulation, 'sensitivity')
+        jobs.claim('test')
+        self.assertEqual(jobs.run_job(job.pk), 'done')
+        job = SimulationJob.objects.get(pk=job.pk)
+        self.assertIsNone(job.result['outputs'][str(composition.pk)]['base'])
@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+import pandas as pd
+from django.test import TestCase
+
+from .. import jobs, memo, results
+from ..models import BaseElement
+from .helpers import StorageMixin, make_composition, make_simulation
+
+
+class MemoTests(StorageMixin, TestCase):
+
+    def write(self, value, simulation_id=1):
+        return results.write_kind(simulation_id, 'run', pd.date_range('2030-01-01', periods=3), {'a': np.full(3, value)})
+
+    def test_store_keeps_existing_entry(self):
+        first, second = self.write(1.0), self.write(2.0)
+        memo.store('key', first)
+        memo.store('key', second)
+        self.assertEqual(results.json_values(np.load(memo.lookup('key') + '/a.npy')), [1.0, 1.0, 1.0])
+
+    def test_key_follows_the_inputs(self):
+        composition = make_composition({'a': 1.0}, {'factor': 'scale'})
+        simulation, same = make_simulation([composition], 10), make_simulation([composition], 10)
+        key = memo.run_key(simulation)
+        self.assertEqual(memo.run_key(same), key)
+        self.assertNotEqual(memo.run_key(simulation, report_freq='MS'), key)
+        self.assertNotEqual(memo.run_key(make_simulation([composition], 11)), key)
+        BaseElement.objects.filter(composition=composition).update(value=2.0)
+        self.assertNotEqual(memo.run_key(simulation), key)
+
+    def test_identical_simulation_served_from_the_cache(self):
+        composition = make_composition({'a': 2.0}, {'factor': 'scale'}, {'factor': {'type': 'float', 'default': 3}})
+        first, second = make_simulation([composition], 10), make_simulation([composition], 10)
+        job = jobs.enqueue(first)
+        jobs.claim('worker')
+        jobs.run_job(job.pk)
+        cached = jobs.enqueue(second)
+        self.assertEqual((cached.status, cached.result['cached']), ('done', True))
+        self.assertEqual(results.StoredResult(second.pk).series(results.StoredResult(first.pk).series_names[0]).tolist(), [6.0] * 11)
+
+    def test_least_recently_used_evicted(self):
+        for key in ('old', 'recent'):
+            memo.store(key, self.write(1.0))
+        os.utime(memo.lookup('old'), (0, 0))
+        size = memo._size(memo._directory('recent'))
+        self.assertEqual(memo.evict(size), size)
+        self.assertIsNone(memo.lookup('old'))
+        self.assertIsNotNone(memo.lookup('recent'))
@@ -0,0 +1,91 @@
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+
+from django.test import TestCase, override_settings
+
+from .. import metrics
+from .helpers import StorageMixin, make_composition
+
+QUERIES = 'simulator_http_db_queries'
+
+
+def _dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+class MetricsTests(StorageMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.saved = metrics.registry.histograms
+        metrics.registry.histograms = {}
+
+    def tearDown(self):
+        metrics.registry.histograms = self.saved
+        super().tearDown()
+
+    def write(self, process, snapshot):
+        path = os.path.join(self.directory, '%s-%s.json' % (socket.gethostname(), process))
+        with open(path, 'w') as output:
+            json.dump(snapshot, output)
+        return path
+
+    def line(self, text, prefix):
+        return [line for line in text.splitlines() if line.startswith(prefix)]
+
+    def test_histogram_buckets(self):
+        for value in (0, 3, 5000):
+            metrics.registry.observe(QUERIES, {'view': 'v'}, value)
+        text = metrics.render()
+        self.assertEqual(self.line(text, '%s_bucket{view="v",le="0"}' % QUERIES), ['%s_bucket{view="v",le="0"} 1' % QUERIES])
+        self.assertEqual(self.line(text, '%s_bucket{view="v",le="5"}' % QUERIES), ['%s_bucket{view="v",le="5"} 2' % QUERIES])
+        self.assertEqual(self.line(text, '%s_count{view="v"}' % QUERIES), ['%s_count{view="v"} 3' % QUERIES])
+        self.assertEqual(self.line(text, '%s_sum{view="v"}' % QUERIES), ['%s_sum{view="v"} 5003.0' % QUERIES])
+
+    def test_middleware_counts_queries(self):
+        composition = make_composition({'a': 1.0}, {'factor': 'scale'})
+        response = self.client.get('/api/base_element/%s/' % composition.base_elements.get().pk, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        counts = metrics.registry.histograms[(QUERIES, (('view', 'simulator:baseelement-detail'),))]
+        self.assertEqual(sum(counts[:-1]), 1)
+        self.assertGreaterEqual(counts[-1], 1)
+
+    def test_snapshots_summed_and_dead_processes_pruned(self):
+        counts = [0] * (len(metrics.HISTOGRAMS[QUERIES][1]) + 2)
+        counts[2], counts[-1] = 1, 2
+        dead = self.write(_dead_pid(), [[QUERIES, [['view', 'v']], counts]])
+        other = os.path.join(self.directory, 'otherhost-1.json')
+        with open(other, 'w') as output:
+            json.dump([[QUERIES, [['view', 'v']], counts]], output)
+        metrics.registry.observe(QUERIES, {'view': 'v'}, 2)
+
+        with override_settings(SIMULATOR_METRICS_DIR=self.directory):
+            first = metrics.render()
+            self.assertFalse(os.path.exists(dead))
+            # Processes of other hosts cannot be checked
+            self.assertTrue(os.path.exists(other))
+            self.assertEqual(sorted(os.listdir(self.directory)), sorted([
+                '.lock', 'otherhost-1.json', '%s-%s.json' % (socket.gethostname(), os.getpid()), '%s-exited.json' % socket.gethostname(),
+            ]))
+            # The counts of the exited process are kept, once
+            self.assertEqual(metrics.render(), first)
+        self.assertEqual(self.line(first, '%s_count{view="v"}' % QUERIES), ['%s_count{view="v"} 3' % QUERIES])
+        self.assertEqual(self.line(first, '%s_sum{view="v"}' % QUERIES), ['%s_sum{view="v"} 6.0' % QUERIES])
+
+    def test_exited_snapshot_accumulates(self):
+        counts = [0] * (len(metrics.HISTOGRAMS[QUERIES][1]) + 2)
+        counts[0], counts[-1] = 1, 0
+        with override_settings(SIMULATOR_METRICS_DIR=self.directory):
+            for _ in range(2):
+                self.write(_dead_pid(), [[QUERIES, [['view', 'v']], counts]])
+                text = metrics.render()
+        self.assertEqual(self.line(text, '%s_count{view="v"}' % QUERIES), ['%s_count{view="v"} 2' % QUERIES])
@@ -0,0 +1,67 @@
+import os
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from django.test import TestCase, override_settings
+
+from .. import jobs, results
+from ..models import SimulationJob
+from .helpers import StorageMixin, make_composition, make_simulation
+
+
+class ResultStoreTests(StorageMixin, TestCase):
+
+    def write(self, value, simulation_id=1):
+        return results.write_kind(simulation_id, 'run', pd.date_range('2030-01-01', periods=3), {'a': np.full(3, value)})
+
+    def test_range_query(self):
+        self.write(1.0)
+        stored = results.StoredResult(1)
+        dates, series = stored.query('2030-01-02', '2030-01-03')
+        self.assertEqual(np.datetime_as_string(dates, 'D').tolist(), ['2030-01-02', '2030-01-03'])
+        self.assertEqual(series['a'].tolist(), [1.0, 1.0])
+        self.assertEqual(stored.bounds('2031-01-01'), slice(3, 3))
+
+    def test_replaced_result_stays_readable(self):
+        self.write(1.0)
+        opened = results.StoredResult(1)
+        self.write(2.0)
+        np.testing.assert_array_equal(opened.series('a'), [1.0, 1.0, 1.0])
+        np.testing.assert_array_equal(results.StoredResult(1).series('a'), [2.0, 2.0, 2.0])
+        results.delete(1)
+        with self.assertRaises(results.ResultNotFound):
+            results.StoredResult(1)
+        self.assertEqual(os.listdir(self.root + '/results'), [])
+
+    def test_replaced_versions_are_collected(self):
+        with override_settings(SIMULATOR_RESULTS_RETENTION=0):
+            for value in range(3):
+                self.write(float(value))
+        self.assertEqual(len(os.listdir(self.root + '/results')), 2) # the link and its version
+        self.assertEqual(results.StoredResult(1).series('a').tolist(), [2.0, 2.0, 2.0])
+
+    def test_failed_write_fails_the_job(self):
+        simulation = make_simulation([make_composition({'a': 1.0}, {'factor': 'scale'})], 10)
+        job = jobs.enqueue(simulation)
+        jobs.claim('worker')
+        with mock.patch.object(results, 'write', side_effect=OSError(28, 'No space left on device')):
+            with self.assertRaises(OSError):
+                jobs.run_job(job.pk)
+        job = SimulationJob.objects.get(pk=job.pk)
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('No space left', job.error)
+
+    def test_results_endpoint(self):
+        simulation = make_simulation([make_composition({'a': 1.0}, {'factor': 'scale'}, {'factor': {'type': 'float', 'default': 2}})], 10)
+        response = self.client.get('/api/simulation/%s/results/' % simulation.pk)
+        self.assertEqual(response.status_code, 404)
+        job = jobs.enqueue(simulation)
+        jobs.claim('worker')
+        jobs.run_job(job.pk)
+        response = self.client.get('/api/simulation/%s/results/?start=2030-01-02&end=2030-01-03' % simulation.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['dates']), 2)
+        self.assertEqual(list(response.json()['series'].values()), [[2.0, 2.0]])
+        response = self.client.get('/api/simulation/%s/results/?series=unknown' % simulation.pk)
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,75 @@
+import numpy as np
+from django.test import TestCase
+
+from .. import jobs, results, scenarios
+from ..engine import build_plan
+from ..exceptions import EngineError
+from ..models import BaseElement, Composition
+from .helpers import StorageMixin, make_composition, make_simulation
+
+SCALE = ({'factor': 'scale'}, {'factor': {'type': 'float', 'default': 3}})
+
+
+class ScenarioTests(StorageMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.uncertain = make_composition({'a': 10.0}, *SCALE)
+        self.certain = make_composition({'b': 4.0}, *SCALE)
+        self.element = self.uncertain.base_elements.get()
+        self.simulation = make_simulation([self.uncertain, self.certain], 90)
+
+    def name(self, composition, statistic):
+        return 'composition_%s_%s' % (composition.pk, statistic)
+
+    def test_validate(self):
+        self.assertEqual(scenarios.validate({})['scenarios'], 1000)
+        for parameters in ({'scenarios': 0}, {'percentiles': [101]}, {'report_freq': 'nope'}, {'distributions': 'x'},
+                           {'distributions': {'x': {'type': 'normal'}}}, {'distributions': {'1': {'type': 'cauchy'}}}):
+            with self.assertRaises(EngineError):
+                scenarios.validate(parameters)
+
+    def test_sample(self):
+        plan = build_plan(Composition.objects.filter(pk=self.uncertain.pk))
+        distributions = {self.element.pk: {'type': 'sweep', 'values': [1, 2, 3]}}
+        values = scenarios.sample(plan, distributions, 2)
+        self.assertEqual(values[:, 0].tolist(), [1, 1, 2, 2, 3, 3])
+        distributions = {self.element.pk: {'type': 'normal', 'std': 1}}
+        np.testing.assert_array_equal(scenarios.sample(plan, distributions, 5, seed=1), scenarios.sample(plan, distributions, 5, seed=1))
+        with self.assertRaises(EngineError):
+            scenarios.sample(plan, distributions, scenarios.MAX_SCENARIOS + 1)
+        with self.assertRaises(EngineError):
+            scenarios.sample(plan, {self.element.pk: {'type': 'uniform'}}, 5)
+
+    def test_distributions_in_the_unit_of_the_element(self):
+        composition = make_composition({'k': 2.0}, *SCALE, units={'k': 'kW'})
+        element = composition.base_elements.get()
+        plan = build_plan(Composition.objects.filter(pk=composition.pk))
+        values = scenarios.sample(plan, {element.pk: {'type': 'sweep', 'values': [1, 2]}}, 1)
+        self.assertEqual((values[:, 0] / plan.scales[0]).tolist(), [1, 2])
+
+    def test_statistics(self):
+        BaseElement.objects.filter(pk=self.element.pk).update(distribution={'type': 'uniform', 'low': 8, 'high': 12})
+        dates, series, count = scenarios.run_scenarios(self.simulation, {'scenarios': 2000, 'seed': 0, 'percentiles': [5, 50, 95]})
+        self.assertEqual((count, len(dates)), (2000, 4))
+        self.assertTrue(np.all(series[self.name(self.uncertain, 'min')] >= 24))
+        self.assertTrue(np.all(series[self.name(self.uncertain, 'max')] <= 36))
+        self.assertTrue(np.all(series[self.name(self.uncertain, 'p5')] <= series[self.name(self.uncertain, 'p50')]))
+        self.assertTrue(np.all(series[self.name(self.uncertain, 'p50')] <= series[self.name(self.uncertain, 'p95')]))
+        np.testing.assert_allclose(series[self.name(self.uncertain, 'mean')], 30, rtol=0.02)
+        # Compositions without uncertain input are their deterministic series
+        self.assertEqual(series[self.name(self.certain, 'p5')].tolist(), [12.0] * 4)
+        self.assertEqual(series[self.name(self.certain, 'std')].tolist(), [0.0] * 4)
+
+    def test_job(self):
+        response = self.client.post('/api/simulation_job/', {'simulation': self.simulation.pk, 'kind': 'scenarios', 'parameters': {'scenarios': 0}}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        parameters = {'scenarios': 10, 'distributions': {str(self.element.pk): {'type': 'sweep', 'start': 0, 'stop': 1, 'num': 3}}}
+        response = self.client.post('/api/simulation_job/', {'simulation': self.simulation.pk, 'kind': 'scenarios', 'parameters': parameters}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        job_id = response.json()['id']
+        jobs.claim('worker')
+        self.assertEqual(jobs.run_job(job_id), 'done')
+        self.assertEqual(self.client.get('/api/simulation_job/%s/' % job_id).json()['result']['scenarios'], 30)
+        stored = results.StoredResult(self.simulation.pk, 'scenarios')
+        self.assertEqual(stored.series(self.name(self.uncertain, 'max')).tolist(), [3.0] * 4)
@@ -0,0 +1,74 @@
+import datetime
+
+import numpy as np
+from django.test import TestCase
+
+from .. import sensitivity
+from ..engine import TimeGrid, build_plan, evaluate
+from ..exceptions import EngineError
+from .helpers import START, make_composition, make_simulation
+
+
+class SensitivityTests(TestCase):
+
+    def setUp(self):
+        self.compositions = [
+            make_composition({'a': 100.0, 'b': 250.0, 'rate': 0.05}, {'grow': 'growth', 'total': 'cumulative'}, {'rate': {'type': 'float'}}),
+            make_composition({'a': -1000.0, 'b': 200.0}, {'flows': 'linear', 'rate': 'irr'}, {'slope': {'type': 'float', 'default': 600}}),
+            make_composition({'a': 10.0, 'k': 2.0}, {'factor': 'scale'}, {'factor': {'type': 'float', 'default': 3}}, units={'k': 'kW'}),
+        ]
+        self.simulation = make_simulation(self.compositions, 400)
+
+    def brute_force(self, delta, mode, metric):
+        """ {(composition id, element id): (up, down)} with one evaluation per moved element """
+        plan = build_plan(self.simulation.compositions.order_by('pk'))
+        grid = TimeGrid.between(self.simulation.start, self.simulation.end)
+        reduce = sensitivity.METRICS[metric]
+        base = reduce(evaluate(plan, grid).values)
+        effects = {}
+        for index, element_id in enumerate(plan.element_ids):
+            moved = []
+            for perturbed in sensitivity._perturb(plan.values, plan.scales, delta, mode):
+                values = plan.values.copy()
+                values[index] = perturbed[index]
+                moved.append(reduce(evaluate(plan, grid, values).values) - base)
+            for position, composition_id in enumerate(plan.composition_ids):
+                if element_id in self.simulation.compositions.get(pk=composition_id).base_elements.values_list('pk', flat=True):
+                    effects[(composition_id, int(element_id))] = (moved[0][position], moved[1][position])
+        return base, plan, effects
+
+    def assertChange(self, reported, expected):
+        # Changes which are not finite, such as an irr without root, are reported as None
+        if not np.isfinite(expected):
+            self.assertIsNone(reported)
+        else:
+            self.assertAlmostEqual(reported, expected, places=6)
+
+    def test_validate(self):
+        self.assertEqual(sensitivity.validate({})['metric'], 'final')
+        for parameters in ({'delta': 0}, {'mode': 'other'}, {'metric': 'median'}):
+            with self.assertRaises(EngineError):
+                sensitivity.validate(parameters)
+
+    def test_matches_one_evaluation_per_element(self):
+        for delta, mode, metric in ((0.1, 'relative', 'final'), (0.5, 'absolute', 'total'), (0.2, 'relative', 'mean')):
+            result = sensitivity.run_sensitivity(self.simulation, {'delta': delta, 'mode': mode, 'metric': metric, 'top': 100})
+            base, plan, effects = self.brute_force(delta, mode, metric)
+            for composition_id in plan.composition_ids:
+                output = result['outputs'][str(composition_id)]
+                self.assertAlmostEqual(output['base'], base[plan.position[composition_id]])
+                inputs = {item['element']: item for item in output['inputs']}
+                self.assertEqual(set(inputs), {element for owner, element in effects if owner == composition_id})
+                for element_id, item in inputs.items():
+                    up, down = effects[(composition_id, element_id)]
+                    self.assertChange(item['up'], up)
+                    self.assertChange(item['down'], down)
+
+    def test_sorted_by_swing_and_limited(self):
+        key = str(self.compositions[0].pk)
+        inputs = sensitivity.run_sensitivity(self.simulation, {'outputs': [self.compositions[0].pk]})['outputs'][key]['inputs']
+        self.assertEqual(len(inputs), 3)
+        self.assertEqual([item['swing'] for item in inputs], sorted([item['swing'] for item in inputs], reverse=True))
+        result = sensitivity.run_sensitivity(self.simulation, {'top': 1, 'outputs': [self.compositions[0].pk]})
+        self.assertEqual(list(result['outputs']), [key])
+        self.assertEqual(result['outputs'][key]['inputs'], inputs[:1])
@@ -0,0 +1,50 @@
+import datetime
+from unittest import mock
+
+import numpy as np
+from django.test import TestCase
+
+from .. import sharding
+from ..engine import TimeGrid, build_plan, evaluate, report_positions
+from ..models import Composition
+from .helpers import START, make_composition
+
+
+class ShardingTests(TestCase):
+
+    def setUp(self):
+        compositions = [
+            make_composition({'a': 100.0 + index, 'b': 250.0, 'rate': 0.05}, {'grow': 'growth', 'total': 'cumulative'}, {'rate': {'type': 'float'}})
+            for index in range(6)
+        ] + [
+            make_composition({'a': -1000.0 - index}, {'flows': 'linear', 'rate': 'irr'}, {'slope': {'type': 'float', 'default': 600}})
+            for index in range(3)
+        ] + [
+            make_composition({'a': float(index), 'b': -4.0}, {'factor': 'scale', 'shift': 'offset'}, {'factor': {'type': 'float', 'default': 3}, 'amount': {'type': 'float', 'default': 1}})
+            for index in range(5)
+        ]
+        self.plan = build_plan(Composition.objects.filter(pk__in=[composition.pk for composition in compositions]).order_by('pk'))
+        self.grid = TimeGrid.between(START, START + datetime.timedelta(days=400))
+
+    def test_shards_cover_every_composition_once(self):
+        tasks = sharding.shards(self.plan, self.grid, 2)
+        self.assertGreater(len(tasks), 2)
+        covered = sorted(self.plan.groups[index].composition_ids[position] for index, begin, end in tasks for position in range(begin, end))
+        self.assertEqual(covered, sorted(self.plan.composition_ids))
+
+    def test_bit_identical(self):
+        report = report_positions(self.grid, 'MS')
+        scenarios = np.stack([self.plan.values, self.plan.values * 1.5])
+        with mock.patch.object(sharding, 'MIN_CELLS', 0):
+            for values, positions in ((None, None), (None, report), (scenarios, None)):
+                expected = evaluate(self.plan, self.grid, values, report=positions)
+                progress = mock.Mock()
+                result = sharding.evaluate_sharded(self.plan, self.grid, 2, values, progress=progress, report=positions)
+                self.assertEqual(result.composition_ids, expected.composition_ids)
+                np.testing.assert_array_equal(result.values, expected.values)
+                self.assertEqual(progress.call_args[0][0], 1.0)
+
+    def test_small_plans_stay_in_process(self):
+        with mock.patch.object(sharding.multiprocessing, 'Pool') as pool:
+            sharding.evaluate_sharded(self.plan, self.grid, 2)
+        pool.assert_not_called()
@@ -0,0 +1,41 @@
+from django.test import TestCase
+
+from .. import snapshot
+from .helpers import StorageMixin, make_composition, make_simulation
+
+
+class SnapshotTests(StorageMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.compositions = [make_composition({'a': 2.0, 'b': 1.0}, {'factor': 'scale'}, {'factor': {'type': 'float', 'default': 3}}) for _ in range(3)]
+        self.simulation = make_simulation(self.compositions, 10)
+        self.url = '/api/simulation/%s/graph/' % self.simulation.pk
+
+    def test_whole_graph(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        graph = response.json()
+        self.assertEqual(graph['simulation']['id'], self.simulation.pk)
+        self.assertEqual([composition['id'] for composition in graph['compositions']], [composition.pk for composition in self.compositions])
+        self.assertEqual(len(graph['specifications']), 3)
+        self.assertEqual(len(graph['base_elements']), 6)
+        self.assertEqual(len(graph['possible_specifications']), 3)
+
+    def test_fixed_number_of_queries(self):
+        with self.assertNumQueries(5):
+            snapshot.build(self.simulation)
+        more = make_simulation(self.compositions + [make_composition({'c': 1.0}, {'factor': 'scale'}) for _ in range(5)], 10)
+        with self.assertNumQueries(5):
+            snapshot.build(more)
+
+    def test_not_modified(self):
+        tag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], tag)
+
+        self.compositions[1].base_elements.first().save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], tag)
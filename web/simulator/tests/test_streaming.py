@@ -0,0 +1,60 @@
+import gzip
+import io
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from django.test import TestCase
+
+from .. import results, streaming
+from .helpers import StorageMixin, make_simulation
+
+PERIODS = 50
+
+
+class ResultExportTests(StorageMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.dates = pd.date_range('2030-01-01', periods=PERIODS)
+        self.series = {'a': np.arange(PERIODS, dtype=float), 'b': np.arange(PERIODS, dtype=float) / 3}
+        self.simulation = make_simulation([], PERIODS - 1)
+        results.write_kind(self.simulation.pk, 'run', self.dates, self.series)
+        self.stored = results.StoredResult(self.simulation.pk)
+        self.url = '/api/simulation/%s/export/' % self.simulation.pk
+
+    def test_csv_chunks(self):
+        with mock.patch.object(streaming, 'CELLS_PER_CHUNK', 14):
+            chunks = list(streaming.stream_results_csv(self.stored, slice(5, 40), ['b', 'a']))
+        self.assertEqual(len(chunks), 1 + 5)
+        frame = pd.read_csv(io.StringIO(''.join(chunks)), index_col='date')
+        self.assertEqual(list(frame.columns), ['b', 'a'])
+        self.assertEqual(frame.index[0], '2030-01-06T00:00:00')
+        np.testing.assert_array_equal(frame['a'].to_numpy(), self.series['a'][5:40])
+        np.testing.assert_allclose(frame['b'].to_numpy(), self.series['b'][5:40])
+
+    def test_npz(self):
+        with mock.patch.object(streaming, 'CELLS_PER_CHUNK', 7):
+            data = b''.join(streaming.stream_results_npz(self.stored, slice(0, PERIODS), ['a', 'b']))
+        archive = np.load(io.BytesIO(data))
+        self.assertEqual(sorted(archive.files), ['a', 'b', 'date'])
+        np.testing.assert_array_equal(archive['b'], self.series['b'])
+        np.testing.assert_array_equal(archive['date'], self.dates.values.astype('datetime64[s]'))
+
+    def test_gzip(self):
+        chunks = ['x' * 1000, b'y' * 1000, '']
+        self.assertEqual(gzip.decompress(b''.join(streaming.gzip_stream(chunks))), b'x' * 1000 + b'y' * 1000)
+
+    def test_api(self):
+        response = self.client.get(self.url, {'series': 'a', 'start': '2030-01-03', 'end': '2030-01-04'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(b''.join(response.streaming_content).decode(), 'date,a\n2030-01-03T00:00:00,2.0\n2030-01-04T00:00:00,3.0\n')
+
+        response = self.client.get(self.url, {'output': 'npz', 'compress': 'gzip'})
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="simulation_%s_run.npz.gz"' % self.simulation.pk)
+        archive = np.load(io.BytesIO(gzip.decompress(b''.join(response.streaming_content))))
+        np.testing.assert_array_equal(archive['a'], self.series['a'])
+
+        self.assertEqual(self.client.get(self.url, {'output': 'xlsx'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'series': 'c'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'kind': 'other'}).status_code, 400)
@@ -0,0 +1,62 @@
+import numpy as np
+from django.test import TestCase
+
+from .. import timeseries
+from ..models import BaseElement, BaseElementValue
+
+
+def _stored(**fields):
+    return BaseElementValue(**fields)
+
+
+class PackedSeriesTests(TestCase):
+
+    def test_regular_dates_not_stored(self):
+        packed = timeseries.pack([1, 2, 3], ['2030-01-03', '2030-01-01', '2030-01-02'])
+        self.assertEqual((packed['freq'], packed['length'], packed['offsets']), ('D', 3, None))
+        series = _stored(**packed)
+        self.assertEqual(timeseries.values(series).tolist(), [2.0, 3.0, 1.0])
+        self.assertEqual(np.datetime_as_string(timeseries.dates(series), 'D').tolist(), ['2030-01-01', '2030-01-02', '2030-01-03'])
+
+    def test_irregular_dates_delta_encoded(self):
+        dates = ['2030-01-01T00:00:00Z', '2030-01-05T12:00:00Z', '2030-03-01T00:00:00Z']
+        packed = timeseries.pack([1, 2, 3], dates)
+        self.assertEqual(packed['freq'], '')
+        self.assertEqual(len(packed['offsets']), 3 * timeseries.DELTAS_DTYPE.itemsize)
+        self.assertEqual(np.datetime_as_string(timeseries.dates(_stored(**packed)), 's').tolist(), [date[:-1] for date in dates])
+
+    def test_start_and_freq(self):
+        series = _stored(**timeseries.pack([5, 6], start='2030-01-01', freq='MS'))
+        self.assertEqual(np.datetime_as_string(timeseries.dates(series), 'D').tolist(), ['2030-01-01', '2030-02-01'])
+        self.assertEqual(timeseries.dates(_stored(**timeseries.pack([]))).tolist(), [])
+
+    def test_values_are_a_view(self):
+        packed = timeseries.pack(np.arange(1000.0), start='2030-01-01')
+        view = timeseries.values(_stored(**packed))
+        self.assertFalse(view.flags.owndata)
+        self.assertFalse(view.flags.writeable)
+
+    def test_invalid(self):
+        for arguments in (([1, np.nan], None, '2030-01-01'), ([[1]], None, '2030-01-01'), (['x'], None, '2030-01-01'), ([1], None, None),
+                          ([1], None, '2030-01-01', 'nope'), ([1, 2], ['2030-01-01']), ([1, 2], ['2030-01-01', '2030-01-01']),
+                          ([1], ['yesterday']), ([1, 2], ['1800-01-01', '2030-01-01'])):
+            with self.assertRaises(timeseries.SeriesError):
+                timeseries.pack(*arguments)
+
+    def test_api(self):
+        element = BaseElement.objects.create(label='a', value=1, unit={}, unit_separator='/')
+        response = self.client.post('/api/base_element_value/', {
+            'base_element': element.pk, 'values': [1, 2], 'dates': ['2030-01-01', '2030-01-08'],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        url = '/api/base_element_value/%s/' % response.json()['id']
+
+        # New values on the stored irregular dates
+        response = self.client.patch(url, {'values': [3, 4]}, content_type='application/json')
+        self.assertEqual((response.json()['values'], response.json()['length']), ([3.0, 4.0], 2))
+        self.assertEqual(len(response.json()['dates']), 2)
+
+        response = self.client.patch(url, {'values': [1], 'dates': ['2030-01-01', '2030-01-02']}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(url, {'dates': ['2030-01-01']}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
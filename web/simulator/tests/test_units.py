@@ -0,0 +1,80 @@
+import datetime
+
+import numpy as np
+from django.test import TestCase
+
+from .. import graph, results, units
+from ..engine import TimeGrid, build_plan, evaluate
+from ..exceptions import UnitError
+from ..models import Composition
+from .helpers import START, StorageMixin, make_composition, make_simulation
+
+
+def _evaluate(*compositions, days=10):
+    plan = build_plan(Composition.objects.filter(pk__in=[composition.pk for composition in compositions]).order_by('pk'))
+    return plan, evaluate(plan, TimeGrid.between(START, START + datetime.timedelta(days=days)))
+
+
+class UnitTests(StorageMixin, TestCase):
+
+    def test_parse(self):
+        self.assertEqual(units.parse({}), (None, 1.0))
+        self.assertEqual(units.parse({'0': 'kW'}), ((('W', 1),), 1e3))
+        self.assertEqual(units.parse({'0': 'k$', '1': 'MW'}, '/'), ((('$', 1), ('W', -1)), 1e-3))
+        self.assertEqual(units.label(units.parse({'0': 'k$', '1': 'MW'}, '/')[0]), '$/W')
+        with self.assertRaises(UnitError):
+            units.parse({'0': 'furlong'})
+
+    def test_values_in_base_units(self):
+        plan, result = _evaluate(make_composition({'a': 2.0, 'b': 500.0}, {'factor': 'scale'}, units={'a': 'kW', 'b': 'W'}))
+        self.assertEqual(plan.values.tolist(), [2000.0, 500.0])
+        self.assertEqual(result.values[0, 0], 2500.0)
+        self.assertEqual(result.unit_labels, {plan.composition_ids[0]: 'W'})
+
+    def test_mismatches_rejected(self):
+        composition = make_composition({'a': 2.0, 'b': 1.0}, {'factor': 'scale'}, units={'a': 'kW', 'b': '$'})
+        with self.assertRaises(UnitError):
+            _evaluate(composition)
+        composition = make_composition({'a': 2.0, 'amount': 1.0}, {'shift': 'offset'}, {'amount': {'type': 'float'}}, units={'a': 'kW', 'amount': '$'})
+        with self.assertRaises(UnitError):
+            _evaluate(composition)
+        composition = make_composition({'a': 2.0, 'rate': 1.0}, {'grow': 'growth'}, {'rate': {'type': 'float'}}, units={'a': 'kW', 'rate': 'W'})
+        with self.assertRaises(UnitError):
+            _evaluate(composition)
+
+    def test_defaults_in_the_unit_of_the_values(self):
+        compositions = [
+            make_composition({'a': 10.0}, {'shift': 'offset'}, {'amount': {'type': 'float', 'default': 1}}, units={'a': 'kW'}),
+            make_composition({'a': 10.0}, {'bound': 'clip'}, {'upper': {'type': 'float', 'default': 4}}, units={'a': 'MW'}),
+            make_composition({'a': 10.0}, {'depreciate': 'straight_line'}, {'salvage': {'type': 'float', 'default': 2}, 'life': {'type': 'float', 'default': 1}}, units={'a': 'k$'}),
+            make_composition({'a': 10.0}, {'shift': 'offset'}, {'amount': {'type': 'float', 'default': 1}}),
+            # Dimensionless parameters are not converted
+            make_composition({'a': 10.0}, {'factor': 'scale'}, {'factor': {'type': 'float', 'default': 3}}, units={'a': 'kW'}),
+        ]
+        plan, result = _evaluate(*compositions, days=800)
+        self.assertEqual(result.values[:, 0].tolist(), [11000.0, 4e6, 10000.0, 11.0, 30000.0])
+        self.assertEqual(result.values[2, -1], 2000.0)
+
+    def test_units_stored_and_returned(self):
+        kilowatts = make_composition({'a': 2.0}, {'factor': 'scale'}, units={'a': 'kW'})
+        plain = make_composition({'a': 2.0}, {'factor': 'scale'})
+        simulation = make_simulation([kilowatts, plain], 10)
+        expected = {'composition_%s' % kilowatts.pk: 'W', 'composition_%s' % plain.pk: 'unspecified'}
+        result, revisions, recomputed = graph.run_incremental(simulation)
+        results.write(simulation.pk, result, revisions)
+        self.assertEqual(self.client.get('/api/simulation/%s/results/' % simulation.pk).json()['units'], expected)
+        response = self.client.get('/api/simulation/%s/query/' % simulation.pk, {'compositions': '%s,%s' % (kilowatts.pk, plain.pk)})
+        self.assertEqual(response.json()['units'], expected)
+        # Series kept from the stored run keep their unit
+        plain.base_elements.get().save()
+        result, revisions, recomputed = graph.run_incremental(simulation)
+        self.assertEqual((recomputed, result.series_units()), (1, expected))
+
+    def test_engine_version_is_required(self):
+        simulation = make_simulation([make_composition({'a': 1.0}, {'factor': 'scale'})], 10)
+        result, revisions, recomputed = graph.run_incremental(simulation)
+        results.write(simulation.pk, result, revisions)
+        stored = results.StoredResult(simulation.pk)
+        self.assertTrue(graph.reusable(stored, result.grid))
+        stored.engine = None
+        self.assertFalse(graph.reusable(stored, result.grid))
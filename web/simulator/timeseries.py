@@ -0,0 +1,93 @@
+"""
+    Packed storage of the time series of a BaseElementValue.
+
+    A series is one row whatever its length: its values are a little endian
+    float64 array in a binary column, read back with np.frombuffer as a view
+    of the column, without copy. Dates are not stored when they are regular:
+    start, freq (a pandas offset alias, e.g. 'D' or 'MS') and length give
+    them back. Irregular dates are delta encoded as uint32 seconds between
+    consecutive dates, the first delta being 0.
+"""
+
+import numpy as np
+import pandas as pd
+
+VALUES_DTYPE = np.dtype('<f8')
+DELTAS_DTYPE = np.dtype('<u4')
+
+
+class SeriesError(ValueError):
+    pass
+
+
+def _timestamp(value):
+    moment = pd.Timestamp(value)
+    if moment.tzinfo is not None:
+        moment = moment.tz_convert('UTC').tz_localize(None)
+    return moment
+
+
+def _aware(moment):
+    return None if moment is None else moment.tz_localize('UTC').to_pydatetime()
+
+
+def pack(values, dates=None, start=None, freq=None):
+    """
+        Field values of a BaseElementValue holding values, dated either by dates
+        or by start and freq
+    """
+    try:
+        values = np.asarray(values, dtype=VALUES_DTYPE)
+    except (TypeError, ValueError):
+        raise SeriesError("Values must be numbers.")
+    if values.ndim != 1:
+        raise SeriesError("Values must be a flat list of numbers.")
+    if not np.isfinite(values).all():
+        raise SeriesError("Values must be finite numbers.")
+    if dates is None:
+        if len(values) and start is None:
+            raise SeriesError("Dates, or a start and a frequency, are required.")
+        freq = freq or 'D'
+        try:
+            pd.tseries.frequencies.to_offset(freq)
+        except ValueError:
+            raise SeriesError("Unknown frequency '%s'." % freq)
+        start = None if start is None else _timestamp(start)
+        return {'start': _aware(start), 'freq': freq, 'length': len(values), 'values': values.tobytes(), 'offsets': None}
+
+    try:
+        dates = pd.DatetimeIndex(pd.to_datetime(pd.Index(list(dates)), utc=True, format='ISO8601')).tz_localize(None)
+    except (TypeError, ValueError):
+        raise SeriesError("Dates must be ISO 8601 dates.")
+    if len(dates) != len(values):
+        raise SeriesError("%s dates for %s values." % (len(dates), len(values)))
+    order = np.argsort(dates.values, kind='stable')
+    dates, values = dates[order], values[order]
+    if not dates.is_unique:
+        raise SeriesError("Dates must be unique.")
+    if not len(dates):
+        return {'start': None, 'freq': freq or 'D', 'length': 0, 'values': b'', 'offsets': None}
+
+    regular = pd.infer_freq(dates) if len(dates) >= 3 else None
+    if regular is not None:
+        return {'start': _aware(dates[0]), 'freq': regular, 'length': len(values), 'values': values.tobytes(), 'offsets': None}
+    seconds = (dates.values - dates.values[0]).astype('timedelta64[s]').astype(np.int64)
+    deltas = np.diff(seconds, prepend=0)
+    if deltas.max() > np.iinfo(DELTAS_DTYPE).max:
+        raise SeriesError("Dates are too far apart.")
+    return {'start': _aware(dates[0]), 'freq': '', 'length': len(values), 'values': values.tobytes(), 'offsets': deltas.astype(DELTAS_DTYPE).tobytes()}
+
+
+def values(instance):
+    """ Read only float64 view of the values of a BaseElementValue """
+    return np.frombuffer(instance.values or b'', dtype=VALUES_DTYPE)
+
+
+def dates(instance):
+    """ datetime64 dates of the values of a BaseElementValue """
+    if not instance.length:
+        return np.array([], dtype='datetime64[s]')
+    start = np.datetime64(_timestamp(instance.start).to_datetime64(), 's')
+    if instance.offsets:
+        return start + np.cumsum(np.frombuffer(instance.offsets, dtype=DELTAS_DTYPE), dtype=np.int64).astype('timedelta64[s]')
+    return pd.date_range(_timestamp(instance.start), periods=instance.length, freq=instance.freq).values.astype('datetime64[s]')
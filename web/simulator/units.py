@@ -0,0 +1,95 @@
+"""
+    Dimensional analysis of compositions, run once when a Plan is built.
+
+    The unit of a BaseElement is read from BaseElement.unit, {'value1': unit,
+    'value2': unit}, and unit_separator: with '/' it is value1 per value2,
+    without it the product of the units given. Every unit symbol is a scale
+    of a base unit (kW is 1000 W), so a unit is a dimension, the exponents of
+    the base units, and a constant multiplier to the base units.
+
+    resolve() checks that the summed elements of a composition share one
+    dimension and that every kernel of its specifications accepts the
+    dimensions it is given, raising UnitError before anything is evaluated.
+    Values are then converted to base units by the Plan once, so kernels
+    never see a unit. Elements without unit are not checked.
+"""
+
+from .exceptions import UnitError
+
+# {symbol: (base unit, multiplier to the base unit)}, see Enums.UNIT
+SYMBOLS = {
+    'W': ('W', 1.0),
+    'kW': ('W', 1e3),
+    'MW': ('W', 1e6),
+    'GW': ('W', 1e9),
+    '$': ('$', 1.0),
+    'k$': ('$', 1e3),
+    'M$': ('$', 1e6),
+}
+
+DIMENSIONLESS = ()
+
+
+def multiply(first, second, power=1):
+    """ Dimension of first * second ** power """
+    exponents = dict(first)
+    for base, exponent in second:
+        exponents[base] = exponents.get(base, 0) + power * exponent
+    return tuple(sorted((base, exponent) for base, exponent in exponents.items() if exponent))
+
+
+def label(dimension):
+    """ Readable form of a dimension, e.g. $/W """
+    if dimension is None:
+        return 'unspecified'
+    numerator = '.'.join(base if exponent == 1 else '%s^%s' % (base, exponent) for base, exponent in dimension if exponent > 0)
+    denominator = '.'.join(base if exponent == -1 else '%s^%s' % (base, -exponent) for base, exponent in dimension if exponent < 0)
+    return (numerator or '1') + ('/' + denominator if denominator else '')
+
+
+def parse(unit, separator=None):
+    """
+        (dimension, multiplier) of a BaseElement unit. The dimension is None when
+        the element has no unit
+    """
+    unit = unit if isinstance(unit, dict) else {}
+    symbols = [unit[key] for key in sorted(unit) if unit[key]]
+    if not symbols:
+        return None, 1.0
+    dimension, multiplier = DIMENSIONLESS, 1.0
+    for position, symbol in enumerate(symbols):
+        if symbol not in SYMBOLS:
+            raise UnitError("Unknown unit '%s'." % symbol)
+        base, scale = SYMBOLS[symbol]
+        power = -1 if separator == '/' and position > 0 else 1
+        dimension = multiply(dimension, ((base, 1),), power)
+        multiplier *= scale ** power
+    return dimension, multiplier
+
+
+def same(dimension, other):
+    """ Dimensions match, None (no unit) matching everything """
+    return dimension is None or other is None or dimension == other
+
+
+def resolve(composition_id, specifications, summed, parameters):
+    """
+        Dimension of the output of a composition. summed is the dimensions of its summed
+        elements, parameters {parameter name: dimension} of the elements feeding parameters
+    """
+    dimension = None
+    for other in summed:
+        if not same(dimension, other):
+            raise UnitError("Composition %s sums %s with %s." % (composition_id, label(dimension), label(other)))
+        dimension = dimension if other is None else other
+
+    for specification in specifications:
+        for step, function, kernel in specification.steps:
+            rule = getattr(kernel, 'units', None)
+            if rule is None:
+                continue
+            try:
+                dimension = rule(dimension, parameters)
+            except UnitError as error:
+                raise UnitError("Composition %s, step '%s' (%s): %s" % (composition_id, step, function, error))
+    return dimension
@@ -1,5 +1,5 @@
 from django.urls import path, include
-from . import views
+from . import metrics, views
 from rest_framework import routers
 
 app_name = "simulator"
@@ -10,6 +10,8 @@ router.register(r'base_element_value', views.BaseElementValueView)
 router.register(r'possible_specification', views.PossibleSpecificationView)
 router.register(r'specification', views.SpecificationView)
 router.register(r'composition', views.CompositionView)
+router.register(r'simulation', views.SimulationView)
+router.register(r'simulation_job', views.SimulationJobView)
 
 urlpatterns = [
     path('', views.index, name='index'),
@@ -19,5 +21,6 @@ urlpatterns = [
     path("password_reset", views.password_reset_request, name="password_reset"),
     path("form/simulation", views.form_simulation, name="form_simulation"),
     path("form/elements", views.form_elements, name="form_elements"),
+    path("metrics", metrics.metrics_view, name="metrics"),
     path("api/", include(router.urls))
 ]
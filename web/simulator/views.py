@@ -1,7 +1,12 @@
+from django.conf import settings
 from django.shortcuts import render, redirect
 from .forms import NewUserForm, SimulationForm
-from .serializers import BaseElementSerializer, BaseElementValueSerializer, PossibleSpecificationSerializer, SpecificationSerializer, CompositionSerializer
-from .models import BaseElement, BaseElementValue, PossibleSpecification, Specification, Composition
+from .serializers import BaseElementSerializer, BaseElementValueSerializer, PossibleSpecificationSerializer, SpecificationSerializer, CompositionSerializer, SimulationJobSerializer, SimulationSerializer
+from .models import BaseElement, BaseElementValue, PossibleSpecification, Specification, Composition, SimulationJob, Simulation
+from . import apicache, bulk, graph, jobs, lazy, results, scenarios, sensitivity, snapshot, units
+from .engine import build_plan
+from .exceptions import EngineError
+from .streaming import StreamingExportMixin, RESULT_FORMATS, result_response
 from django.contrib.auth import login, authenticate, logout
 from django.contrib import messages
 from django.contrib.auth.forms import AuthenticationForm
@@ -11,18 +16,26 @@ from django.contrib.auth.forms import PasswordResetForm
 from django.contrib.auth.models import User
 from django.template.loader import render_to_string
 from django.db.models.query_utils import Q
-from django.utils.http import urlsafe_base64_encode
+from django.utils.http import urlsafe_base64_encode, parse_etags
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.encoding import force_bytes
 from django.contrib.auth.decorators import login_required
-from rest_framework import viewsets
+from rest_framework import viewsets, mixins
 from rest_framework import serializers
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.exceptions import NotFound, ValidationError
+import numpy as np
+import pandas as pd
 
 def form_simulation(request):
     if request.method == 'POST':
         form = SimulationForm(request.POST)
         if form.is_valid():
-            form.save()
+            simulation = form.save()
+            job = jobs.enqueue(simulation)
+            messages.success(request, "Simulation queued as job %s." % job.pk)
+            return redirect("simulator:index")
         else:
             return render(request, 'form/simulation.html', { 'form': form })
     elif request.method == 'GET':
@@ -30,13 +43,32 @@ def form_simulation(request):
         return render(request, 'form/simulation.html', { 'form': form })
 
 def form_elements(request):
-    return render(request, 'form/elements.html')
+    return render(request, 'form/elements.html', {'compiled': getattr(settings, 'SIMULATOR_COMPILED_ASSETS', False)})
+
+def _bulk_import(request, model):
+    try:
+        if 'file' in request.FILES:
+            upload = request.FILES['file']
+            records = bulk.read_records(upload, request.query_params.get('format'), upload.name)
+        elif isinstance(request.data, list):
+            records = request.data
+        else:
+            raise ValidationError("Send a list of objects or a CSV/JSON file in 'file'.")
+    except bulk.BulkImportError as error:
+        raise ValidationError(str(error))
+    report = bulk.IMPORTERS[model](records).as_dict()
+    written = report['created'] + report['updated']
+    return Response(report, status=201 if written or not report['errors'] else 400)
 
-class BaseElementView(viewsets.ModelViewSet):
+class BaseElementView(apicache.CachedResponseMixin, StreamingExportMixin, viewsets.ModelViewSet):
     serializer_class = BaseElementSerializer
     queryset = BaseElement.objects.all()
 
-class BaseElementValueView(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        return _bulk_import(request, 'base_element')
+
+class BaseElementValueView(apicache.CachedResponseMixin, StreamingExportMixin, viewsets.ModelViewSet):
     serializer_class = BaseElementValueSerializer
     queryset = BaseElementValue.objects.all()
 
@@ -46,17 +78,148 @@ class BaseElementValueView(viewsets.ModelViewSet):
             return BaseElementValue.objects.filter(base_element__pk = base_element)
         return super().get_queryset()
 
-class PossibleSpecificationView(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        return _bulk_import(request, 'base_element_value')
+
+class PossibleSpecificationView(apicache.CachedResponseMixin, StreamingExportMixin, viewsets.ModelViewSet):
     serializer_class = PossibleSpecificationSerializer
     queryset = PossibleSpecification.objects.all()
 
-class SpecificationView(viewsets.ModelViewSet):
+class SpecificationView(apicache.CachedResponseMixin, StreamingExportMixin, viewsets.ModelViewSet):
     serializer_class = SpecificationSerializer
-    queryset = Specification.objects.all()
+    queryset = Specification.objects.prefetch_related('specifications_possible')
 
-class CompositionView(viewsets.ModelViewSet):
+class CompositionView(apicache.CachedResponseMixin, StreamingExportMixin, viewsets.ModelViewSet):
     serializer_class = CompositionSerializer
-    queryset = Composition.objects.all()
+    queryset = Composition.objects.prefetch_related('base_elements')
+
+    @action(detail=True, methods=['get'])
+    def units(self, request, pk=None):
+        composition = self.get_object()
+        try:
+            plan = build_plan(Composition.objects.filter(pk=composition.pk))
+        except EngineError as error:
+            raise ValidationError(str(error))
+        return Response({'composition': composition.pk, 'unit': units.label(plan.dimensions[composition.pk])})
+
+def _query_datetime(request, name):
+    value = request.query_params.get(name, None)
+    if not value:
+        return None
+    try:
+        moment = pd.Timestamp(value)
+    except ValueError:
+        raise ValidationError({name: "Invalid date '%s'." % value})
+    if moment.tzinfo is not None:
+        moment = moment.tz_convert('UTC').tz_localize(None)
+    return moment.to_datetime64()
+
+class SimulationView(apicache.CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
+    serializer_class = SimulationSerializer
+    queryset = Simulation.objects.all()
+
+    def _stored(self, request, simulation):
+        """ StoredResult, period slice and series names selected by the kind, start, end and series parameters """
+        kind = request.query_params.get('kind', 'run')
+        if kind not in results.KINDS:
+            raise ValidationError({'kind': "Must be one of %s." % ', '.join(results.KINDS)})
+        try:
+            stored = results.StoredResult(simulation.pk, kind)
+        except results.ResultNotFound as error:
+            raise NotFound(str(error))
+        series = [name for name in request.query_params.get('series', '').split(',') if name]
+        unknown = [name for name in series if name not in stored.series_names]
+        if unknown:
+            raise ValidationError({'series': "Unknown series: %s." % ', '.join(unknown)})
+        window = stored.bounds(_query_datetime(request, 'start'), _query_datetime(request, 'end'))
+        return stored, window, series or stored.series_names
+
+    @action(detail=True, methods=['get'])
+    def results(self, request, pk=None):
+        simulation = self.get_object()
+        stored, window, series = self._stored(request, simulation)
+        return Response({
+            'simulation': simulation.pk,
+            'dates': np.datetime_as_string(stored.dates[window]).tolist(),
+            'series': {name: results.json_values(stored.series(name)[..., window]) for name in series},
+            'units': {name: stored.units.get(name) for name in series},
+        })
+
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        # ?format= is taken by the content negotiation of DRF
+        simulation = self.get_object()
+        output = request.query_params.get('output', 'csv')
+        if output not in RESULT_FORMATS:
+            raise ValidationError({'output': "Must be one of %s." % ', '.join(RESULT_FORMATS)})
+        stored, window, series = self._stored(request, simulation)
+        compress = request.query_params.get('compress', '') == 'gzip'
+        return result_response(stored, window, series, output, compress, "simulation_%s_%s" % (simulation.pk, request.query_params.get('kind', 'run')))
+
+    @action(detail=True, methods=['get'])
+    def query(self, request, pk=None):
+        simulation = self.get_object()
+        compositions = request.query_params.get('compositions', '')
+        try:
+            composition_ids = sorted({int(pk) for pk in compositions.split(',') if pk})
+        except ValueError:
+            raise ValidationError({'compositions': "Must be a comma separated list of ids."})
+        # Queries are computed in the request: whole simulations belong to the job queue
+        limit = getattr(settings, 'SIMULATOR_QUERY_MAX_COMPOSITIONS', 100)
+        if not composition_ids or len(composition_ids) > limit:
+            raise ValidationError({'compositions': "Name 1 to %s compositions, run a job to compute more of them." % limit})
+        date = _query_datetime(request, 'date')
+        start = date if date is not None else _query_datetime(request, 'start')
+        end = date if date is not None else _query_datetime(request, 'end')
+        try:
+            dates, values, unit_labels = lazy.query(simulation, composition_ids, start, end)
+        except EngineError as error:
+            raise ValidationError(str(error))
+        return Response({
+            'simulation': simulation.pk,
+            'dates': np.datetime_as_string(dates).tolist(),
+            'series': {name: results.json_values(column) for name, column in values.items()},
+            'units': unit_labels,
+        })
+
+    @action(detail=True, methods=['get'])
+    def graph(self, request, pk=None):
+        simulation = self.get_object()
+        tag = snapshot.etag(simulation)
+        if tag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=304, headers={'ETag': tag})
+        return Response(snapshot.build(simulation), headers={'ETag': tag})
+
+VALIDATORS = {
+    'run': graph.validate,
+    'scenarios': scenarios.validate,
+    'sensitivity': sensitivity.validate,
+}
+
+class SimulationJobView(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+    serializer_class = SimulationJobSerializer
+    queryset = SimulationJob.objects.all()
+
+    def get_queryset(self):
+        simulation = self.request.query_params.get('simulation', None)
+        if simulation:
+            return SimulationJob.objects.filter(simulation__pk = simulation)
+        return super().get_queryset()
+
+    def perform_create(self, serializer):
+        kind, parameters = serializer.validated_data['kind'], serializer.validated_data.get('parameters', {})
+        if kind in VALIDATORS:
+            try:
+                parameters = VALIDATORS[kind](parameters)
+            except (EngineError, TypeError, ValueError) as error:
+                raise ValidationError({'parameters': str(error)})
+        serializer.instance = jobs.enqueue(serializer.validated_data['simulation'], kind, parameters)
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        job = jobs.cancel(self.get_object())
+        return Response(self.get_serializer(job).data)
 
 
 @login_required(login_url="simulator:login")